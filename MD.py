@@ -1,30 +1,212 @@
-from lennard_jones import pairwise_calc,distance_calc
+from lennard_jones import pairwise_calc
+from neighbour import NeighbourList
 from verlet import integrator
+from vel_rescaling import thermostat
 from coulomb import pairwise_charges
+from ewald import PME
+from parallel import ParallelForces
+from tiled import TiledForces
+from profiling import Profiler, NULL_PROFILER
+from checkpoint import save_checkpoint, load_checkpoint
+from respa import RESPA
+from minimise import minimise as relax
+from schedule import Schedule
+import os
 import numpy as np
-from write import output_xyz,output_energy,output_debug
+from write import Output
 
-def run(Atoms,start,end,cell,dt,temp_bath,cutoff,path,coul=True):
+def run(Atoms,start,end,cell,dt,temp_bath,cutoff,path,coul=True,skin=0.3,boundary='reflective',
+        long_range=False,ewald_accuracy=1e-5,traj_stride=1,energy_stride=1,debug_stride=1,console_stride=1,
+        traj_format='xyz',traj_precision='float32',nworkers=1,profile=False,profile_memory=False,
+        checkpoint_stride=0,restart=None,respa_steps=1,respa_cutoff=None,analysers=(),table=None,
+        minimise=None,minimise_options=None,precision='float64',pair_memory=None,adaptive=None):
     '''
     Main MD loop.
     Args:
         Atoms (class Atoms): Array of atoms.
         start (float): Start time of simulation.
         end (float): End time of simulation.
-        cell (ndarray): Simulation cell size.
-        dt (float): Timestep.
+        cell (ndarray): Simulation cell size, or (3,3) lattice vectors for a triclinic periodic cell.
+        dt (float): Timestep (the outer timestep when respa_steps > 1). With adaptive it is the unit of
+            simulated time that the strides and the thermostat count in.
         temp_bath (float): Temperature of the thermostat.
         cutoff (float): Cutoff distance for the potential.
+        skin (float): Neighbour list skin, the list is rebuilt after an atom moves half of it.
+        boundary (str): 'reflective' walls or 'periodic' boundary conditions.
+        long_range (bool): Use particle-mesh Ewald electrostatics (periodic boundaries only).
+        ewald_accuracy (float): Target relative accuracy used to tune the Ewald parameters.
+        traj_stride (int): Steps between trajectory frames, 0 to disable.
+        energy_stride (int): Steps between energy file lines, 0 to disable.
+        debug_stride (int): Steps between debug file frames, 0 to disable.
+        console_stride (int): Steps between printed energies, 0 to disable.
+        traj_format (str): 'xyz' text trajectory or 'binary' memory-mappable trajectory (see trajectory.py).
+        traj_precision (str): 'float32' or 'float64' storage for the binary trajectory.
+        nworkers (int): Number of worker processes for the pair forces, 1 runs serially.
+        profile (bool): Time each phase of the run, print a summary table at the end and
+            save it to outdir/profile.json.
+        profile_memory (bool): Also track the peak allocation of each phase (slower).
+        checkpoint_stride (int): Steps between checkpoints written to outdir/checkpoint.npz, 0 to disable.
+        restart (str): Checkpoint file to continue from. Atoms is overwritten with the saved state
+            and the run carries on from the saved step, with the outputs cut back to where they
+            were at the checkpoint. start and dt must match the checkpointed run. A serial run
+            continues bit for bit; with nworkers > 1 the pair lists are rebuilt, so the summation
+            order (and the round-off) can differ.
+        respa_steps (int): Use the r-RESPA integrator with this many inner steps of dt/respa_steps
+            for the short-range forces, while the long-range forces are evaluated once per dt.
+            1 uses plain velocity Verlet.
+        respa_cutoff (float): Distance where the pair interaction becomes entirely long-range
+            (switched over 1 Angstrom below it), defaults to cutoff so that only the PME
+            reciprocal part and the tail of the pair potential are slow.
+        analysers (list): Streaming analysers (see analysis.py), each sampled every analyser.stride
+            steps and saved to outdir at the end of the run. Their accumulators are not checkpointed.
+        table (class PairTable): Tabulated short-range potential (see tabulated.py) used instead of
+            the Lennard-Jones formula, e.g. with a shifted-force cutoff.
+        minimise (str): Relax the starting positions with 'fire' or 'cg' (conjugate gradient, see
+            minimise.py) before the dynamics, None to start from the given positions. Skipped on restart.
+        minimise_options (dict): Keyword arguments for minimise.minimise, e.g. ftol or max_steps.
+        precision (str): 'float64', or 'float32' to form the pair vectors and evaluate the pair terms in
+            single precision, which halves the memory traffic of the pair arrays. Positions, velocities,
+            the force and energy sums and the PME mesh stay in double precision. Use
+            benchmarks/precision.py to check the energy drift of a system before relying on it.
+        pair_memory (float): Evaluate all pairs in row blocks whose temporaries take about this many
+            bytes (see tiled.py) instead of using a neighbour list, for cutoffs comparable to the cell.
+            None uses the neighbour list.
+        adaptive (class AdaptiveTimestep): Choose each timestep within the controller's bounds from the
+            velocities, accelerations and energy error, and retry steps whose energy change is above its
+            tolerance with a smaller timestep (see adaptive.py). The output, analyser and thermostat
+            strides then count multiples of dt of simulated time, and each frame is labelled with the
+            actual time at the start of its step, as with fixed steps; checkpoint_stride still counts
+            steps. None uses the fixed timestep dt.
     '''
+    if boundary not in ('reflective','periodic'):
+        raise ValueError(f'unknown boundary: {boundary}')
+    if precision not in ('float64','float32'):
+        raise ValueError(f'unknown precision: {precision}')
+    if long_range and boundary != 'periodic':
+        raise ValueError('long range electrostatics require periodic boundaries')
+    state = None
+    if table is not None and table.groups != Atoms.groups:
+        raise ValueError('the table groups must match the groups of the atoms')
+    if table is not None:
+        table.check_cutoff(cutoff)
+    if respa_steps > 1 and nworkers > 1:
+        raise ValueError('the RESPA integrator does not support parallel workers')
+    if pair_memory is not None and (nworkers > 1 or respa_steps > 1):
+        raise ValueError('tiled all-pairs evaluation does not support parallel workers or RESPA')
+    if adaptive is not None and respa_steps > 1:
+        raise ValueError('adaptive time steps do not support the RESPA integrator')
+    if restart is not None:
+        Atoms,state = load_checkpoint(restart,Atoms)
+        if state['start'] != start or state['dt'] != dt:
+            raise ValueError('start and dt must match the checkpointed run')
+        cell = state['cell']
     sigma, epsilon = pairwise_calc(Atoms)
-    for t in np.arange(start,end,dt):
-        r,r_unit = distance_calc(Atoms)
-        charges = pairwise_charges(Atoms)
+    charges = pairwise_charges(Atoms)
+    if precision == 'float32':
+        sigma,epsilon,charges = (values.astype(np.float32) for values in (sigma,epsilon,charges))
+    nlist = NeighbourList(cutoff,skin,periodic=(boundary == 'periodic'),dtype=precision)
+    if state is not None:
+        nlist.restore(state['nlist'])
+    respa = None
+    if respa_steps > 1:
+        respa = RESPA(cutoff,respa_steps,respa_cutoff,skin=skin,periodic=(boundary == 'periodic'),dtype=precision)
+        if state is not None:
+            respa.restore(state['respa'])
+    if adaptive is not None and state is not None:
+        adaptive.restore(state['adaptive'])
+    ewald = PME(cutoff,cell,accuracy=ewald_accuracy) if long_range and coul else None
+    #the pair forces come from the neighbour list unless a worker pool or the tiled all-pairs mode is used
+    pair_forces = None
+    if nworkers > 1:
+        pair_forces = ParallelForces(Atoms,sigma,epsilon,charges,cutoff,skin,periodic=(boundary == 'periodic'),
+                                     nworkers=nworkers,coul=coul,ewald=ewald,table=table,dtype=precision)
+    elif pair_memory is not None:
+        pair_forces = TiledForces(Atoms,sigma,epsilon,charges,cutoff,periodic=(boundary == 'periodic'),coul=coul,
+                                  ewald=ewald,table=table,memory=pair_memory,dtype=precision)
+    if minimise is not None and state is None:
+        Atoms,info = relax(Atoms,sigma,epsilon,charges,nlist,cell,coul=coul,boundary=boundary,ewald=ewald,table=table,
+                           parallel=pair_forces,method=minimise,**(minimise_options or {}))
+        if console_stride:
+            print(f"Minimised ({info['method']}): E = {info['energy']:.6f} eV, max force = {info['fmax']:.2e} eV/A "
+                  f"after {info['steps']} steps{'' if info['converged'] else ' (not converged: '+info['message']+')'}")
+    profiler = Profiler(memory=profile_memory) if profile or profile_memory else NULL_PROFILER
+    #fixed steps count the strides in steps, adaptive steps in multiples of dt of simulated time
+    schedule = Schedule()
+    if adaptive is not None:
+        #the checkpoint holds the time reached, the last step done started last_dt before it
+        schedule = Schedule(dt,start,resume=state['time'] - adaptive.last_dt if state is not None else None)
+    try:
+        with Output(path,append=(start != 0 or state is not None),traj_stride=traj_stride,energy_stride=energy_stride,
+                    debug_stride=debug_stride,console_stride=console_stride,
+                    traj_format=traj_format,traj_precision=traj_precision,schedule=schedule) as output:
+            #the times are always taken from the same arange, so a restarted run sees the same values
+            times = np.arange(start,end,dt)
+            first = 0
+            now = start #time reached by the adaptive steps
+            if state is not None:
+                first = state['step']
+                now = state['time']
+                output.truncate(state['sizes'])
+            if profiler is not NULL_PROFILER:
+                profiler.start()
+            step = first
+            while (now < end - 1e-9*dt) if adaptive is not None else (step < len(times)):
+                if adaptive is not None:
+                    #as with the fixed steps, each frame is labelled with the time at the start of its step
+                    t = now
+                    Atoms,h = adaptive.step(Atoms,sigma,epsilon,nlist,cell,charges,coul=coul,boundary=boundary,
+                                            ewald=ewald,parallel=pair_forces,profiler=profiler,table=table,
+                                            dt_limit=end-now)
+                    now += h
+                    if temp_bath > 0 and schedule.due('thermostat',1,step,t):
+                        with profiler.timer('thermostat'):
+                            Atoms = thermostat(Atoms,temp_bath)
+                elif respa is not None:
+                    t = times[step]
+                    Atoms = respa.step(Atoms,sigma,epsilon,charges,dt,temp_bath,cell,coul=coul,boundary=boundary,
+                                       ewald=ewald,profiler=profiler,table=table)
+                else:
+                    t = times[step]
+                    Atoms = integrator(Atoms,sigma,epsilon,nlist,dt,temp_bath,cell,charges,coul=coul,boundary=boundary,
+                                       ewald=ewald,parallel=pair_forces,profiler=profiler,table=table)
 
-        Atoms = integrator(Atoms,sigma,epsilon,r,r_unit,dt,temp_bath,cell,charges,cutoff,coul=coul)
-
-        output_xyz(path,Atoms,t,cell)
-        output_energy(path,Atoms,t)
-        output_debug(path,Atoms,t)
-
-        print(f'Time: {t} ps, Potential Energy: {Atoms.get_potential()}, Kinetic Energy: {Atoms.get_kinetic()}, Total Energy: {Atoms.get_total()}')
+                with profiler.timer('output'):
+                    output.write(Atoms,step,t,cell)
+                if analysers:
+                    with profiler.timer('analysis'):
+                        #the serial Verlet path can share the pair distances of the force step
+                        #(bonded pairs are missing from it, so the analysers search again if there are any).
+                        #Reflective walls move atoms after the forces, so the distances would be stale.
+                        serial = (respa is None and pair_forces is None and boundary == 'periodic'
+                                  and not len(Atoms.exclusions()))
+                        pairs = nlist.last + (cutoff,) if serial else None
+                        for analyser in analysers:
+                            if schedule.due(analyser,analyser.stride,step,t):
+                                analyser.sample(Atoms,t,cell,periodic=(boundary == 'periodic'),pairs=pairs)
+                if checkpoint_stride and (step+1) % checkpoint_stride == 0:
+                    with profiler.timer('checkpoint'):
+                        save_checkpoint(os.path.join(path,'outdir','checkpoint.npz'),Atoms,cell,
+                                        t if adaptive is None else now,step+1,
+                                        start=start,dt=dt,nlist=nlist,sizes=output.sizes(),respa=respa,
+                                        adaptive=adaptive)
+                step += 1
+            for analyser in analysers:
+                analyser.save(os.path.join(path,'outdir'))
+            if profiler is not NULL_PROFILER:
+                output.flush()
+                profiler.stop()
+                profiler.set('steps',step-first)
+                if adaptive is not None:
+                    profiler.set('rejected_steps',adaptive.nrejected)
+                if respa is not None:
+                    profiler.set('neighbour_rebuilds',respa.inner.nbuilds + respa.outer.nbuilds)
+                    profiler.set('fast_force_evaluations',respa.nfast)
+                    profiler.set('slow_force_evaluations',respa.nslow)
+                else:
+                    profiler.set('neighbour_rebuilds',(pair_forces or nlist).nbuilds)
+                profiler.set('bytes_written',output.bytes_written)
+                print(profiler.summary())
+                profiler.save(os.path.join(path,'outdir','profile.json'))
+    finally:
+        if pair_forces is not None:
+            pair_forces.close()
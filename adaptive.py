@@ -0,0 +1,145 @@
+#Adaptive time stepping
+#The timestep of each velocity Verlet step is chosen from the current velocities and
+#accelerations (no atom may move more than max_displacement in one step) and from the
+#energy error of the previous step. A step that changes the total energy by more than the
+#tolerance is undone and retried with a smaller timestep. run() schedules the strided actions
+#(output, analysis, thermostat) on simulated time with schedule.Schedule, so they keep their
+#spacing in time when the timestep changes.
+import numpy as np
+from profiling import NULL_PROFILER
+from vel_rescaling import kE_calc
+from verlet import force_calc, integrator
+
+STATE = ('pos','vel','accel','force','pE','kE')
+
+class AdaptiveTimestep:
+    '''
+    Timestep controller for velocity Verlet with error-based step acceptance. The velocity
+    Verlet steps are done without the thermostat, so their energy change measures the
+    integration error; run() applies the thermostat once per nominal dt of simulated time.
+    Attributes:
+        dt_min (float): Smallest timestep. A step at dt_min is accepted even above the tolerance.
+        dt_max (float): Largest timestep.
+        max_displacement (float): Largest distance (Angstrom) any atom may move in one step.
+        energy_tol (float): Largest change of the total energy per atom (eV) in one step.
+        grow (float): Largest factor by which the timestep may increase from one step to the next.
+        shrink (float): Factor applied to the timestep when a step is rejected.
+        safety (float): Safety factor of the energy-error based timestep.
+        dt (float): Timestep of the last accepted step not cut short by dt_limit, None before the first step.
+        last_dt (float): Timestep of the last accepted step.
+        naccepted (int): Number of accepted steps.
+        nrejected (int): Number of rejected (and retried) steps.
+    '''
+    def __init__(self,dt_min,dt_max,max_displacement=0.05,energy_tol=1e-4,grow=1.2,shrink=0.5,safety=0.8):
+        if not 0 < dt_min <= dt_max:
+            raise ValueError('the timestep bounds must satisfy 0 < dt_min <= dt_max')
+        self.dt_min = dt_min
+        self.dt_max = dt_max
+        self.max_displacement = max_displacement
+        self.energy_tol = energy_tol
+        self.grow = grow
+        self.shrink = shrink
+        self.safety = safety
+        self.dt = None
+        self.naccepted = 0
+        self.nrejected = 0
+        self.last_dt = 0.0
+        self._error = 0.0
+        self._started = False
+
+    def propose(self,Atoms,dt_limit=np.inf):
+        '''
+        Timestep for the next step: the largest one for which no atom moves more than
+        max_displacement (|v|*dt + |a|*dt^2/2), limited by the energy error of the last
+        step and by grow, within the bounds.
+        Args:
+            Atoms (class Atoms): Array of atoms.
+            dt_limit (float): Upper limit for this step, e.g. the time left in the run.
+        Returns:
+            dt (float): Proposed timestep.
+        '''
+        speed = np.sqrt(np.max(np.sum(Atoms.vel**2,axis=1),initial=0.0))
+        accel = np.sqrt(np.max(np.sum(Atoms.accel**2,axis=1),initial=0.0))
+        delta = self.max_displacement
+        if speed > 0 or accel > 0:
+            dt = 2*delta/(speed + np.sqrt(speed*speed + 2*accel*delta)) #positive root of accel/2*dt^2 + speed*dt = delta
+        else:
+            dt = self.dt_max
+        if self.dt is not None:
+            dt = min(dt,self.grow*self.dt)
+            if self._error > 0:
+                #the energy error of a Verlet step grows as dt^2
+                dt = min(dt,self.dt*max(self.shrink,self.safety*np.sqrt(self.energy_tol/self._error)))
+        return min(float(np.clip(dt,self.dt_min,self.dt_max)),dt_limit)
+
+    def step(self,Atoms,sigma,epsilon,nlist,cell,charges,coul=True,boundary='reflective',ewald=None,parallel=None,
+             profiler=NULL_PROFILER,table=None,dt_limit=np.inf):
+        '''
+        Advances the system by one accepted velocity Verlet step.
+        Args:
+            Atoms (class Atoms): Array of atoms.
+            sigma (ndarray (ntypes,ntypes)): Array of species pair sigma values.
+            epsilon (ndarray (ntypes,ntypes)): Array of species pair epsilon values.
+            nlist (class NeighbourList): Neighbour list holding the cutoff.
+            cell (ndarray): Simulation cell size.
+            charges (ndarray (ntypes,ntypes)): Array of species pair charges.
+            coul (bool): Include the Coulomb interaction.
+            boundary (str): 'reflective' walls or 'periodic' boundary conditions.
+            ewald (class PME): Long-range electrostatics, None for plain cutoff Coulomb.
+            parallel (class ParallelForces or TiledForces): Pair force evaluator used instead of nlist.
+            profiler (class Profiler): Collects phase timings and counters.
+            table (class PairTable): Tabulated potential used instead of the Lennard-Jones formula.
+            dt_limit (float): Upper limit for the timestep, e.g. the time left in the run.
+        Returns:
+            Atoms (class Atoms): Atoms after the step.
+            dt (float): Timestep of the accepted step.
+        '''
+        if not self._started:
+            #the energy check needs the forces and energies at the starting positions
+            force_calc(Atoms,sigma,epsilon,charges,nlist,cell,coul=coul,ewald=ewald,parallel=parallel,profiler=profiler,
+                       table=table)
+            Atoms.accel[:] = Atoms.force/Atoms.mass[:,np.newaxis]
+            kE_calc(Atoms)
+            self._started = True
+        saved = {name:getattr(Atoms,name).copy() for name in STATE}
+        virial = Atoms.virial.copy()
+        energy = Atoms.get_total()
+        dt = self.propose(Atoms,dt_limit)
+        while True:
+            Atoms = integrator(Atoms,sigma,epsilon,nlist,dt,0,cell,charges,coul,boundary=boundary,ewald=ewald,
+                               parallel=parallel,profiler=profiler,table=table)
+            error = abs(Atoms.get_total() - energy)/Atoms.natoms
+            if error <= self.energy_tol or dt <= self.dt_min:
+                break
+            with profiler.timer('update'):
+                for name,values in saved.items():
+                    getattr(Atoms,name)[:] = values
+                Atoms.virial = virial.copy()
+            self.nrejected += 1
+            dt = max(self.dt_min,self.shrink*dt)
+        if dt < dt_limit:
+            #a step cut short by dt_limit says nothing about the timestep the system allows
+            self.dt = dt
+        self.last_dt = dt
+        self._error = error
+        self.naccepted += 1
+        return Atoms,dt
+
+    def state(self):
+        '''
+        Controller state needed to continue exactly, e.g. after a restart.
+        '''
+        return {'dt':self.dt if self.dt is not None else np.nan,'last_dt':self.last_dt,'error':self._error,
+                'naccepted':self.naccepted,'nrejected':self.nrejected,'started':self._started}
+
+    def restore(self,state):
+        '''
+        Restores a state saved with state().
+        '''
+        if state:
+            self.dt = None if np.isnan(state['dt']) else float(state['dt'])
+            self.last_dt = float(state['last_dt'])
+            self._error = float(state['error'])
+            self.naccepted = int(state['naccepted'])
+            self.nrejected = int(state['nrejected'])
+            self._started = bool(state['started'])
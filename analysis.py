@@ -0,0 +1,242 @@
+#Streaming analysis during a run
+#Analysers are passed to MD.run, which calls sample() every stride steps (every stride*dt of
+#simulated time with adaptive time steps). Each one keeps fixed-size accumulators (histograms,
+#correlation windows, running moments), so nothing grows with the length of the run, and
+#writes its results to outdir at the end.
+import json
+import os
+import numpy as np
+from bc import cell_matrix, minimum_image
+from constants import kb
+from neighbour import cell_pairs
+from nonbonded import pressure
+
+class Analyser:
+    '''
+    Base class of the streaming analysers.
+    Attributes:
+        stride (int): Steps between samples.
+        nsamples (int): Number of samples taken so far.
+    '''
+    def __init__(self,stride=1):
+        self.stride = stride
+        self.nsamples = 0
+
+    def sample(self,Atoms,t,cell,periodic=False,pairs=None):
+        '''
+        Adds the current state to the accumulators.
+        Args:
+            Atoms (class Atoms): Array of atoms.
+            t (float): The current time.
+            cell (ndarray): Simulation cell size or lattice vectors.
+            periodic (bool): Whether the cell is periodic.
+            pairs (tuple): (i,j,r,cutoff) of the pairs within cutoff from the last force
+                evaluation, if available.
+        '''
+        raise NotImplementedError
+
+    def save(self,outdir):
+        '''
+        Writes the results to outdir.
+        '''
+        raise NotImplementedError
+
+class RDF(Analyser):
+    '''
+    Radial distribution function g(r), optionally between two groups of atoms.
+    Uses the pair distances of the force step when r_max is within the cutoff, and
+    searches for the pairs with the linked-cell grid otherwise.
+    Attributes:
+        r_max (float): Largest distance in the histogram.
+        nbins (int): Number of histogram bins.
+        groups (tuple): (group a, group b) to restrict the pairs to, None for all atoms.
+        counts (ndarray (nbins,)): Pair counts of each bin, summed over the samples.
+    '''
+    def __init__(self,r_max,nbins=200,groups=None,stride=1,filename='rdf.txt'):
+        super().__init__(stride)
+        self.r_max = r_max
+        self.nbins = nbins
+        self.groups = groups
+        self.filename = filename
+        self.edges = np.linspace(0.0,r_max,nbins+1)
+        self.counts = np.zeros(nbins)
+        self._density = 0.0 #sum over samples of the pair density npairs/volume
+
+    def sample(self,Atoms,t,cell,periodic=False,pairs=None):
+        if pairs is not None and pairs[3] >= self.r_max:
+            i,j,r = pairs[:3]
+        else:
+            i,j = cell_pairs(Atoms.pos,cell,self.r_max,periodic)
+            dr = Atoms.pos[i] - Atoms.pos[j]
+            if periodic:
+                dr = minimum_image(dr,cell)
+            r = np.linalg.norm(dr,axis=1)
+        if self.groups is None:
+            na = nb = Atoms.natoms
+            npairs = 0.5*na*(na-1)
+        else:
+            a,b = (Atoms.groups.index(group) if group in Atoms.groups else -1 for group in self.groups)
+            ti,tj = Atoms.types[i],Atoms.types[j]
+            keep = ((ti == a) & (tj == b)) | ((ti == b) & (tj == a))
+            r = r[keep]
+            na,nb = np.count_nonzero(Atoms.types == a),np.count_nonzero(Atoms.types == b)
+            npairs = 0.5*na*(na-1) if a == b else na*nb
+        self.counts += np.histogram(r,bins=self.edges)[0]
+        self._density += npairs/abs(np.linalg.det(cell_matrix(cell)))
+        self.nsamples += 1
+
+    def result(self):
+        '''
+        Returns:
+            r (ndarray (nbins,)): Bin centres.
+            g (ndarray (nbins,)): g(r) averaged over the samples.
+        '''
+        r = 0.5*(self.edges[1:] + self.edges[:-1])
+        shell = 4.0/3.0*np.pi*np.diff(self.edges**3)
+        g = self.counts/np.maximum(self._density*shell,1e-300)
+        return r,g
+
+    def save(self,outdir):
+        r,g = self.result()
+        np.savetxt(os.path.join(outdir,self.filename),np.column_stack([r,g]),delimiter=',',
+                   header=f'r / Angstrom,g(r) ({self.nsamples} samples)',comments='')
+
+class _Correlation(Analyser):
+    '''
+    Time correlation over a sliding window of the last nlags samples. Every sample is
+    correlated with each sample still in the window, so the averages use every time origin.
+    The products are binned by their actual lag time in bins of width dt, so samples that
+    are not evenly spaced in time (adaptive time steps) still land at the right lag.
+    '''
+    def __init__(self,nlags,stride=1,dt=None):
+        super().__init__(stride)
+        self.nlags = nlags
+        self.sums = np.zeros(nlags)
+        self.norms = np.zeros(nlags)
+        self.dt = dt or 0.0
+        self._window = None
+        self._times = np.zeros(nlags)
+        self._last_time = None
+
+    def _add(self,values,t):
+        if self._window is None:
+            self._window = np.zeros((self.nlags,)+values.shape)
+        slot = self.nsamples % self.nlags
+        self._window[slot] = values
+        self._times[slot] = t
+        previous = (slot - np.arange(min(self.nsamples+1,self.nlags))) % self.nlags
+        if self.nsamples == 1 and not self.dt:
+            #without a given bin width the interval between the first two samples is used
+            self.dt = t - self._last_time
+        self._last_time = t
+        if self.dt:
+            lags = np.rint((t - self._times[previous])/self.dt).astype(int)
+        else:
+            lags = np.zeros(len(previous),dtype=int)
+        keep = lags < self.nlags
+        np.add.at(self.sums,lags[keep],self._correlate(self._window[previous[keep]],values))
+        np.add.at(self.norms,lags[keep],1)
+        self.nsamples += 1
+
+    def result(self):
+        '''
+        Returns:
+            lag (ndarray): Lag times.
+            values (ndarray): Correlation at each lag time, NaN for lags without samples.
+        '''
+        n = np.max(np.nonzero(self.norms)[0],initial=-1) + 1
+        with np.errstate(invalid='ignore'):
+            values = np.where(self.norms[:n] > 0,self.sums[:n]/np.maximum(self.norms[:n],1),np.nan)
+        return np.arange(n)*self.dt,values
+
+class MSD(_Correlation):
+    '''
+    Mean squared displacement over lag times up to nlags*dt. With periodic
+    boundaries the positions are unwrapped, which needs the atoms to move less than
+    half the cell between samples.
+    '''
+    def __init__(self,nlags=100,stride=1,filename='msd.txt',dt=None):
+        super().__init__(nlags,stride,dt)
+        self.filename = filename
+        self._unwrapped = None
+        self._last = None
+
+    def _correlate(self,previous,values):
+        return np.mean(np.sum((values - previous)**2,axis=2),axis=1)
+
+    def sample(self,Atoms,t,cell,periodic=False,pairs=None):
+        if self._unwrapped is None:
+            self._unwrapped = Atoms.pos.copy()
+        else:
+            moved = Atoms.pos - self._last
+            self._unwrapped += minimum_image(moved,cell) if periodic else moved
+        self._last = Atoms.pos.copy()
+        self._add(self._unwrapped,t)
+
+    def save(self,outdir):
+        lag,msd = self.result()
+        np.savetxt(os.path.join(outdir,self.filename),np.column_stack([lag,msd]),delimiter=',',
+                   header='Lag / ps,MSD / Angstrom^2',comments='')
+
+class VACF(_Correlation):
+    '''
+    Velocity autocorrelation function <v(0).v(t)> over lag times up to nlags*dt,
+    also written normalised by its value at t = 0.
+    '''
+    def __init__(self,nlags=100,stride=1,filename='vacf.txt',dt=None):
+        super().__init__(nlags,stride,dt)
+        self.filename = filename
+
+    def _correlate(self,previous,values):
+        return np.mean(np.sum(previous*values,axis=2),axis=1)
+
+    def sample(self,Atoms,t,cell,periodic=False,pairs=None):
+        self._add(Atoms.vel,t)
+
+    def save(self,outdir):
+        lag,vacf = self.result()
+        norm = vacf/vacf[0] if len(vacf) and vacf[0] else vacf
+        np.savetxt(os.path.join(outdir,self.filename),np.column_stack([lag,vacf,norm]),delimiter=',',
+                   header='Lag / ps,VACF / (Angstrom/ps)^2,Normalised VACF',comments='')
+
+class EnergyStats(Analyser):
+    '''
+    Running mean, standard deviation, minimum and maximum of the potential, kinetic and
+    total energies, the temperature and the pressure (Welford's algorithm).
+    '''
+    QUANTITIES = ('potential','kinetic','total','temperature','pressure')
+
+    def __init__(self,stride=1,filename='energy_stats.json'):
+        super().__init__(stride)
+        self.filename = filename
+        n = len(self.QUANTITIES)
+        self.mean = np.zeros(n)
+        self._m2 = np.zeros(n)
+        self.min = np.full(n,np.inf)
+        self.max = np.full(n,-np.inf)
+
+    def sample(self,Atoms,t,cell,periodic=False,pairs=None):
+        potential,kinetic = Atoms.get_potential(),Atoms.get_kinetic()
+        values = np.array([potential,kinetic,potential+kinetic,2*kinetic/(3*kb*Atoms.natoms),pressure(Atoms,cell)])
+        self.nsamples += 1
+        delta = values - self.mean
+        self.mean += delta/self.nsamples
+        self._m2 += delta*(values - self.mean)
+        self.min = np.minimum(self.min,values)
+        self.max = np.maximum(self.max,values)
+
+    def result(self):
+        '''
+        Returns:
+            stats (dict): mean, std, min and max of each quantity.
+        '''
+        std = np.sqrt(self._m2/max(self.nsamples-1,1))
+        return {name:{'mean':self.mean[n],'std':std[n],'min':self.min[n],'max':self.max[n]}
+                for n,name in enumerate(self.QUANTITIES)}
+
+    def save(self,outdir):
+        with open(os.path.join(outdir,self.filename),'w') as file:
+            json.dump({'samples':self.nsamples,
+                       'units':{'potential':'eV','kinetic':'eV','total':'eV','temperature':'K',
+                                'pressure':'eV/Angstrom^3'},
+                       **self.result()},file,indent=1)
@@ -1,10 +1,15 @@
+import operator
 import numpy as np
 
 class Atom:
     '''
     Represents a single atom.
+    An Atom is a lightweight view into one row of the arrays owned by an Atoms object.
+    A freshly created Atom owns a private single row until it is appended to an Atoms.
+    Setting the charge or a species property (e.g. sigma) of one atom clears Atoms.cache,
+    so the parameter tables built from them are rebuilt on the next force evaluation.
     Attributes:
-        id (int): The ID of the atom.
+        id (int): The ID of the atom, its row number plus one (read-only).
         symbol (str): The symbol of the atom.
         mass (float): The mass of the atom.
         pos (numpy.ndarray): The position of the atom.
@@ -14,81 +19,385 @@ class Atom:
         kE (float): The kinetic energy of the atom.
         pE (float): The potential energy of the atom.
     '''
+    __slots__ = ('_atoms','_index')
+
     def __init__(self,group,pos,vel):
-        self.id = 'undefined'
-        self.group = group
-        self.symbol = 'undefined'
-        self.mass = 'undefined'
-        self.charge = 'undefined'
-        self.pos = np.array([float(i) for i in pos])
-        self.vel = np.array([float(i) for i in vel])
-        self.accel = np.array([0.0,0.0,0.0])
-        self.force = np.array([0.0,0.0,0.0])
-        self.kE = 0.0
-        self.pE = 0.0
+        #a standalone atom is stored as the only row of its own Atoms object
+        owner = Atoms()
+        owner._grow(1)
+        owner._set_row(0,group,pos,vel)
+        self._bind(owner,0)
+
+    @classmethod
+    def _view(cls,atoms,index):
+        atom = cls.__new__(cls)
+        atom._bind(atoms,index)
+        return atom
+
+    def _bind(self,atoms,index):
+        object.__setattr__(self,'_atoms',atoms)
+        object.__setattr__(self,'_index',index)
+
+    @property
+    def id(self):
+        return self._index+1
+
+    @property
+    def group(self):
+        return self._atoms.groups[self._atoms.types[self._index]]
+    @group.setter
+    def group(self,value):
+        self._atoms.types[self._index] = self._atoms._type_index(value)
+        self._atoms.cache.clear()
+
+    @property
+    def symbol(self):
+        return self._atoms.symbols[self._index]
+    @symbol.setter
+    def symbol(self,value):
+        self._atoms.symbols[self._index] = value
+
+    @property
+    def mass(self):
+        return self._atoms.mass[self._index]
+    @mass.setter
+    def mass(self,value):
+        self._atoms.mass[self._index] = value
+
+    @property
+    def charge(self):
+        return self._atoms.charges[self._index]
+    @charge.setter
+    def charge(self,value):
+        self._atoms.charges[self._index] = value
+        self._atoms.cache.clear()
+
+    @property
+    def pos(self):
+        return self._atoms.pos[self._index]
+    @pos.setter
+    def pos(self,value):
+        self._atoms.pos[self._index] = value
+
+    @property
+    def vel(self):
+        return self._atoms.vel[self._index]
+    @vel.setter
+    def vel(self,value):
+        self._atoms.vel[self._index] = value
+
+    @property
+    def accel(self):
+        return self._atoms.accel[self._index]
+    @accel.setter
+    def accel(self,value):
+        self._atoms.accel[self._index] = value
+
+    @property
+    def force(self):
+        return self._atoms.force[self._index]
+    @force.setter
+    def force(self,value):
+        self._atoms.force[self._index] = value
+
+    @property
+    def kE(self):
+        return self._atoms.kE[self._index]
+    @kE.setter
+    def kE(self,value):
+        self._atoms.kE[self._index] = value
+
+    @property
+    def pE(self):
+        return self._atoms.pE[self._index]
+    @pE.setter
+    def pE(self,value):
+        self._atoms.pE[self._index] = value
+
+    def __getattr__(self,name):
+        #extra per-atom properties set through species(), e.g. sigma and epsilon
+        properties = self._atoms.properties
+        if name in properties:
+            return properties[name][self._index]
+        raise AttributeError(f"'Atom' object has no attribute '{name}'")
+
+    def __setattr__(self,name,value):
+        if name in Atom.__slots__ or isinstance(getattr(Atom,name,None),property):
+            object.__setattr__(self,name,value)
+        else:
+            self._atoms._property(name)[self._index] = value
+            self._atoms.cache.clear()
 
     def __str__(self):
         return f'{self.id} {self.group} {self.symbol} {self.pos[0]} {self.pos[1]} {self.pos[2]}'
 
 class Atoms:
     '''
-    Represents a list of atoms
+    Represents a list of atoms.
+    The per-atom data is stored as contiguous arrays (structure of arrays), which are
+    updated in place by the integrator, force and thermostat routines.
+    Differences from the earlier list of Atom objects:
+        mass is a flat (natoms,) array rather than a (natoms,1) column, so use
+        mass[:,np.newaxis] to divide (natoms,3) arrays by it.
+        Atom.id is the row number plus one and cannot be assigned: a view has no storage of
+        its own, and the ids written to the output files always follow the row order.
     Attributes:
-        atom_list (list): A list of Atom objects.
+        atom_list (list): Atom views of the rows (read-only, built on access).
         natoms (int): The number of atoms in the collection.
-        pos (ndarray): An array of atom positions.
-        vel (ndarray): An array of atom velocities.
-        accel (ndarray): An array of atom accelerations.
-        force (ndarray): An array of atom forces.
-        mass (ndarray): An array of atom masses.
-        charges (ndarray): An array of atom charges.
-        pE (ndarray): An array of atom potential energies.
-        kE (ndarray): An array of atom kinetic energies
+        pos (ndarray (natoms,3)): An array of atom positions.
+        vel (ndarray (natoms,3)): An array of atom velocities.
+        accel (ndarray (natoms,3)): An array of atom accelerations.
+        force (ndarray (natoms,3)): An array of atom forces.
+        mass (ndarray (natoms,)): An array of atom masses.
+        charges (ndarray (natoms,)): An array of atom charges.
+        pE (ndarray (natoms,)): An array of atom potential energies.
+        kE (ndarray (natoms,)): An array of atom kinetic energies.
+        types (ndarray (natoms,)): Index of each atom's group in groups.
+        groups (list): The group labels, in order of first appearance.
+        symbols (ndarray (natoms,)): An array of atom symbols.
+        properties (dict): Additional per-atom arrays set through species(), e.g. sigma.
+        cache (dict): Per-species parameter tables, cleared whenever species() changes a group.
+        virial (ndarray (3,3)): Virial tensor from the last force evaluation.
+        bonds (ndarray (nbonds,2)): Atom indices of each harmonic bond.
+        bond_params (ndarray (nbonds,2)): Force constant k (eV/Angstrom^2) and length r0 (Angstrom) of each bond.
+        angles (ndarray (nangles,3)): Atom indices i-j-k of each harmonic angle, j is the central atom.
+        angle_params (ndarray (nangles,2)): Force constant k (eV/rad^2) and angle theta0 (rad) of each angle.
+        dihedrals (ndarray (ndihedrals,4)): Atom indices i-j-k-l of each dihedral about the j-k bond.
+        dihedral_params (ndarray (ndihedrals,3)): Barrier k (eV), multiplicity n and phase delta (rad).
     '''
     def __init__(self,atom_list=None):
         if atom_list is None:
             atom_list = [] #allows the object to be overwritten with a new list
-        self.atom_list = atom_list
-        self.natoms = len(atom_list)
+        self.natoms = 0
+        self.groups = []
+        self.properties = {}
+        self.cache = {}
+        self.virial = np.zeros((3,3))
+        self.bonds = np.zeros((0,2),dtype=int)
+        self.bond_params = np.zeros((0,2))
+        self.angles = np.zeros((0,3),dtype=int)
+        self.angle_params = np.zeros((0,2))
+        self.dihedrals = np.zeros((0,4),dtype=int)
+        self.dihedral_params = np.zeros((0,3))
+        self._buffers = {}
+        self._grow(0)
+        for atom in atom_list:
+            self.append(atom)
+
+    def _grow(self,n):
+        '''
+        Extends every per-atom array by n rows, filled with the default values.
+        The arrays are views of buffers with spare rows, which double in size when they
+        run out, so appending atoms one at a time is amortised O(1) per atom.
+        '''
+        def extend(arr,fill,key):
+            size = len(arr)+n
+            buffer = self._buffers.get(key)
+            #arrays replaced from outside (e.g. Atoms.pos = ...) are copied into a new buffer
+            if buffer is None or arr.base is not buffer or len(buffer) < size:
+                buffer = np.empty((max(size,2*len(arr)),)+arr.shape[1:],dtype=arr.dtype)
+                buffer[:len(arr)] = arr
+                self._buffers[key] = buffer
+            arr = buffer[:size]
+            arr[size-n:] = fill
+            return arr
+
+        if self.natoms == 0 and n == 0:
+            self.pos = np.zeros((0,3))
+            self.vel = np.zeros((0,3))
+            self.accel = np.zeros((0,3))
+            self.force = np.zeros((0,3))
+            self.mass = np.zeros(0)
+            self.charges = np.zeros(0)
+            self.pE = np.zeros(0)
+            self.kE = np.zeros(0)
+            self.types = np.zeros(0,dtype=int)
+            self.symbols = np.zeros(0,dtype=object)
+            return
+        self.pos = extend(self.pos,0.0,'pos')
+        self.vel = extend(self.vel,0.0,'vel')
+        self.accel = extend(self.accel,0.0,'accel')
+        self.force = extend(self.force,0.0,'force')
+        self.mass = extend(self.mass,np.nan,'mass')
+        self.charges = extend(self.charges,np.nan,'charges')
+        self.pE = extend(self.pE,0.0,'pE')
+        self.kE = extend(self.kE,0.0,'kE')
+        self.types = extend(self.types,0,'types')
+        self.symbols = extend(self.symbols,'undefined','symbols')
+        for name,arr in self.properties.items():
+            self.properties[name] = extend(arr,np.nan,'property_'+name)
+        self.natoms += n
+
+    @classmethod
+    def from_arrays(cls,pos,vel=None,groups=None,symbols=None,mass=None,charges=None):
+        '''
+        Builds an Atoms object directly from per-atom arrays, without creating an Atom per atom.
+        Args:
+            pos (ndarray (natoms,3)): Atom positions.
+            vel (ndarray (natoms,3)): Atom velocities, zero if None.
+            groups (array-like (natoms,)): Group label of each atom, all in group 0 if None.
+            symbols (array-like (natoms,)): Atom symbols, usually set later with species().
+            mass (ndarray (natoms,)): Atom masses, usually set later with species().
+            charges (ndarray (natoms,)): Atom charges, usually set later with species().
+        Returns:
+            Atoms (class Atoms): The new atoms.
+        '''
+        pos = np.asarray(pos,dtype=float).reshape(-1,3)
+        atoms = cls()
+        atoms._grow(len(pos))
+        atoms.pos[:] = pos
+        if vel is not None:
+            atoms.vel[:] = vel
+        if groups is None:
+            groups = np.zeros(len(pos),dtype=int)
+        #groups are numbered in order of first appearance, as append() does
+        labels,first,inverse = np.unique(np.asarray(groups),return_index=True,return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        atoms.groups = labels[order].tolist()
+        atoms.types[:] = rank[inverse.ravel()]
+        for name,values in (('symbols',symbols),('mass',mass),('charges',charges)):
+            if values is not None:
+                getattr(atoms,name)[:] = values
+        return atoms
 
-        self.pos = np.array([atom.pos for atom in atom_list])
-        self.vel = np.array([atom.vel for atom in atom_list])
-        self.accel = np.array([atom.accel for atom in atom_list])
-        self.force = np.array([atom.force for atom in atom_list])
-        self.mass = np.array([atom.mass for atom in atom_list])[:,np.newaxis]
-        self.charges = np.array([atom.charge for atom in atom_list])
-        self.pE = np.array([atom.pE for atom in atom_list])
-        self.kE = np.array([atom.kE for atom in atom_list])
+    def _set_row(self,index,group,pos,vel):
+        self.types[index] = self._type_index(group)
+        self.pos[index] = pos
+        self.vel[index] = vel
 
-        for ind,atom in enumerate(self.atom_list):
-            atom.id = ind+1
+    def _type_index(self,group):
+        if group not in self.groups:
+            self.groups.append(group)
+        return self.groups.index(group)
+
+    def _property(self,name):
+        if name not in self.properties:
+            self.properties[name] = np.full(self.natoms,np.nan)
+        return self.properties[name]
 
     def __str__(self):
-        return '\n'.join([str(atom) for atom in self.atom_list])
+        return '\n'.join([str(atom) for atom in self])
+
+    def __len__(self):
+        return self.natoms
 
     def __getitem__(self,index):
-        return self.atom_list[index]
+        if isinstance(index,slice):
+            return [Atom._view(self,i) for i in range(*index.indices(self.natoms))]
+        index = operator.index(index)
+        if index < 0:
+            index += self.natoms
+        if not 0 <= index < self.natoms:
+            raise IndexError('atom index out of range')
+        return Atom._view(self,index)
+
+    @property
+    def atom_list(self):
+        '''
+        List of Atom views of the rows, built on each access. Kept for backwards compatibility,
+        use append() to add atoms.
+        '''
+        return self[:]
 
     def update_arr(self):
-        self.pos = np.array([atom.pos for atom in self.atom_list])
-        self.vel = np.array([atom.vel for atom in self.atom_list])
-        self.accel = np.array([atom.accel for atom in self.atom_list])
-        self.force = np.array([atom.force for atom in self.atom_list])
-        self.mass = np.array([atom.mass for atom in self.atom_list])[:,np.newaxis]
-        self.charges = np.array([atom.charge for atom in self.atom_list])
-        self.pE = np.array([atom.pE for atom in self.atom_list])
-        self.kE = np.array([atom.kE for atom in self.atom_list])
+        '''
+        Kept for backwards compatibility. The arrays are the storage, so there is
+        nothing to rebuild.
+        '''
+        pass
 
     def append(self,atom):
-        self.atom_list.append(atom)
-        self.natoms += 1
-        atom.id = self.natoms
-        self.update_arr()
+        source,row = atom._atoms,atom._index
+        self._grow(1)
+        index = self.natoms-1
+        self._set_row(index,source.groups[source.types[row]],source.pos[row],source.vel[row])
+        self.accel[index] = source.accel[row]
+        self.force[index] = source.force[row]
+        self.mass[index] = source.mass[row]
+        self.charges[index] = source.charges[row]
+        self.pE[index] = source.pE[row]
+        self.kE[index] = source.kE[row]
+        self.symbols[index] = source.symbols[row]
+        for name,arr in source.properties.items():
+            self._property(name)[index] = arr[row]
+        #the appended atom becomes a view into this collection
+        atom._bind(self,index)
+        self.cache.clear()
+
+    def _add_terms(self,name,index,params):
+        index = np.asarray(index,dtype=int).reshape(-1,getattr(self,name).shape[1])
+        if np.any(index < 0) or np.any(index >= self.natoms):
+            raise IndexError(f'{name} atom index out of range')
+        params = np.column_stack([np.broadcast_to(np.asarray(p,dtype=float),len(index)) for p in params])
+        setattr(self,name,np.concatenate([getattr(self,name),index]))
+        setattr(self,name[:-1]+'_params',np.concatenate([getattr(self,name[:-1]+'_params'),params]))
+        self.cache.pop('exclusions',None)
+
+    def add_bonds(self,index,k,r0):
+        '''
+        Adds harmonic bonds, E = k/2*(r - r0)^2.
+        Args:
+            index (array-like (nbonds,2)): Indices (from 0) of the two atoms of each bond.
+            k (float or ndarray (nbonds,)): Force constant in eV/Angstrom^2.
+            r0 (float or ndarray (nbonds,)): Equilibrium length in Angstrom.
+        '''
+        self._add_terms('bonds',index,(k,r0))
+
+    def add_angles(self,index,k,theta0):
+        '''
+        Adds harmonic angles, E = k/2*(theta - theta0)^2.
+        Args:
+            index (array-like (nangles,3)): Indices of the atoms i-j-k of each angle, j is the central atom.
+            k (float or ndarray (nangles,)): Force constant in eV/rad^2.
+            theta0 (float or ndarray (nangles,)): Equilibrium angle in degrees.
+        '''
+        self._add_terms('angles',index,(k,np.radians(theta0)))
+
+    def add_dihedrals(self,index,k,n,delta):
+        '''
+        Adds periodic dihedrals, E = k*(1 + cos(n*phi - delta)).
+        Args:
+            index (array-like (ndihedrals,4)): Indices of the atoms i-j-k-l of each dihedral.
+            k (float or ndarray (ndihedrals,)): Barrier height in eV.
+            n (int or ndarray (ndihedrals,)): Multiplicity.
+            delta (float or ndarray (ndihedrals,)): Phase in degrees.
+        '''
+        self._add_terms('dihedrals',index,(k,n,np.radians(delta)))
+
+    def exclusions(self):
+        '''
+        Atom pairs left out of the nonbonded interactions: the 1-2 pairs of every bond and
+        the 1-3 pairs (the two outer atoms) of every angle. 1-4 pairs of dihedrals interact normally.
+        Returns:
+            keys (ndarray): Sorted unique keys i*natoms + j (i<j) of the excluded pairs, cached
+                until the topology changes.
+        '''
+        if 'exclusions' not in self.cache:
+            pairs = np.concatenate([self.bonds,self.angles[:,[0,2]]])
+            pairs = np.sort(pairs,axis=1)
+            self.cache['exclusions'] = np.unique(pairs[:,0]*self.natoms + pairs[:,1])
+        return self.cache['exclusions']
+
+    def per_type(self,values):
+        '''
+        Reduces a per-atom array to one value per group, taken from the first atom of
+        each group (species() gives every atom of a group the same value).
+        Args:
+            values (ndarray (natoms,)): Per-atom values.
+        Returns:
+            type_values (ndarray (ntypes,)): Value for each group, NaN for empty groups.
+        '''
+        type_values = np.full(len(self.groups),np.nan)
+        types,first = np.unique(self.types,return_index=True)
+        type_values[types] = values[first]
+        return type_values
 
     def get_potential(self):
-        return np.sum([atom.pE for atom in self.atom_list])
+        return np.sum(self.pE)
     def get_kinetic(self):
-        return np.sum([atom.kE for atom in self.atom_list])
+        return np.sum(self.kE)
     def get_total(self):
         return self.get_kinetic() + self.get_potential()
 
@@ -105,15 +414,16 @@ def species(Atoms,group,symbol,mass,charge,**kwargs):
     Returns:
         Atoms (class Atoms): Atoms with the updated group.
     '''
-    for atom in Atoms:
-        if atom.group == group:
-            atom.symbol = symbol
-            atom.mass = mass
-            atom.charge = charge
-            for property,value in kwargs.items():
-                setattr(atom,property,value)
-    Atoms.update_arr()
+    if group not in Atoms.groups:
+        return Atoms
+    mask = Atoms.types == Atoms.groups.index(group)
+    Atoms.symbols[mask] = symbol
+    Atoms.mass[mask] = mass
+    Atoms.charges[mask] = charge
+    for property,value in kwargs.items():
+        Atoms._property(property)[mask] = value
+    #parameter tables depend on the species properties
+    Atoms.cache.clear()
 
     return Atoms
 
-
@@ -1,5 +1,4 @@
 import numpy as np
-from atoms import Atoms, Atom
 #boundary conditions: reflect off cell walls
 #causes atoms to get stuck in corners/edges of the cell
 def bc(Atoms,cell):
@@ -11,20 +10,92 @@ def bc(Atoms,cell):
     Returns:
     - Atoms (class Atoms): The atomic positions after applying BC.
     '''
-    for atom in Atoms:
-        #mask is True if atom is outside the cell
-        #use mask instead of atom.pos < 0 in np.where to prevent error with
-        #updating position before updating velocity
-        mask = atom.pos < 0
-        #if mask is True (i.e. outside cell), velocity is reversed if travelling 'out'
-        atom.vel = np.where(mask, abs(atom.vel), atom.vel)
-        atom.pos = np.where(mask, cell - abs(atom.pos % cell), atom.pos)
+    #mask is True if atom is outside the cell
+    #use mask instead of Atoms.pos < 0 in np.where to prevent error with
+    #updating position before updating velocity
+    mask = Atoms.pos < 0
+    #if mask is True (i.e. outside cell), velocity is reversed if travelling 'out'
+    Atoms.vel[:] = np.where(mask, abs(Atoms.vel), Atoms.vel)
+    Atoms.pos[:] = np.where(mask, cell - abs(Atoms.pos % cell), Atoms.pos)
 
-        #mask is True if atom is outside the cell
-        mask = atom.pos > cell
-        #invert the direction if travelling outside the cell
-        atom.vel = np.where(mask, -abs(atom.vel), atom.vel)
-        atom.pos = np.where(mask, cell - (atom.pos % cell), atom.pos)
+    #mask is True if atom is outside the cell
+    mask = Atoms.pos > cell
+    #invert the direction if travelling outside the cell
+    Atoms.vel[:] = np.where(mask, -abs(Atoms.vel), Atoms.vel)
+    Atoms.pos[:] = np.where(mask, cell - (Atoms.pos % cell), Atoms.pos)
 
-    Atoms.update_arr()
-    return Atoms
\ No newline at end of file
+    return Atoms
+
+#periodic boundary conditions: atoms leaving the cell re-enter on the opposite side
+#the cell is either a vector of box lengths (orthorhombic) or a (3,3) matrix whose
+#rows are the lattice vectors (triclinic)
+def cell_matrix(cell):
+    '''
+    Converts the simulation cell to a (3,3) matrix of lattice vectors (rows).
+    Parameters:
+    - cell (numpy ndarray (3,) or (3,3)): Simulation cell size or lattice vectors
+    Returns:
+    - h (numpy ndarray (3,3)): Lattice vectors
+    '''
+    cell = np.asarray(cell,dtype=float)
+    if cell.ndim == 1:
+        return np.diag(cell)
+    return cell
+
+def cell_widths(cell):
+    '''
+    Perpendicular distance between opposite faces of the cell.
+    Parameters:
+    - cell (numpy ndarray (3,) or (3,3)): Simulation cell size or lattice vectors
+    Returns:
+    - widths (numpy ndarray (3,)): Width of the cell along each lattice vector
+    '''
+    h = cell_matrix(cell)
+    volume = abs(np.linalg.det(h))
+    return volume/np.linalg.norm(np.cross(h[[1,2,0]],h[[2,0,1]]),axis=1)
+
+def to_fractional(pos,cell):
+    '''
+    Converts cartesian positions to fractional coordinates of the cell.
+    Parameters:
+    - pos (numpy ndarray (n,3)): Cartesian positions
+    - cell (numpy ndarray (3,) or (3,3)): Simulation cell size or lattice vectors
+    Returns:
+    - frac (numpy ndarray (n,3)): Fractional coordinates
+    '''
+    cell = np.asarray(cell,dtype=float)
+    if cell.ndim == 1:
+        return pos/cell
+    return pos @ np.linalg.inv(cell)
+
+def minimum_image(dr,cell):
+    '''
+    Applies the minimum image convention to displacement vectors.
+    Parameters:
+    - dr (numpy ndarray (n,3)): Displacement vectors
+    - cell (numpy ndarray (3,) or (3,3)): Simulation cell size or lattice vectors
+    Returns:
+    - dr (numpy ndarray (n,3)): Displacements to the nearest periodic image, in the precision of the input
+    '''
+    cell = np.asarray(cell,dtype=dr.dtype if dr.dtype == np.float32 else float)
+    if cell.ndim == 1:
+        return dr - cell*np.round(dr/cell)
+    frac = to_fractional(dr,cell)
+    return (frac - np.round(frac)) @ cell
+
+def pbc(Atoms,cell):
+    '''
+    Implements periodic boundary conditions by wrapping the positions back into the cell.
+    Parameters:
+    - Atoms (class Atoms): Input system
+    - cell (numpy ndarray (3,) or (3,3)): Simulation cell size or lattice vectors
+    Returns:
+    - Atoms (class Atoms): The atomic positions after applying PBC.
+    '''
+    cell = np.asarray(cell,dtype=float)
+    if cell.ndim == 1:
+        Atoms.pos %= cell
+    else:
+        frac = to_fractional(Atoms.pos,cell)
+        Atoms.pos[:] = (frac % 1.0) @ cell
+    return Atoms
@@ -0,0 +1,127 @@
+#Validation of the single precision pair path against double precision
+#Runs the same system with both precision policies from identical starting conditions and
+#compares the force error, the energy drift and fluctuation, and the speed and memory of
+#the force evaluation.
+#Usage (from the repository root):
+#  python -m benchmarks.precision --natoms 2048 --steps 2000 --dt 0.002 --out precision.json
+import argparse
+import copy
+import json
+import sys
+import time
+import numpy as np
+from coulomb import pairwise_charges
+from ewald import PME
+from lennard_jones import pairwise_calc
+from neighbour import NeighbourList
+from verlet import force_calc, integrator
+from benchmarks.run import peak_memory, time_call
+from benchmarks.systems import lj_fluid, charged_mixture
+
+PRECISIONS = ('float64','float32')
+
+def setup(atoms,cell,cutoff,precision,charged):
+    sigma,epsilon = pairwise_calc(atoms)
+    charges = pairwise_charges(atoms)
+    if precision == 'float32':
+        sigma,epsilon,charges = (values.astype(np.float32) for values in (sigma,epsilon,charges))
+    nlist = NeighbourList(cutoff,skin=0.3,periodic=True,dtype=precision)
+    ewald = PME(cutoff,cell) if charged else None
+    return sigma,epsilon,charges,nlist,ewald
+
+def drift(times,energy,natoms):
+    '''
+    Slope of a straight line fitted to the total energy, per atom (eV/atom/ps), and the
+    RMS deviation from the line (eV/atom).
+    '''
+    slope,intercept = np.polyfit(times,energy,1)
+    rms = np.sqrt(np.mean((energy - (slope*times + intercept))**2))
+    return slope/natoms,rms/natoms
+
+def validate(name,atoms,cell,cutoff,charged,steps,dt,min_time):
+    '''
+    Runs the system with each precision policy.
+    Returns:
+        result (dict): Per-precision drift, fluctuation, force call time and peak memory, and the
+            force and position differences of float32 from float64.
+    '''
+    result = {'system':name,'natoms':atoms.natoms,'steps':steps,'dt':dt,'precisions':{}}
+    forces = {}
+    final = {}
+    for precision in PRECISIONS:
+        system = copy.deepcopy(atoms)
+        sigma,epsilon,charges,nlist,ewald = setup(system,cell,cutoff,precision,charged)
+        args = (system,sigma,epsilon,charges,nlist,cell)
+        force_calc(*args,coul=charged,ewald=ewald)
+        forces[precision] = system.force.copy()
+        seconds,_ = time_call(lambda: force_calc(*args,coul=charged,ewald=ewald),min_time=min_time)
+        peak = peak_memory(lambda: force_calc(*args,coul=charged,ewald=ewald))
+        system.accel[:] = system.force/system.mass[:,np.newaxis]
+        energy = np.empty(steps)
+        start = time.perf_counter()
+        for step in range(steps):
+            integrator(system,sigma,epsilon,nlist,dt,0,cell,charges,coul=charged,boundary='periodic',ewald=ewald)
+            energy[step] = system.get_total()
+        elapsed = time.perf_counter() - start
+        slope,rms = drift(dt*np.arange(1,steps+1),energy,system.natoms)
+        final[precision] = system.pos.copy()
+        result['precisions'][precision] = {'drift':float(slope),'fluctuation':float(rms),'force_seconds':seconds,
+                                           'step_seconds':elapsed/steps,'force_peak_bytes':peak,
+                                           'energy_change':float(energy[-1] - energy[0])/system.natoms}
+    scale = np.max(np.abs(forces['float64']))
+    result['force_error'] = float(np.max(np.abs(forces['float32'] - forces['float64']))/scale)
+    dr = final['float32'] - final['float64']
+    dr -= cell*np.round(dr/cell)
+    result['position_rms_difference'] = float(np.sqrt(np.mean(np.sum(dr*dr,axis=1))))
+    return result
+
+def check(result,factor,floor):
+    '''
+    The single precision run passes if its drift is at most factor times the double precision
+    drift, or below the floor (eV/atom/ps) for systems that barely drift at all.
+    '''
+    double = abs(result['precisions']['float64']['drift'])
+    single = abs(result['precisions']['float32']['drift'])
+    return bool(single <= max(factor*double,floor))
+
+def report(results):
+    print(f'{"system":<28}{"precision":<11}{"drift eV/atom/ps":>18}{"fluct eV/atom":>15}{"force ms":>10}'
+          f'{"step ms":>9}{"peak MB":>9}')
+    for entry in results:
+        for precision,values in entry['precisions'].items():
+            print(f'{entry["system"]:<28}{precision:<11}{values["drift"]:18.3e}{values["fluctuation"]:15.3e}'
+                  f'{1e3*values["force_seconds"]:10.3f}{1e3*values["step_seconds"]:9.3f}'
+                  f'{values["force_peak_bytes"]/2**20:9.2f}')
+        print(f'{"":<28}relative force error {entry["force_error"]:.2e}, '
+              f'rms position difference {entry["position_rms_difference"]:.2e} A, '
+              f'{"PASS" if entry["passed"] else "FAIL"}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the energy drift of float32 and float64 pair precision.')
+    parser.add_argument('--natoms',type=int,nargs='+',default=[2048])
+    parser.add_argument('--cutoff',type=float,default=8.0)
+    parser.add_argument('--steps',type=int,default=2000)
+    parser.add_argument('--dt',type=float,default=0.002)
+    parser.add_argument('--min-time',type=float,default=0.2,help='minimum seconds timed for the force call')
+    parser.add_argument('--factor',type=float,default=2.0,help='allowed ratio of float32 to float64 drift')
+    parser.add_argument('--floor',type=float,default=1e-5,help='drift (eV/atom/ps) that always passes')
+    parser.add_argument('--out',default='precision_results.json',help='JSON file for the results')
+    args = parser.parse_args(argv)
+
+    results = []
+    for natoms in args.natoms:
+        for name,build,charged in (('lj_fluid',lj_fluid,False),('charged_mixture',charged_mixture,True)):
+            atoms,cell = build(natoms)
+            if args.cutoff > 0.5*cell.min():
+                print(f'skipping {name}_{natoms}: the cutoff is more than half the cell width')
+                continue
+            entry = validate(f'{name}_{natoms}',atoms,cell,args.cutoff,charged,args.steps,args.dt,args.min_time)
+            entry['passed'] = check(entry,args.factor,args.floor)
+            results.append(entry)
+    report(results)
+    with open(args.out,'w') as file:
+        json.dump({'numpy':np.__version__,'results':results},file,indent=1)
+    return 0 if all(entry['passed'] for entry in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
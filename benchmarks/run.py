@@ -0,0 +1,177 @@
+#Benchmark driver: times each phase of a step separately for a range of system sizes
+#Usage (from the repository root):
+#  python -m benchmarks.run --sizes 32 1000 10000 --out results.json --baseline baseline.json
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from bc import bc, pbc
+from coulomb import pairwise_charges
+from ewald import PME
+from lennard_jones import pairwise_calc, distance_calc
+from neighbour import NeighbourList, cell_pairs
+from nonbonded import nonbonded_calc
+from tiled import TiledForces
+from vel_rescaling import thermostat
+from verlet import integrator
+from write import Output
+from benchmarks.systems import lj_fluid, charged_mixture
+
+DENSE_LIMIT = 5000 #distance_calc is O(natoms^2) in memory (and the tiled path in time), skip them above this size
+
+def time_call(fn,min_time=0.2,max_repeat=1000):
+    '''
+    Average wall time of fn(), repeating it until min_time has passed.
+    Returns:
+        seconds (float): Time per call.
+        repeats (int): Number of calls timed.
+    '''
+    fn() #warm up caches and lazily built tables
+    repeats = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time and repeats < max_repeat:
+        fn()
+        repeats += 1
+        elapsed = time.perf_counter() - start
+    return elapsed/repeats,repeats
+
+def peak_memory(fn):
+    '''
+    Peak memory allocated (bytes) during one call of fn(), as seen by tracemalloc.
+    '''
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    _,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def phases(atoms,cell,cutoff,periodic,charged,outdir):
+    '''
+    Builds the callables to benchmark for one system. Each callable does one step of work.
+    '''
+    sigma,epsilon = pairwise_calc(atoms)
+    charges = pairwise_charges(atoms)
+    boundary = 'periodic' if periodic else 'reflective'
+    nlist = NeighbourList(cutoff,skin=0.3,periodic=periodic)
+    nlist.pairs(atoms,cell)
+    ewald = PME(cutoff,cell) if periodic and charged else None
+    output = Output(outdir,traj_stride=1,energy_stride=1,debug_stride=0,console_stride=0)
+    binary = Output(outdir+'/binary',traj_stride=1,energy_stride=0,debug_stride=0,console_stride=0,traj_format='binary')
+
+    def pairs():
+        return nlist.pairs(atoms,cell)
+    i,j,r,dr = pairs()
+
+    out = {}
+    if atoms.natoms <= DENSE_LIMIT:
+        out['distance_calc'] = lambda: distance_calc(atoms,cutoff)
+        tiled = TiledForces(atoms,sigma,epsilon,charges,cutoff,periodic=periodic,coul=charged,ewald=ewald)
+        out['tiled_all_pairs'] = lambda: tiled.compute(atoms,cell)
+    out['neighbour_build'] = lambda: cell_pairs(atoms.pos,cell,cutoff+0.3,periodic)
+    out['neighbour_pairs'] = pairs
+    out['lj_kernel'] = lambda: nonbonded_calc(atoms,sigma,epsilon,charges,i,j,r,dr,coul=False)
+    if charged:
+        out['lj_coulomb_kernel'] = lambda: nonbonded_calc(atoms,sigma,epsilon,charges,i,j,r,dr,coul=True,ewald=ewald)
+    if ewald is not None:
+        out['pme_reciprocal'] = lambda: ewald.reciprocal(atoms,cell)
+    out['integrator'] = lambda: integrator(atoms,sigma,epsilon,nlist,1e-4,0,cell,charges,coul=charged,
+                                           boundary=boundary,ewald=ewald)
+    out['thermostat'] = lambda: thermostat(atoms,300.0)
+    out['boundary'] = (lambda: pbc(atoms,cell)) if periodic else (lambda: bc(atoms,cell))
+    step = iter(range(10**9))
+    out['output_xyz'] = lambda: output.write(atoms,next(step),0.0,cell)
+    out['output_binary'] = lambda: binary.write(atoms,next(step),0.0,cell)
+    return out,(output,binary),len(i)
+
+def bench_system(name,atoms,cell,cutoff,periodic,charged,min_time):
+    '''
+    Times every phase for one system.
+    Returns:
+        result (dict): Per-phase seconds per step, atom-steps/s and peak memory.
+    '''
+    result = {'system':name,'natoms':atoms.natoms,'cutoff':cutoff,'periodic':periodic,'phases':{}}
+    with tempfile.TemporaryDirectory() as outdir:
+        calls,outputs,npairs = phases(atoms,cell,cutoff,periodic,charged,outdir)
+        result['npairs'] = npairs
+        for phase,fn in calls.items():
+            seconds,repeats = time_call(fn,min_time=min_time)
+            result['phases'][phase] = {'seconds':seconds,'repeats':repeats,
+                                       'atom_steps_per_s':atoms.natoms/seconds,
+                                       'peak_bytes':peak_memory(fn)}
+        for output in outputs:
+            output.close()
+    return result
+
+def systems(sizes,cutoffs):
+    for natoms in sizes:
+        for cutoff in cutoffs:
+            atoms,cell = lj_fluid(natoms)
+            periodic = bool(cutoff <= 0.5*cell.min())
+            yield f'lj_fluid_{natoms}_rc{cutoff}',atoms,cell,cutoff,periodic,False
+            atoms,cell = charged_mixture(natoms)
+            periodic = bool(cutoff <= 0.5*cell.min())
+            yield f'charged_mixture_{natoms}_rc{cutoff}',atoms,cell,cutoff,periodic,True
+
+def compare(results,baseline,threshold):
+    '''
+    Compares per-phase times with a baseline run.
+    Returns:
+        regressions (list): (system, phase, ratio) for phases slower than threshold times the baseline.
+    '''
+    reference = {entry['system']:entry['phases'] for entry in baseline['results']}
+    regressions = []
+    for entry in results['results']:
+        old = reference.get(entry['system'])
+        if old is None:
+            continue
+        for phase,timing in entry['phases'].items():
+            if phase in old:
+                ratio = timing['seconds']/old[phase]['seconds']
+                timing['baseline_ratio'] = ratio
+                if ratio > threshold:
+                    regressions.append((entry['system'],phase,ratio))
+    return regressions
+
+def report(results):
+    print(f'{"system":<32}{"phase":<20}{"ms/step":>12}{"atom-steps/s":>16}{"peak MB":>10}{"vs base":>9}')
+    for entry in results['results']:
+        for phase,timing in entry['phases'].items():
+            ratio = timing.get('baseline_ratio')
+            ratio = f'{ratio:8.2f}x' if ratio is not None else ''
+            print(f'{entry["system"]:<32}{phase:<20}{1e3*timing["seconds"]:12.3f}'
+                  f'{timing["atom_steps_per_s"]:16.3e}{timing["peak_bytes"]/2**20:10.2f}{ratio:>9}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the MD step phases.')
+    parser.add_argument('--sizes',type=int,nargs='+',default=[32,256,2048,16384])
+    parser.add_argument('--cutoffs',type=float,nargs='+',default=[8.0])
+    parser.add_argument('--min-time',type=float,default=0.2,help='minimum seconds timed per phase')
+    parser.add_argument('--out',default='benchmark_results.json',help='JSON file for the results')
+    parser.add_argument('--baseline',help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold',type=float,default=1.2,help='slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    results = {'python':sys.version.split()[0],'numpy':np.__version__,'machine':platform.machine(),
+               'processor':platform.processor(),'results':[]}
+    for name,atoms,cell,cutoff,periodic,charged in systems(args.sizes,args.cutoffs):
+        results['results'].append(bench_system(name,atoms,cell,cutoff,periodic,charged,args.min_time))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results,json.load(file),args.threshold)
+    report(results)
+    with open(args.out,'w') as file:
+        json.dump(results,file,indent=1)
+    for system,phase,ratio in regressions:
+        print(f'REGRESSION: {system} {phase} is {ratio:.2f}x slower than the baseline')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
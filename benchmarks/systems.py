@@ -0,0 +1,51 @@
+#Reproducible benchmark systems
+import numpy as np
+from atoms import Atoms, species
+
+def _lattice(natoms,density,rng,jitter):
+    n = int(np.ceil(natoms**(1/3)))
+    spacing = density**(-1/3)
+    pos = np.array(list(np.ndindex(n,n,n)),dtype=float)[:natoms]*spacing + 0.5*spacing
+    pos += rng.uniform(-jitter,jitter,pos.shape)*spacing
+    cell = np.full(3,n*spacing)
+    return pos,cell
+
+def lj_fluid(natoms,density=0.021,temperature=0.1,seed=0):
+    '''
+    Argon-like Lennard-Jones system on a slightly perturbed simple cubic lattice.
+    Args:
+        natoms (int): Number of atoms.
+        density (float): Number density (atoms/Angstrom^3), 0.021 is liquid argon.
+        temperature (float): Standard deviation of the random velocities.
+        seed (int): Random seed.
+    Returns:
+        atoms (class Atoms): The system.
+        cell (ndarray (3,)): Cubic cell holding the lattice.
+    '''
+    rng = np.random.default_rng(seed)
+    pos,cell = _lattice(natoms,density,rng,0.05)
+    atoms = Atoms.from_arrays(pos,rng.normal(0,temperature,pos.shape),['Ar']*natoms)
+    species(atoms,'Ar','Ar',39.948,0.0,sigma=3.405,epsilon=0.0104)
+    return atoms,cell
+
+def charged_mixture(natoms,density=0.03,temperature=0.1,seed=0):
+    '''
+    Neutral mixture of +1/-1 ions randomly placed on a perturbed simple cubic lattice.
+    Args:
+        natoms (int): Number of atoms (rounded down to an even number).
+        density (float): Number density (atoms/Angstrom^3).
+        temperature (float): Standard deviation of the random velocities.
+        seed (int): Random seed.
+    Returns:
+        atoms (class Atoms): The system.
+        cell (ndarray (3,)): Cubic cell holding the lattice.
+    '''
+    natoms -= natoms % 2
+    rng = np.random.default_rng(seed)
+    pos,cell = _lattice(natoms,density,rng,0.05)
+    groups = np.array(['Na','Cl']*(natoms//2))
+    rng.shuffle(groups)
+    atoms = Atoms.from_arrays(pos,rng.normal(0,temperature,pos.shape),groups)
+    species(atoms,'Na','Na',22.99,1.0,sigma=2.35,epsilon=0.0056)
+    species(atoms,'Cl','Cl',35.45,-1.0,sigma=4.4,epsilon=0.0043)
+    return atoms,cell
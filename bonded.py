@@ -0,0 +1,140 @@
+#Bonded interactions: harmonic bonds and angles, periodic dihedrals
+#The topology is stored on Atoms as integer index arrays (Atoms.bonds, angles and dihedrals),
+#so each kind of term is evaluated for all terms at once by gathering the positions of their
+#atoms, and the forces are scattered back onto the atoms with bincount. The cost is linear in
+#the number of terms. The bonded 1-2 and 1-3 pairs are excluded from the pair interactions
+#when the neighbour list is built (see Atoms.exclusions).
+import numpy as np
+from bc import minimum_image
+from constants import k
+from ewald import erfc
+from neighbour import scatter
+from nonbonded import accumulate
+
+def has_topology(Atoms):
+    return len(Atoms.bonds) > 0 or len(Atoms.angles) > 0 or len(Atoms.dihedrals) > 0
+
+def _vector(Atoms,a,b,cell,periodic):
+    #vector from atom b to atom a
+    dr = Atoms.pos[a] - Atoms.pos[b]
+    return minimum_image(dr,cell) if periodic else dr
+
+def bond_terms(Atoms,cell,periodic=False):
+    '''
+    Harmonic bonds, E = k/2*(r - r0)^2.
+    Returns:
+        energy (ndarray (nbonds,)): Energy of each bond.
+        forces (ndarray (nbonds,2,3)): Force on each atom of each bond.
+        rel (ndarray (nbonds,2,3)): Position of each atom relative to the first atom of its bond.
+    '''
+    i,j = Atoms.bonds.T
+    kb,r0 = Atoms.bond_params.T
+    dr = _vector(Atoms,i,j,cell,periodic)
+    r = np.linalg.norm(dr,axis=1)
+    energy = 0.5*kb*(r - r0)**2
+    f = (-kb*(r - r0)/r)[:,np.newaxis]*dr #force on atom i
+    return energy,np.stack([f,-f],axis=1),np.stack([np.zeros_like(dr),-dr],axis=1)
+
+def angle_terms(Atoms,cell,periodic=False):
+    '''
+    Harmonic angles, E = k/2*(theta - theta0)^2, with theta the angle i-j-k at atom j.
+    Returns: as for bond_terms, with positions relative to the central atom.
+    '''
+    i,j,l = Atoms.angles.T
+    ka,theta0 = Atoms.angle_params.T
+    a = _vector(Atoms,i,j,cell,periodic)
+    b = _vector(Atoms,l,j,cell,periodic)
+    ra = np.linalg.norm(a,axis=1)
+    rb = np.linalg.norm(b,axis=1)
+    ua,ub = a/ra[:,np.newaxis],b/rb[:,np.newaxis]
+    cos = np.clip(np.sum(ua*ub,axis=1),-1.0,1.0)
+    theta = np.arccos(cos)
+    #a straight angle has no defined bending direction, the guard gives it zero force instead of NaN
+    sin = np.maximum(np.sqrt(1.0 - cos*cos),1e-12)
+    dE = ka*(theta - theta0) #dE/dtheta
+    energy = 0.5*dE*(theta - theta0)
+    fi = (dE/(ra*sin))[:,np.newaxis]*(ub - cos[:,np.newaxis]*ua)
+    fk = (dE/(rb*sin))[:,np.newaxis]*(ua - cos[:,np.newaxis]*ub)
+    forces = np.stack([fi,-fi-fk,fk],axis=1)
+    return energy,forces,np.stack([a,np.zeros_like(a),b],axis=1)
+
+def dihedral_terms(Atoms,cell,periodic=False):
+    '''
+    Periodic dihedrals, E = k*(1 + cos(n*phi - delta)), with phi the angle between the
+    i-j-k and j-k-l planes (IUPAC sign convention).
+    Returns: as for bond_terms.
+    '''
+    i,j,l,m = Atoms.dihedrals.T
+    kd,n,delta = Atoms.dihedral_params.T
+    b1 = _vector(Atoms,j,i,cell,periodic)
+    b2 = _vector(Atoms,l,j,cell,periodic)
+    b3 = _vector(Atoms,m,l,cell,periodic)
+    c1 = np.cross(b1,b2)
+    c2 = np.cross(b2,b3)
+    b2_sq = np.sum(b2*b2,axis=1)
+    b2_len = np.sqrt(b2_sq)
+    phi = np.arctan2(b2_len*np.sum(b1*c2,axis=1),np.sum(c1*c2,axis=1))
+    energy = kd*(1.0 + np.cos(n*phi - delta))
+    dE = -kd*n*np.sin(n*phi - delta) #dE/dphi
+    #Bekker's form: the outer atoms move along the plane normals, the inner atoms balance the force and torque
+    fi = (dE*b2_len/np.sum(c1*c1,axis=1))[:,np.newaxis]*c1
+    fl = (-dE*b2_len/np.sum(c2*c2,axis=1))[:,np.newaxis]*c2
+    p = (np.sum(b1*b2,axis=1)/b2_sq)[:,np.newaxis]
+    q = (np.sum(b3*b2,axis=1)/b2_sq)[:,np.newaxis]
+    forces = np.stack([fi,q*fl - (1.0 + p)*fi,p*fi - (1.0 + q)*fl,fl],axis=1)
+    rel = np.stack([np.zeros_like(b1),b1,b1+b2,b1+b2+b3],axis=1)
+    return energy,forces,rel
+
+def _scatter_terms(Atoms,index,energy,forces,rel):
+    #each atom of a term gets an equal share of its energy
+    n = index.shape[1]
+    total = scatter(index.ravel(),forces.reshape(-1,3),Atoms.natoms)
+    energies = scatter(index.ravel(),np.repeat(energy/n,n),Atoms.natoms)
+    virial = np.einsum('tai,taj->ij',rel,forces)
+    return total,energies,virial
+
+def bonded_calc(Atoms,cell,periodic=False):
+    '''
+    Calculate the forces, energies and virial of all bonds, angles and dihedrals.
+    Args:
+        Atoms (class Atoms): Array of atoms.
+        cell (ndarray): Simulation cell size.
+        periodic (bool): Use the minimum image convention for the bond vectors.
+    Returns:
+        forces (ndarray (natoms,3)): Total bonded force on each atom.
+        energies (ndarray (natoms,)): Bonded potential energy of each atom.
+        virial (ndarray (3,3)): Virial tensor of the bonded terms.
+    '''
+    forces = np.zeros((Atoms.natoms,3))
+    energies = np.zeros(Atoms.natoms)
+    virial = np.zeros((3,3))
+    for index,terms in ((Atoms.bonds,bond_terms),(Atoms.angles,angle_terms),(Atoms.dihedrals,dihedral_terms)):
+        if len(index):
+            f,e,w = _scatter_terms(Atoms,index,*terms(Atoms,cell,periodic))
+            forces += f
+            energies += e
+            virial += w
+    return forces,energies,virial
+
+def exclusion_correction(Atoms,charges,ewald,cell):
+    '''
+    The reciprocal part of the Ewald sum includes every pair, so for the excluded pairs
+    (which have no real-space part) its share, k*qq*erf(alpha*r)/r, is taken off again.
+    Args:
+        Atoms (class Atoms): Array of atoms.
+        charges (ndarray (ntypes,ntypes)): Array of species pair charges.
+        ewald (class PME): Long-range electrostatics.
+        cell (ndarray): Simulation cell size or lattice vectors.
+    Returns:
+        forces (ndarray (natoms,3)): Correction to the force on each atom.
+        energies (ndarray (natoms,)): Correction to the potential energy of each atom.
+        virial (ndarray (3,3)): Correction to the virial tensor.
+    '''
+    i,j = np.divmod(Atoms.exclusions(),Atoms.natoms)
+    dr = _vector(Atoms,i,j,cell,True)
+    r = np.linalg.norm(dr,axis=1)
+    ar = ewald.alpha*r
+    qq = charges[Atoms.types[i],Atoms.types[j]]
+    energy = -k*qq*(1.0 - erfc(ar))/r
+    f_over_r = (energy + k*qq*2*ewald.alpha/np.sqrt(np.pi)*np.exp(-ar*ar))/(r*r)
+    return accumulate(Atoms,i,j,dr,energy,f_over_r)
@@ -0,0 +1,98 @@
+#Binary checkpoint/restart files
+#A checkpoint is a single uncompressed .npz archive holding the complete state of a run:
+#the per-atom arrays, species data, bonded topology, cell, time and step, the neighbour list, the sizes of
+#the output files and optionally a random number generator state. It is written to a
+#temporary file which is then renamed over the old checkpoint, so a crash while writing
+#never leaves a corrupt or half-written checkpoint behind.
+import json
+import os
+import numpy as np
+import atoms
+
+VERSION = 1
+ARRAYS = ('pos','vel','accel','force','mass','charges','pE','kE','types')
+TOPOLOGY = ('bonds','bond_params','angles','angle_params','dihedrals','dihedral_params')
+
+def save_checkpoint(filename,Atoms,cell,t,step,start=0.0,dt=0.0,nlist=None,sizes=None,rng=None,respa=None,adaptive=None):
+    '''
+    Writes a checkpoint atomically.
+    Args:
+        filename (str): Checkpoint file.
+        Atoms (class Atoms): Array of atoms.
+        cell (ndarray): Simulation cell size or (3,3) lattice vectors.
+        t (float): Time of the last completed step.
+        step (int): Number of completed steps.
+        start (float): Start time of the run.
+        dt (float): Timestep.
+        nlist (class NeighbourList): Neighbour list to restore, None to rebuild it on restart.
+        sizes (dict): Output file sizes from Output.sizes().
+        rng (numpy Generator): Random number generator to restore.
+        respa (class RESPA): Multiple time step integrator to restore.
+        adaptive (class AdaptiveTimestep): Timestep controller to restore.
+    '''
+    data = {name:getattr(Atoms,name) for name in ARRAYS + TOPOLOGY}
+    data['symbols'] = Atoms.symbols.astype(str)
+    data['virial'] = Atoms.virial
+    for name,values in Atoms.properties.items():
+        data['property_'+name] = values
+    if nlist is not None:
+        for name,values in nlist.state().items():
+            data['nlist_'+name] = values
+    if respa is not None:
+        for name,values in respa.state().items():
+            data['respa_'+name] = values
+    if adaptive is not None:
+        for name,values in adaptive.state().items():
+            data['adaptive_'+name] = values
+    data['cell'] = np.asarray(cell,dtype=float)
+    #scalars and small dicts are stored as json, which also keeps int and str group labels apart
+    data['meta'] = np.array(json.dumps({'version':VERSION,'time':float(t),'step':int(step),'start':float(start),
+                                        'dt':float(dt),'groups':Atoms.groups,'sizes':sizes or {},
+                                        'rng':rng.bit_generator.state if rng is not None else None}))
+    tmp = filename + '.tmp'
+    with open(tmp,'wb') as file:
+        np.savez(file,**data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp,filename)
+
+def load_checkpoint(filename,Atoms=None):
+    '''
+    Reads a checkpoint written by save_checkpoint.
+    Args:
+        filename (str): Checkpoint file.
+        Atoms (class Atoms): Atoms object to overwrite with the saved state, a new one if None.
+    Returns:
+        Atoms (class Atoms): Atoms with the saved state.
+        state (dict): cell, time, step, start, dt, nlist (neighbour list state for
+            NeighbourList.restore), respa (for RESPA.restore), adaptive (for
+            AdaptiveTimestep.restore), sizes (for Output.truncate) and rng (numpy Generator or None).
+    '''
+    with np.load(filename,allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        if meta['version'] != VERSION:
+            raise ValueError(f'unsupported checkpoint version {meta["version"]}')
+        if Atoms is None:
+            Atoms = atoms.Atoms()
+        for name in ARRAYS:
+            setattr(Atoms,name,data[name].copy())
+        Atoms.natoms = len(Atoms.pos)
+        for name in TOPOLOGY:
+            if name in data.files:
+                setattr(Atoms,name,data[name].copy())
+        Atoms.symbols = data['symbols'].astype(object)
+        Atoms.virial = data['virial'].copy()
+        Atoms.groups = meta['groups']
+        Atoms.properties = {name[9:]:data[name].copy() for name in data.files if name.startswith('property_')}
+        Atoms.cache.clear()
+        nlist = {name[6:]:data[name].copy() for name in data.files if name.startswith('nlist_')}
+        respa = {name[6:]:data[name].copy() for name in data.files if name.startswith('respa_')}
+        adaptive = {name[9:]:data[name].copy() for name in data.files if name.startswith('adaptive_')}
+        cell = data['cell'].copy()
+    rng = None
+    if meta['rng'] is not None:
+        rng = np.random.Generator(getattr(np.random,meta['rng']['bit_generator'])())
+        rng.bit_generator.state = meta['rng']
+    state = {'cell':cell,'time':meta['time'],'step':meta['step'],'start':meta['start'],'dt':meta['dt'],
+             'nlist':nlist,'respa':respa,'adaptive':adaptive,'sizes':meta['sizes'],'rng':rng}
+    return Atoms,state
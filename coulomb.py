@@ -1,61 +1,57 @@
 from constants import k
+from neighbour import scatter
 import numpy as np
 
-def coulomb_force(Atoms,charges,r,r_unit,cutoff):
+def coulomb_force(Atoms,charges,i,j,r,dr):
     '''
     Calculates the Coulomb force acting on each atom.
     Parameters:
     - Atoms (class Atoms): An object representing the atoms.
-    - charges (ndarray (natoms,natoms)): Array of pairwise charges (q1*q2) between atoms.
-    - r (ndarray (natoms,natoms)): Array of pairwise distances between atoms.
-    - r_unit (ndarray (natoms,natoms)): Array of pairwise unit vectors between atoms.
-    - cutoff (float): Cutoff distance for the potential.
+    - charges (ndarray (ntypes,ntypes)): Array of species pair charges (q1*q2).
+    - i (ndarray): First atom index of each pair within the cutoff.
+    - j (ndarray): Second atom index of each pair within the cutoff.
+    - r (ndarray): Distance between the atoms of each pair.
+    - dr (ndarray (npairs,3)): Vector from atom j to atom i.
     Returns:
     - Atoms (class Atoms): An object representing
     '''
-    r[r > cutoff] = np.inf
-    coul = k*charges/(r**2) #calculate the force magnitude
-    coul = coul[:,:,np.newaxis] * r_unit #calculate the force vector
+    coul = k*charges[Atoms.types[i],Atoms.types[j]]/(r**2) #calculate the force magnitude
+    coul = coul[:,np.newaxis] * dr/r[:,np.newaxis] #calculate the force vector
 
-    forces = np.sum(coul,axis=(1))
-    for i in range(Atoms.natoms):
-        Atoms[i].force += forces[i]
-    Atoms.update_arr()
+    Atoms.force += scatter(i,coul,Atoms.natoms) - scatter(j,coul,Atoms.natoms)
 
     return Atoms
 
-def coulomb_potential(Atoms,charges,r,cutoff):
+def coulomb_potential(Atoms,charges,i,j,r):
     '''
     Calculate pairwise Coulombic interactions between atoms.
     Parameters:
     - Atoms (class Atoms): An object representing the atoms.
-    - charges (ndarray (natoms,natoms)): Array of pairwise charges (q1*q2) between atoms.
-    - r (ndarray (natoms,natoms)): Array of pairwise distances between atoms.
-    - cutoff (float): Cutoff distance for the potential.
+    - charges (ndarray (ntypes,ntypes)): Array of species pair charges (q1*q2).
+    - i (ndarray): First atom index of each pair within the cutoff.
+    - j (ndarray): Second atom index of each pair within the cutoff.
+    - r (ndarray): Distance between the atoms of each pair.
     Returns:
     - Atoms (class Atoms): An object representing the atoms.
     '''
-    r[r > cutoff] = np.inf
-    coul = k*charges/r
+    coul = k*charges[Atoms.types[i],Atoms.types[j]]/r
 
-    couls = np.sum(coul,axis=(1))
-    for i in range(Atoms.natoms):
-        Atoms[i].pE += couls[i]
-    Atoms.update_arr()
+    #each atom of a pair gets half of the pair energy
+    Atoms.pE += 0.5*(scatter(i,coul,Atoms.natoms) + scatter(j,coul,Atoms.natoms))
 
     return Atoms
 
 def pairwise_charges(Atoms):
     '''
-    Calculate pairwise charges between atoms.
+    Calculate the charge product table for every pair of species.
+    The table is cached on Atoms until species() changes a group.
     Args:
         Atoms (class Atoms): Array of atoms.
     Returns:
-        charge_pairs (ndarray (natoms,natoms)): Array of pairwise charges (q1*q2) between atoms.
+        charge_pairs (ndarray (ntypes,ntypes)): Array of species pair charges (q1*q2).
     '''
-    charge_pairs = np.zeros((Atoms.natoms,Atoms.natoms))
-    for i in range(Atoms.natoms):
-        for j in range(Atoms.natoms):
-            if i != j:
-                charge_pairs[i,j] = Atoms.charges[i]*Atoms.charges[j]
-    return charge_pairs
+    if 'charges' not in Atoms.cache:
+        q = Atoms.per_type(Atoms.charges)
+        Atoms.cache['charges'] = q[:,np.newaxis]*q[np.newaxis,:]
+    return Atoms.cache['charges']
+
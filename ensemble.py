@@ -0,0 +1,235 @@
+#Batched replica ensemble
+#R independent copies of the same system (same atoms and species) are stored as (R,N,3)
+#arrays and advanced together, so every force, integrator, thermostat and boundary
+#operation is a single NumPy call over all replicas. Each replica has its own cell,
+#thermostat temperature and, optionally, its own sigma/epsilon tables. This is meant
+#for parameter sweeps over many small systems, where a separate run per system would be
+#dominated by the Python overhead of each step. Forces are evaluated over all pairs
+#(no neighbour list), and the cells are orthorhombic.
+import os
+import numpy as np
+import atoms
+from bc import bc
+from bonded import has_topology
+from constants import k, kb
+from coulomb import pairwise_charges
+from lennard_jones import pairwise_calc
+from neighbour import scatter
+from write import Output
+
+class Ensemble:
+    '''
+    A set of replicas of one system.
+    Attributes:
+        nreplicas (int): Number of replicas R.
+        natoms (int): Number of atoms N in each replica.
+        pos (ndarray (R,N,3)): Positions.
+        vel (ndarray (R,N,3)): Velocities.
+        accel (ndarray (R,N,3)): Accelerations.
+        force (ndarray (R,N,3)): Forces.
+        pE (ndarray (R,N)): Potential energy of each atom.
+        kE (ndarray (R,N)): Kinetic energy of each atom.
+        virial (ndarray (R,3,3)): Virial tensor of each replica.
+        cells (ndarray (R,3)): Cell size of each replica.
+        temp_bath (ndarray (R,)): Thermostat temperature of each replica, 0 for no thermostat.
+        sigma (ndarray (R,ntypes,ntypes)): Species pair sigma values of each replica.
+        epsilon (ndarray (R,ntypes,ntypes)): Species pair epsilon values of each replica.
+        charges (ndarray (ntypes,ntypes)): Species pair charges, shared by all replicas.
+        template (class Atoms): The system the replicas were made from (types, masses, symbols, ...).
+    '''
+    def __init__(self,Atoms,nreplicas,cells,temp_bath=0.0,sigma=None,epsilon=None):
+        '''
+        Args:
+            Atoms (class Atoms): System copied into every replica, including positions and velocities.
+            nreplicas (int): Number of replicas.
+            cells (ndarray (3,) or (R,3)): Cell size, shared or per replica.
+            temp_bath (float or ndarray (R,)): Thermostat temperature, shared or per replica.
+            sigma (ndarray (ntypes,ntypes) or (R,ntypes,ntypes)): Sigma tables, from the species if None.
+            epsilon (ndarray (ntypes,ntypes) or (R,ntypes,ntypes)): Epsilon tables, from the species if None.
+        '''
+        if has_topology(Atoms):
+            raise ValueError('bonded interactions are not supported by the ensemble')
+        R,N = nreplicas,Atoms.natoms
+        self.nreplicas = R
+        self.natoms = N
+        self.template = Atoms
+        self.pos = np.repeat(Atoms.pos[np.newaxis],R,axis=0)
+        self.vel = np.repeat(Atoms.vel[np.newaxis],R,axis=0)
+        self.accel = np.repeat(Atoms.accel[np.newaxis],R,axis=0)
+        self.force = np.zeros((R,N,3))
+        self.pE = np.zeros((R,N))
+        self.kE = np.zeros((R,N))
+        self.virial = np.zeros((R,3,3))
+        self.cells = np.array(np.broadcast_to(np.asarray(cells,dtype=float),(R,3)))
+        self.temp_bath = np.array(np.broadcast_to(np.asarray(temp_bath,dtype=float),(R,)))
+        lj_sigma,lj_epsilon = pairwise_calc(Atoms)
+        ntypes = len(lj_sigma)
+        self.sigma = np.array(np.broadcast_to(lj_sigma if sigma is None else sigma,(R,ntypes,ntypes)),dtype=float)
+        self.epsilon = np.array(np.broadcast_to(lj_epsilon if epsilon is None else epsilon,(R,ntypes,ntypes)),dtype=float)
+        self.charges = pairwise_charges(Atoms)
+        self.mass = Atoms.mass
+        self.types = Atoms.types
+        self._i,self._j = np.triu_indices(N,k=1)
+
+    def replica(self,index):
+        '''
+        An Atoms object for one replica, whose per-atom arrays are views into the ensemble,
+        e.g. to write it out or analyse it with the single system tools.
+        '''
+        view = atoms.Atoms()
+        template = self.template
+        view.natoms = self.natoms
+        view.groups = template.groups
+        view.properties = template.properties
+        view.types = template.types
+        view.symbols = template.symbols
+        view.mass = template.mass
+        view.charges = template.charges
+        view.pos = self.pos[index]
+        view.vel = self.vel[index]
+        view.accel = self.accel[index]
+        view.force = self.force[index]
+        view.pE = self.pE[index]
+        view.kE = self.kE[index]
+        view.virial = self.virial[index]
+        return view
+
+    def get_potential(self):
+        return np.sum(self.pE,axis=1)
+    def get_kinetic(self):
+        return np.sum(self.kE,axis=1)
+    def get_total(self):
+        return self.get_kinetic() + self.get_potential()
+
+def ensemble_force_calc(Ensemble,cutoff,coul=True,periodic=False):
+    '''
+    Calculates the Lennard-Jones and Coulomb forces, energies and virials of every replica
+    over all pairs within the cutoff.
+    Args:
+        Ensemble (class Ensemble): Replicas.
+        cutoff (float): Cutoff distance for the potential.
+        coul (bool): Include the Coulomb interaction.
+        periodic (bool): Use the minimum image convention.
+    Returns:
+        Ensemble (class Ensemble): Replicas with updated forces, potential energies and virials.
+    '''
+    R,N = Ensemble.nreplicas,Ensemble.natoms
+    i,j = Ensemble._i,Ensemble._j
+    ti,tj = Ensemble.types[i],Ensemble.types[j]
+    dr = Ensemble.pos[:,i] - Ensemble.pos[:,j] #(R,npairs,3)
+    if periodic:
+        cells = Ensemble.cells[:,np.newaxis,:]
+        dr -= cells*np.round(dr/cells)
+    r2 = np.sum(dr*dr,axis=2)
+    inside = r2 <= cutoff*cutoff
+    inv_r2 = np.where(inside,1.0/r2,0.0)
+    s6 = (Ensemble.sigma[:,ti,tj]**2*inv_r2)**3
+    eps4 = 4*Ensemble.epsilon[:,ti,tj]
+    energy = eps4*s6*(s6 - 1.0)
+    f_over_r = 6*eps4*s6*(2*s6 - 1.0)*inv_r2
+    if coul == True:
+        coul_energy = k*Ensemble.charges[ti,tj]*np.sqrt(inv_r2)
+        energy += coul_energy
+        f_over_r += coul_energy*inv_r2
+
+    #pairs of different replicas never meet, so offset the atom indices by replica
+    offset = N*np.arange(R)[:,np.newaxis]
+    I,J = (offset+i).ravel(),(offset+j).ravel()
+    f = f_over_r[:,:,np.newaxis]*dr
+    flat = f.reshape(-1,3)
+    Ensemble.force[:] = (scatter(I,flat,R*N) - scatter(J,flat,R*N)).reshape(R,N,3)
+    energy = energy.ravel()
+    Ensemble.pE[:] = (0.5*(scatter(I,energy,R*N) + scatter(J,energy,R*N))).reshape(R,N)
+    Ensemble.virial[:] = np.einsum('rpa,rpb->rab',dr,f)
+    return Ensemble
+
+def ensemble_kE_calc(Ensemble):
+    '''
+    Calculates the kinetic energy of every atom, and returns the total of each replica.
+    '''
+    Ensemble.kE[:] = np.sum(0.5*Ensemble.mass[:,np.newaxis]*Ensemble.vel**2,axis=2)
+    return Ensemble.get_kinetic()
+
+def ensemble_thermostat(Ensemble):
+    '''
+    Rescales the velocities of each replica with a thermostat to its own temperature,
+    replicas with temp_bath = 0 are left alone.
+    '''
+    kE = ensemble_kE_calc(Ensemble)
+    temp_sys = (2*kE)/(3*kb*Ensemble.natoms)
+    on = Ensemble.temp_bath > 0
+    scale = np.ones(Ensemble.nreplicas)
+    scale[on] = np.sqrt(Ensemble.temp_bath[on]/temp_sys[on])
+    Ensemble.vel *= scale[:,np.newaxis,np.newaxis]
+    ensemble_kE_calc(Ensemble)
+    return Ensemble
+
+def ensemble_integrator(Ensemble,dt,cutoff,coul=True,boundary='reflective'):
+    '''
+    Velocity Verlet step of every replica, in the same order as verlet.integrator.
+    Args:
+        Ensemble (class Ensemble): Replicas.
+        dt (float): Timestep.
+        cutoff (float): Cutoff distance for the potential.
+        coul (bool): Include the Coulomb interaction.
+        boundary (str): 'reflective' walls or 'periodic' boundary conditions.
+    Returns:
+        Ensemble (class Ensemble): Replicas with updated positions, velocities and accelerations.
+    '''
+    Ensemble.pos += Ensemble.vel*dt + 0.5*Ensemble.accel*dt*dt
+    ensemble_force_calc(Ensemble,cutoff,coul=coul,periodic=(boundary == 'periodic'))
+    acc_old = Ensemble.accel.copy()
+    Ensemble.accel[:] = Ensemble.force/Ensemble.mass[:,np.newaxis]
+    Ensemble.vel += 0.5*(Ensemble.accel + acc_old)*dt
+    ensemble_thermostat(Ensemble)
+    cells = Ensemble.cells[:,np.newaxis,:]
+    if boundary == 'periodic':
+        Ensemble.pos %= cells
+    else:
+        bc(Ensemble,cells)
+    return Ensemble
+
+def run_ensemble(Ensemble,start,end,dt,cutoff,path,coul=True,boundary='reflective',
+                 traj_stride=1,energy_stride=1,debug_stride=0,console_stride=0):
+    '''
+    Main MD loop for a replica ensemble. Replica r is written to path/replica_r/outdir in the
+    same formats as MD.run, and the total energies of all replicas are written to
+    path/outdir/ensemble_energy.txt (one column per replica).
+    Args:
+        Ensemble (class Ensemble): Replicas.
+        start (float): Start time of simulation.
+        end (float): End time of simulation.
+        dt (float): Timestep.
+        cutoff (float): Cutoff distance for the potential.
+        path (str): Output directory.
+        coul (bool): Include the Coulomb interaction.
+        boundary (str): 'reflective' walls or 'periodic' boundary conditions.
+        traj_stride (int): Steps between trajectory frames of each replica, 0 to disable.
+        energy_stride (int): Steps between energy lines, 0 to disable.
+        debug_stride (int): Steps between debug frames of each replica, 0 to disable.
+        console_stride (int): Steps between printed energies of each replica, 0 to disable.
+    '''
+    if boundary not in ('reflective','periodic'):
+        raise ValueError(f'unknown boundary: {boundary}')
+    if boundary == 'periodic' and cutoff > 0.5*np.min(Ensemble.cells):
+        raise ValueError('cutoff must be at most half the cell width with periodic boundaries')
+    replicas = [Ensemble.replica(r) for r in range(Ensemble.nreplicas)]
+    outputs = [Output(os.path.join(path,f'replica_{r}'),append=(start != 0),traj_stride=traj_stride,energy_stride=0,
+                      debug_stride=debug_stride,console_stride=console_stride) for r in range(Ensemble.nreplicas)]
+    os.makedirs(os.path.join(path,'outdir'),exist_ok=True)
+    energy_file = os.path.join(path,'outdir','ensemble_energy.txt')
+    try:
+        with open(energy_file,'a' if start != 0 else 'w',buffering=1<<20) as energies:
+            if start == 0 and energy_stride:
+                energies.write('Time / ps,' + ','.join(f'Total Energy {r} / eV' for r in range(Ensemble.nreplicas)) + '\n')
+            for step,t in enumerate(np.arange(start,end,dt)):
+                Ensemble = ensemble_integrator(Ensemble,dt,cutoff,coul=coul,boundary=boundary)
+                if energy_stride and step % energy_stride == 0:
+                    energies.write(f'{t},' + ','.join(map(repr,Ensemble.get_total().tolist())) + '\n')
+                if traj_stride or debug_stride or console_stride:
+                    for r,output in enumerate(outputs):
+                        output.write(replicas[r],step,t,Ensemble.cells[r])
+    finally:
+        for output in outputs:
+            output.close()
+    return Ensemble
@@ -0,0 +1,242 @@
+#Smooth particle-mesh Ewald (PME) electrostatics for periodic cells
+#The Coulomb interaction is split into a short-range real-space part, erfc(alpha*r)/r,
+#evaluated on the neighbour list pairs, and a smooth long-range part evaluated on a
+#charge mesh with numpy.fft. See Essmann et al., J. Chem. Phys. 103, 8577 (1995).
+import math
+import numpy as np
+from bc import cell_matrix
+from constants import k
+
+#Abramowitz & Stegun 7.1.26 rational approximation of erfc (absolute error < 1.5e-7)
+_P = 0.3275911
+_A = (0.254829592,-0.284496736,1.421413741,-1.453152027,1.061405429)
+
+def erfc(x):
+    '''
+    Vectorised complementary error function for x >= 0.
+    Args:
+        x (ndarray): Non-negative arguments.
+    Returns:
+        erfc (ndarray): erfc(x).
+    '''
+    t = 1.0/(1.0 + _P*x)
+    poly = t*(_A[0] + t*(_A[1] + t*(_A[2] + t*(_A[3] + t*_A[4]))))
+    return poly*np.exp(-x*x)
+
+def bspline(w,order):
+    '''
+    Cardinal B-spline weights and derivatives of the grid points around each charge.
+    Args:
+        w (ndarray (n,)): Fractional part of the scaled coordinate of each charge.
+        order (int): Interpolation order (number of grid points per axis), at least 3.
+    Returns:
+        theta (ndarray (n,order)): Weights of the grid points floor(u)-order+1 ... floor(u).
+        dtheta (ndarray (n,order)): Derivatives of the weights with respect to u.
+    '''
+    theta = np.zeros((len(w),order))
+    theta[:,0] = 1.0 - w
+    theta[:,1] = w
+    for n in range(3,order+1):
+        #derivatives come from the order-1 weights
+        if n == order:
+            dtheta = -np.diff(theta,prepend=0.0,axis=1)
+        div = 1.0/(n-1)
+        theta[:,n-1] = div*w*theta[:,n-2]
+        for j in range(1,n-1):
+            theta[:,n-j-1] = div*((w+j)*theta[:,n-j-2] + (n-j-w)*theta[:,n-j-1])
+        theta[:,0] = div*(1.0-w)*theta[:,0]
+    return theta,dtheta
+
+def bspline_moduli(K,order):
+    '''
+    Squared moduli |b(m)|^2 of the B-spline structure factor correction along one axis.
+    Args:
+        K (int): Number of grid points along the axis.
+        order (int): Interpolation order.
+    Returns:
+        bsp (ndarray (K,)): |b(m)|^2 in FFT order.
+    '''
+    M,_ = bspline(np.zeros(1),order) #M_n(1) ... M_n(order)
+    m = np.arange(K)
+    phase = np.exp(2j*np.pi*np.outer(m,np.arange(order-1))/K)
+    denom = np.abs(phase @ M[0,:order-1])**2
+    #for odd orders the denominator vanishes at the Nyquist frequency, use the neighbours' average
+    small = denom < 1e-10
+    denom[small] = 0.5*(np.roll(denom,1)[small] + np.roll(denom,-1)[small])
+    return 1.0/denom
+
+def fft_size(n):
+    '''
+    Smallest integer >= n whose only prime factors are 2, 3 and 5.
+    '''
+    n = max(int(n),1)
+    while True:
+        m = n
+        for p in (2,3,5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+class PME:
+    '''
+    Smooth particle-mesh Ewald summation. The splitting parameter and the mesh are
+    chosen from a target relative accuracy unless they are given explicitly.
+    The real-space part is evaluated pairwise by nonbonded_calc through real_space(),
+    the reciprocal-space part and the self energy by reciprocal().
+    Attributes:
+        cutoff (float): Real-space cutoff.
+        alpha (float): Ewald splitting parameter (1/Angstrom).
+        grid (ndarray (3,)): Number of mesh points along each lattice vector.
+        order (int): B-spline interpolation order.
+    '''
+    def __init__(self,cutoff,cell,accuracy=1e-5,order=6,alpha=None,grid=None):
+        if order < 3:
+            raise ValueError('PME interpolation order must be at least 3')
+        self.cutoff = cutoff
+        self.order = order
+        if alpha is None:
+            alpha = self.tune_alpha(cutoff,accuracy)
+        self.alpha = alpha
+        if grid is None:
+            grid = self.tune_grid(alpha,cell,accuracy,order)
+        self.grid = np.array(grid,dtype=int)
+        if np.any(self.grid < order):
+            raise ValueError('PME grid must have at least order points along each axis')
+        self._bsp = [bspline_moduli(K,order) for K in self.grid]
+        self._cell = None
+
+    @staticmethod
+    def tune_alpha(cutoff,accuracy):
+        '''
+        Finds alpha so that the real-space term erfc(alpha*r) has decayed to the accuracy at the cutoff.
+        '''
+        low,high = 0.0,10.0/cutoff
+        while math.erfc(high*cutoff) > accuracy:
+            high *= 2
+        for _ in range(60):
+            mid = 0.5*(low+high)
+            if math.erfc(mid*cutoff) > accuracy:
+                low = mid
+            else:
+                high = mid
+        return high
+
+    @staticmethod
+    def tune_grid(alpha,cell,accuracy,order):
+        '''
+        Chooses the mesh so it resolves every reciprocal vector whose Gaussian factor
+        exp(-pi^2 m^2/alpha^2) is above the accuracy, and so the B-spline interpolation
+        error is below it. The RMS error of the reciprocal forces, relative to their RMS
+        size, was measured against a direct Ewald sum as about C*(alpha*spacing)^order, with
+        C from about 0.03 at order 6 down to 0.015 at order 8; order 4 converges more slowly.
+        The prefactors used here are a little above the measured ones.
+        '''
+        h = cell_matrix(cell)
+        lengths = np.linalg.norm(h,axis=1)
+        kmax = alpha*lengths*np.sqrt(-np.log(accuracy))/np.pi
+        prefactor = 0.8 if order <= 4 else 0.04*0.7**(order-6)
+        spacing = (accuracy/prefactor)**(1.0/order)/alpha
+        return [fft_size(max(2*np.ceil(x)+1,np.ceil(L/spacing))) for x,L in zip(kmax,lengths)]
+
+    def real_space(self,qq,r):
+        '''
+        Short-range part of the Coulomb interaction for each pair.
+        Args:
+            qq (ndarray): Charge product of each pair.
+            r (ndarray): Distance between the atoms of each pair.
+        Returns:
+            energy (ndarray): Pair energy.
+            f_over_r (ndarray): Pair force magnitude divided by r.
+        '''
+        ar = self.alpha*r
+        energy = k*qq*erfc(ar)/r
+        f_over_r = (energy + k*qq*2*self.alpha/np.sqrt(np.pi)*np.exp(-ar*ar))/(r*r)
+        return energy,f_over_r
+
+    def _influence(self,cell):
+        '''
+        Builds (and caches per cell) the reciprocal-space influence function on the
+        half-complex mesh and the factors needed for the virial.
+        '''
+        h = cell_matrix(cell)
+        if self._cell is not None and np.array_equal(h,self._cell):
+            return self._table
+        K1,K2,K3 = self.grid
+        recip = np.linalg.inv(h).T #rows are the reciprocal lattice vectors
+        m1 = np.fft.fftfreq(K1,1.0/K1)
+        m2 = np.fft.fftfreq(K2,1.0/K2)
+        m3 = np.fft.rfftfreq(K3,1.0/K3)
+        m = (m1[:,None,None,None]*recip[0] + m2[None,:,None,None]*recip[1]
+             + m3[None,None,:,None]*recip[2])
+        m2sum = np.sum(m*m,axis=-1)
+        m2sum[0,0,0] = 1.0
+        volume = abs(np.linalg.det(h))
+        bsp = (self._bsp[0][:,None,None]*self._bsp[1][None,:,None]
+               *self._bsp[2][None,None,:K3//2+1])
+        influence = np.exp(-np.pi**2*m2sum/self.alpha**2)/m2sum*bsp
+        influence[0,0,0] = 0.0
+        #the half-complex mesh holds each +m/-m pair once, except for the m3 = 0 and Nyquist planes
+        weight = np.full(K3//2+1,2.0)
+        weight[0] = 1.0
+        if K3 % 2 == 0:
+            weight[-1] = 1.0
+        virial_factor = 2*(1.0 + np.pi**2*m2sum/self.alpha**2)/m2sum
+        self._cell = h
+        self._table = (influence,weight,m,virial_factor,volume,recip)
+        return self._table
+
+    def reciprocal(self,Atoms,cell):
+        '''
+        Reciprocal-space and self-energy part of the Ewald sum.
+        Args:
+            Atoms (class Atoms): Array of atoms.
+            cell (ndarray (3,) or (3,3)): Simulation cell size or lattice vectors.
+        Returns:
+            forces (ndarray (natoms,3)): Long-range force on each atom.
+            energies (ndarray (natoms,)): Long-range and self energy of each atom.
+            virial (ndarray (3,3)): Long-range virial tensor.
+        '''
+        influence,weight,m,virial_factor,volume,recip = self._influence(cell)
+        K = self.grid
+        n = self.order
+        q = Atoms.charges
+        u = (Atoms.pos @ recip.T)*K #scaled fractional coordinates
+        base = np.floor(u).astype(int)
+        theta,dtheta,index = [],[],[]
+        for d in range(3):
+            t,dt = bspline(u[:,d]-base[:,d],n)
+            theta.append(t)
+            dtheta.append(dt)
+            index.append((base[:,d,None] + np.arange(-n+1,1)) % K[d])
+        flat = ((index[0][:,:,None,None]*K[1] + index[1][:,None,:,None])*K[2]
+                + index[2][:,None,None,:])
+        weights = theta[0][:,:,None,None]*theta[1][:,None,:,None]*theta[2][:,None,None,:]
+
+        #spread the charges onto the mesh
+        Q = np.bincount(flat.ravel(),weights=(q[:,None,None,None]*weights).ravel(),
+                        minlength=np.prod(K)).reshape(K)
+        FQ = np.fft.rfftn(Q)
+        volume_factor = k/(np.pi*volume)
+        potential = np.fft.irfftn(influence*FQ,s=K,axes=(0,1,2))*volume_factor*np.prod(K)
+
+        #interpolate the potential and its gradient back to the charges
+        grid_pot = potential.ravel()[flat]
+        phi = np.sum(grid_pot*weights,axis=(1,2,3))
+        grad = np.stack([
+            np.sum(grid_pot*dtheta[0][:,:,None,None]*theta[1][:,None,:,None]*theta[2][:,None,None,:],axis=(1,2,3)),
+            np.sum(grid_pot*theta[0][:,:,None,None]*dtheta[1][:,None,:,None]*theta[2][:,None,None,:],axis=(1,2,3)),
+            np.sum(grid_pot*theta[0][:,:,None,None]*theta[1][:,None,:,None]*dtheta[2][:,None,None,:],axis=(1,2,3)),
+        ],axis=1)
+        forces = -q[:,np.newaxis]*((grad*K) @ recip)
+
+        #self energy and the neutralising background for a net charge
+        energies = 0.5*q*phi - k*self.alpha/np.sqrt(np.pi)*q**2
+        background = -k*np.pi*np.sum(q)**2/(2*volume*self.alpha**2)
+        energies += background/Atoms.natoms
+
+        mode_energy = 0.5*volume_factor*influence*np.abs(FQ)**2*weight
+        virial = np.sum(mode_energy)*np.eye(3) - np.einsum('xyz,xyza,xyzb->ab',mode_energy*virial_factor,m,m)
+        virial += background*np.eye(3)
+        return forces,energies,virial
@@ -0,0 +1,138 @@
+#Structure generators: crystal lattices and random packings
+#Each generator returns a new Atoms object (built with Atoms.from_arrays) and the cell,
+#ready for species() and MD.run.
+import numpy as np
+from atoms import Atoms
+from bc import cell_matrix, cell_widths, minimum_image, to_fractional
+from neighbour import cell_pairs
+
+def _repeat(basis,n,a):
+    n = np.broadcast_to(np.asarray(n,dtype=int),(3,))
+    cells = np.array(list(np.ndindex(*n)),dtype=float)
+    pos = (cells[:,np.newaxis,:] + basis[np.newaxis,:,:]).reshape(-1,3)*a
+    return pos,n*float(a)
+
+def simple_cubic(n,a,group=0):
+    '''
+    Simple cubic lattice.
+    Args:
+        n (int or (3,)): Number of unit cells along each axis.
+        a (float): Lattice constant.
+        group: Group label of the atoms.
+    Returns:
+        Atoms (class Atoms): n^3 atoms.
+        cell (ndarray (3,)): Cell holding the lattice.
+    '''
+    pos,cell = _repeat(np.array([[0.5,0.5,0.5]]),n,a)
+    return Atoms.from_arrays(pos,groups=np.full(len(pos),group)),cell
+
+def fcc(n,a,group=0):
+    '''
+    Face-centred cubic lattice.
+    Args:
+        n (int or (3,)): Number of cubic unit cells along each axis.
+        a (float): Lattice constant.
+        group: Group label of the atoms.
+    Returns:
+        Atoms (class Atoms): 4n^3 atoms.
+        cell (ndarray (3,)): Cell holding the lattice.
+    '''
+    basis = np.array([[0.0,0.0,0.0],[0.5,0.5,0.0],[0.5,0.0,0.5],[0.0,0.5,0.5]]) + 0.25
+    pos,cell = _repeat(basis,n,a)
+    return Atoms.from_arrays(pos,groups=np.full(len(pos),group)),cell
+
+class _PackingGrid:
+    '''
+    Linked-cell grid of the atoms placed so far by random_packing. Grid cells are at least
+    min_dist wide, so any atom closer than min_dist to a point is in the point's grid cell or
+    one of the 26 around it. Each grid cell keeps the indices of its atoms in a fixed number
+    of slots, which grows when a grid cell runs out.
+    '''
+    def __init__(self,cell,min_dist,natoms):
+        self.cell = cell
+        self.min_dist = min_dist
+        self.ncells = np.maximum((cell_widths(cell)//min_dist).astype(int),1)
+        self.slots = np.full((np.prod(self.ncells),2),-1)
+        self.count = np.zeros(np.prod(self.ncells),dtype=int)
+        self.pos = np.zeros((natoms,3))
+        self.natoms = 0
+        offsets = np.array(np.meshgrid(*[range(-1,2)]*3,indexing='ij')).reshape(3,-1).T
+        self.offsets = offsets[np.argsort(np.abs(offsets).sum(axis=1),kind='stable')]
+
+    def index(self,pos):
+        return np.floor((to_fractional(pos,self.cell) % 1.0)*self.ncells).astype(int) % self.ncells
+
+    def free(self,pos):
+        #True for the points with no placed atom within min_dist
+        index = self.index(pos)
+        remaining = np.arange(len(pos))
+        #the own grid cell comes first; it rejects most points, which are then not looked up again
+        for offset in self.offsets:
+            flat = np.ravel_multi_index(((index[remaining] + offset) % self.ncells).T,self.ncells)
+            neighbours = self.slots[flat]
+            point,slot = np.nonzero(neighbours >= 0)
+            dr = minimum_image(pos[remaining[point]] - self.pos[neighbours[point,slot]],self.cell)
+            close = np.zeros(len(remaining),dtype=bool)
+            close[point[np.sum(dr*dr,axis=1) < self.min_dist*self.min_dist]] = True
+            remaining = remaining[~close]
+        free = np.zeros(len(pos),dtype=bool)
+        free[remaining] = True
+        return free
+
+    def add(self,pos):
+        flat = np.ravel_multi_index(self.index(pos).T,self.ncells)
+        order = np.argsort(flat,kind='stable')
+        flat = flat[order]
+        #rank of each new atom among the new atoms of its grid cell
+        first = np.searchsorted(flat,flat)
+        slot = self.count[flat] + np.arange(len(flat)) - first
+        if len(slot) and slot.max() >= self.slots.shape[1]:
+            extra = slot.max() + 1 - self.slots.shape[1]
+            self.slots = np.hstack([self.slots,np.full((len(self.slots),extra),-1)])
+        ids = self.natoms + np.arange(len(pos))
+        self.slots[flat,slot] = ids[order]
+        np.add.at(self.count,flat,1)
+        self.pos[ids] = pos
+        self.natoms += len(pos)
+
+def random_packing(natoms,cell,min_dist,group=0,seed=None,max_tries=1000,batch=1024):
+    '''
+    Random positions in a periodic cell with no two atoms closer than min_dist (random
+    sequential addition), placed in batches: every batch of trial positions is checked
+    against the atoms placed so far on a linked-cell grid that is kept between batches,
+    and the trial positions that fit are then accepted one by one, so of two close trial
+    positions only the later one is dropped.
+    Args:
+        natoms (int): Number of atoms.
+        cell (ndarray (3,) or (3,3)): Cell size or lattice vectors.
+        min_dist (float): Smallest allowed distance between atoms.
+        group: Group label of the atoms.
+        seed (int): Random seed.
+        max_tries (int): Number of batches before giving up.
+        batch (int): Smallest number of trial positions per batch (at least natoms are drawn).
+    Returns:
+        Atoms (class Atoms): The atoms.
+        cell (ndarray): The cell.
+    '''
+    rng = np.random.default_rng(seed)
+    h = cell_matrix(cell)
+    grid = _PackingGrid(cell,min_dist,natoms)
+    tries = 0
+    while grid.natoms < natoms:
+        if tries == max_tries:
+            raise ValueError(f'could not place {natoms} atoms at least {min_dist} apart')
+        tries += 1
+        #a fixed, oversampled batch keeps the acceptance from dying out as the packing fills up
+        trial = rng.uniform(0.0,1.0,(max(natoms,batch),3)) @ h
+        trial = trial[grid.free(trial)]
+        a,b = cell_pairs(trial,cell,min_dist,periodic=True)
+        a,b = np.minimum(a,b),np.maximum(a,b)
+        accepted = np.ones(len(trial),dtype=bool)
+        #greedy pass in trial order: a trial position is dropped if an earlier accepted one is too close.
+        #Sorted by the later index, every earlier position is decided before it is looked at.
+        for k in np.argsort(b,kind='stable'):
+            if accepted[a[k]]:
+                accepted[b[k]] = False
+        grid.add(trial[accepted][:natoms-grid.natoms])
+    pos = grid.pos
+    return Atoms.from_arrays(pos,groups=np.full(natoms,group)),cell
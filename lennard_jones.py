@@ -1,97 +1,92 @@
 #Calculates the Lennard-Jones potential and force between atoms
 import numpy as np
+from neighbour import scatter
 
 def pairwise_calc(Atoms):
     '''
-    Calculate pairwise sigma/epsilon values.
-    Sigma is calculated as the average between two atoms sigma values.
-    Epsilon is calculated as the geometric mean between two atoms epsilon values.
+    Calculate the sigma/epsilon table for every pair of species (Lorentz-Berthelot mixing).
+    Sigma is calculated as the average between two species sigma values.
+    Epsilon is calculated as the geometric mean between two species epsilon values.
+    For two atoms of the same species this gives back the species' own values.
+    The tables are cached on Atoms until species() changes a group.
+    A pair of atoms i,j looks up its values with sigma[Atoms.types[i],Atoms.types[j]].
     Args:
         Atoms (class Atoms): Array of atoms.
     Returns:
-        sigma (ndarray (natoms,natoms)): Array of pairwise sigma values.
-        epsilon (ndarray (natoms,natoms)): Array of pairwise epsilon values.
+        sigma (ndarray (ntypes,ntypes)): Array of species pair sigma values.
+        epsilon (ndarray (ntypes,ntypes)): Array of species pair epsilon values.
     '''
+    if 'lj' not in Atoms.cache:
+        sigma = Atoms.per_type(Atoms.properties['sigma'])
+        epsilon = Atoms.per_type(Atoms.properties['epsilon'])
+        Atoms.cache['lj'] = (0.5*(sigma[:,np.newaxis] + sigma[np.newaxis,:]),
+                             np.sqrt(epsilon[:,np.newaxis]*epsilon[np.newaxis,:]))
+    return Atoms.cache['lj']
 
-    sigma = np.zeros((Atoms.natoms,Atoms.natoms))
-    epsilon = np.zeros((Atoms.natoms,Atoms.natoms))
-
-    for i in range(Atoms.natoms):
-        for j in range(Atoms.natoms):
-            if i != j:
-                if Atoms[i].group != Atoms[j].group:
-                    #if ateoms are in different groups, calculate averages
-                    sigma[i,j] = 0.5*(Atoms[i].sigma + Atoms[j].sigma)
-                    epsilon[i,j] = np.sqrt(Atoms[i].epsilon*Atoms[j].epsilon)
-                else:
-                    #else the values are equal
-                    sigma[i,j] = Atoms[j].sigma
-                    epsilon[i,j] = Atoms[j].epsilon
-    return sigma, epsilon
-
-def distance_calc(Atoms):
+def distance_calc(Atoms,cutoff=np.inf):
     '''
-    Calculate pairwise distances between atoms. Uses numpy broadcasting to vectorise
-    the calculation.
-    Atoms.pos[:, np.newaxis, :] creates a 3D array of shape (natoms, 1, natoms)
-    and Atoms.pos[np.newaxis, :, :] creates a 3D array of shape (1, natoms, natoms).
-    Subtraction of these two arrays creates a 3D array of shape (natoms, natoms, 3),
-    which contains the xyz difference between atoms i and j in a matrix H_ij.
+    Calculate distances for every unique pair of atoms (i<j), without a neighbour list.
+    The pairs are stored as compact index arrays instead of (natoms,natoms) matrices.
+    The work is still O(natoms^2); use neighbour.NeighbourList for large systems.
 
     Args:
         Atoms (class Atoms): Array of atoms.
+        cutoff (float): Only pairs closer than the cutoff are returned.
     Returns:
-        r (ndarray (natoms,natoms)): Array of pairwise distances between atoms.
-        r_unit (ndarray (natoms,natoms)): Array of pairwise unit vectors between atoms.
+        i (ndarray): First atom index of each pair.
+        j (ndarray): Second atom index of each pair.
+        r (ndarray): Distance between the atoms of each pair.
+        dr (ndarray (npairs,3)): Vector from atom j to atom i.
     '''
-    diff = Atoms.pos[:, np.newaxis, :] - Atoms.pos[np.newaxis, :, :]
+    i,j = np.triu_indices(Atoms.natoms,k=1)
+    dr = Atoms.pos[i] - Atoms.pos[j]
     #calculate distance using the xyz values of the difference
-    r = np.linalg.norm(diff,axis=(2))
-    #avoid division by zero for distance of 0
-    r[r == 0] = np.inf
-    r_unit = diff/r[:,:,np.newaxis]
+    r = np.linalg.norm(dr,axis=1)
+    mask = r <= cutoff
 
-    return r,r_unit
+    return i[mask],j[mask],r[mask],dr[mask]
 
 
-def potential(Atoms,sigma,epsilon,r,cutoff):
+def potential(Atoms,sigma,epsilon,i,j,r):
     '''
     Calculate pairwise interactions between atoms.
     Args:
         Atoms (class Atoms): Array of atoms.
-        sigma (ndarray): Array of pairwise sigma values.
-        epsilon (ndarray): Array of pairwise epsilon values.
-        r (ndarray (natoms,natoms)): Array of pairwise distances between atoms.
+        sigma (ndarray (ntypes,ntypes)): Array of species pair sigma values.
+        epsilon (ndarray (ntypes,ntypes)): Array of species pair epsilon values.
+        i (ndarray): First atom index of each pair within the cutoff.
+        j (ndarray): Second atom index of each pair within the cutoff.
+        r (ndarray): Distance between the atoms of each pair.
     Returns:
         Atoms (class Atoms): Atoms with updated potential energies.
     '''
-    r[r > cutoff] = np.inf #set distances greater than cutoff to infinity
-    pot = 4*epsilon*( (sigma/r)**12 - (sigma/r)**6 ) #LJ formula, calculates potential in xyz directions
-    potentials = np.sum(pot,axis=(1)) #total potential energy for each atom
-    for i in range(Atoms.natoms):
-        Atoms[i].pE = potentials[i]
-    Atoms.update_arr()
+    ti,tj = Atoms.types[i],Atoms.types[j]
+    s = sigma[ti,tj]
+    pot = 4*epsilon[ti,tj]*( (s/r)**12 - (s/r)**6 ) #LJ formula
+    #total potential energy for each atom, each atom of a pair gets half of the pair energy
+    Atoms.pE[:] = 0.5*(scatter(i,pot,Atoms.natoms) + scatter(j,pot,Atoms.natoms))
 
     return Atoms
 
-def force(Atoms,sigma,epsilon,r,r_unit,cutoff):
+def force(Atoms,sigma,epsilon,i,j,r,dr):
     '''
     Calculate pairwise forces between atoms.
     Args:
         Atoms (class Atoms): Array of atoms.
-        sigma (ndarray): Array of pairwise sigma values.
-        epsilon (ndarray (natoms,natoms)): Array of pairwise epsilon values.
-        r (ndarray (natoms,natoms)): Array of pairwise distances between atoms.
+        sigma (ndarray (ntypes,ntypes)): Array of species pair sigma values.
+        epsilon (ndarray (ntypes,ntypes)): Array of species pair epsilon values.
+        i (ndarray): First atom index of each pair within the cutoff.
+        j (ndarray): Second atom index of each pair within the cutoff.
+        r (ndarray): Distance between the atoms of each pair.
+        dr (ndarray (npairs,3)): Vector from atom j to atom i.
     Returns:
         Atoms (class Atoms): Atoms with updated forces.
     '''
-    r[r > cutoff] = np.inf #set distances greater than cutoff to infinity
-    f = (24*epsilon/r)*(2*(sigma/r)**12 - (sigma/r)**6) #dLJ formula for magnitude of force
-    f = f[:,:,np.newaxis] * r_unit #multiply by unit vector to get force in xyz directions
-    forces = np.sum(f,axis=1) #each atom has natoms forces acting on it, sum them to get total force
-    # (e.g. atom 1 is affected by atom2, atom3, etc. so we sum all forces acting on atom1)
-    for i in range(Atoms.natoms):
-        Atoms[i].force = forces[i]
-    Atoms.update_arr()
+    ti,tj = Atoms.types[i],Atoms.types[j]
+    s = sigma[ti,tj]
+    f = (24*epsilon[ti,tj]/r)*(2*(s/r)**12 - (s/r)**6) #dLJ formula for magnitude of force
+    f = f[:,np.newaxis] * dr/r[:,np.newaxis] #multiply by unit vector to get force in xyz directions
+    #sum the pair forces acting on each atom, atom j feels the opposite force to atom i
+    Atoms.force[:] = scatter(i,f,Atoms.natoms) - scatter(j,f,Atoms.natoms)
     return Atoms
 
@@ -0,0 +1,212 @@
+#Energy minimisation
+#Relaxes the positions to a nearby local minimum of the potential energy before dynamics,
+#using the same force/energy evaluation as the integrator (verlet.force_calc).
+#FIRE: Bitzek et al., Phys. Rev. Lett. 97, 170201 (2006).
+#Conjugate gradient: Polak-Ribiere directions with an interpolating line search.
+import numpy as np
+from bc import pbc
+from verlet import force_calc
+
+METHODS = ('fire','cg')
+
+class _Evaluator:
+    '''
+    Energy and forces at trial positions, with the boundary conditions applied.
+    '''
+    def __init__(self,Atoms,sigma,epsilon,charges,nlist,cell,coul,boundary,ewald,table,parallel):
+        self.Atoms = Atoms
+        self.args = (sigma,epsilon,charges,nlist,cell)
+        self.kwargs = {'coul':coul,'ewald':ewald,'table':table,'parallel':parallel}
+        self.cell = cell
+        self.boundary = boundary
+        self.nevals = 0
+
+    def __call__(self,pos):
+        Atoms = self.Atoms
+        Atoms.pos[:] = pos
+        if self.boundary == 'periodic':
+            pbc(Atoms,self.cell)
+        else:
+            #reflective walls: keep the atoms inside the cell
+            np.clip(Atoms.pos,0.0,self.cell,out=Atoms.pos)
+        force_calc(Atoms,*self.args,**self.kwargs)
+        self.nevals += 1
+        return Atoms.get_potential(),Atoms.force.copy()
+
+def _limit(step,max_step):
+    #scale the whole step down so that no atom moves more than max_step
+    longest = np.sqrt(np.max(np.sum(step*step,axis=1),initial=0.0))
+    return step*(max_step/longest) if longest > max_step else step
+
+def _fmax(forces):
+    return np.sqrt(np.max(np.sum(forces*forces,axis=1),initial=0.0))
+
+def _converged(forces,energy,old_energy,ftol,etol):
+    fmax = _fmax(forces)
+    return fmax < ftol or abs(energy - old_energy) < etol,fmax
+
+def fire(evaluate,pos,ftol,etol,max_steps,max_step,dt=0.05,dt_max=0.5,n_min=5,f_inc=1.1,f_dec=0.5,
+         alpha_start=0.1,f_alpha=0.99):
+    '''
+    FIRE minimisation with unit masses.
+    Returns:
+        pos (ndarray (natoms,3)): Relaxed positions.
+        energy (float): Final energy.
+        fmax (float): Largest remaining force.
+        steps (int): Number of steps.
+        converged (bool): Whether a tolerance was reached.
+        message (str): Why the search stopped.
+    '''
+    energy,forces = evaluate(pos)
+    vel = np.zeros_like(pos)
+    alpha = alpha_start
+    since_negative = 0
+    fmax = np.inf
+    for steps in range(1,max_steps+1):
+        power = np.sum(forces*vel)
+        if power >= 0: #zero on the first step, when the atoms are still at rest
+            #mix the velocity towards the force direction
+            fnorm = np.linalg.norm(forces)
+            vel = (1.0 - alpha)*vel + alpha*forces*np.linalg.norm(vel)/max(fnorm,1e-300)
+            since_negative += 1
+            if since_negative > n_min:
+                dt = min(dt*f_inc,dt_max)
+                alpha *= f_alpha
+        else:
+            vel[:] = 0.0
+            dt *= f_dec
+            alpha = alpha_start
+            since_negative = 0
+        #semi-implicit Euler step
+        vel += dt*forces
+        pos = evaluate.Atoms.pos + _limit(dt*vel,max_step)
+        old_energy = energy
+        energy,forces = evaluate(pos)
+        done,fmax = _converged(forces,energy,old_energy,ftol,etol)
+        if done:
+            return evaluate.Atoms.pos.copy(),energy,fmax,steps,True,'converged'
+    return evaluate.Atoms.pos.copy(),energy,fmax,max_steps,False,'maximum number of steps reached'
+
+def _line_search(evaluate,pos,energy,forces,direction,alpha,max_alpha,armijo,min_alpha):
+    '''
+    Finds a step pos + alpha*direction that lowers the energy enough (Armijo condition).
+    Backtracks with quadratic interpolation while the condition fails; once it holds, one
+    secant step towards the minimum along the direction is tried (forwards if the energy is
+    still falling, backwards if the minimum was passed), and kept if it is lower.
+    Returns:
+        alpha (float): Accepted step length, None if no step down to min_alpha was accepted.
+        energy (float): Energy at the accepted step.
+        forces (ndarray (natoms,3)): Forces at the accepted step.
+    '''
+    slope = -np.sum(forces*direction) #dE/dalpha at alpha = 0
+    alpha = min(alpha,max_alpha)
+    while alpha >= min_alpha:
+        new_energy,new_forces = evaluate(pos + alpha*direction)
+        if new_energy <= energy + armijo*alpha*slope:
+            break
+        #minimum of the quadratic through E(0), E'(0) and E(alpha), kept within [0.1,0.5]*alpha
+        curvature = new_energy - energy - slope*alpha
+        guess = -slope*alpha*alpha/(2.0*curvature) if curvature > 0 else 0.5*alpha
+        alpha = min(max(guess,0.1*alpha),0.5*alpha)
+    else:
+        return None,energy,forces
+    new_slope = -np.sum(new_forces*direction)
+    if new_slope < 0 and alpha >= max_alpha:
+        return alpha,new_energy,new_forces
+    #secant estimate of where the slope along the direction vanishes
+    trial = alpha*slope/(slope - new_slope) if new_slope != slope else 2.0*alpha
+    trial = min(trial,4.0*alpha,max_alpha)
+    if abs(trial - alpha) < 1e-3*alpha:
+        return alpha,new_energy,new_forces
+    trial_energy,trial_forces = evaluate(pos + trial*direction)
+    if trial_energy < new_energy:
+        return trial,trial_energy,trial_forces
+    #the secant step was worse: put the atoms back at the accepted step
+    evaluate(pos + alpha*direction)
+    return alpha,new_energy,new_forces
+
+def conjugate_gradient(evaluate,pos,ftol,etol,max_steps,max_step,armijo=1e-4,min_alpha=1e-10):
+    '''
+    Polak-Ribiere conjugate gradient minimisation. The first line search starts with the largest
+    step allowed by max_step; later ones start from the step length that the last one found,
+    scaled by the change of the slope (Nocedal and Wright, eq. 3.60), and every step is capped
+    so that no atom moves more than max_step. If no step down to min_alpha lowers the energy
+    enough, the search restarts from steepest descent, and stops unconverged if that fails too.
+    Returns: as for fire.
+    '''
+    energy,forces = evaluate(pos)
+    pos = evaluate.Atoms.pos.copy()
+    direction = forces.copy()
+    steepest = True
+    fmax = _fmax(forces)
+    alpha = np.inf
+    old_slope = None
+    for steps in range(1,max_steps+1):
+        slope = np.sum(forces*direction)
+        if slope <= 0:
+            #not a descent direction, restart from steepest descent
+            direction = forces.copy()
+            steepest = True
+            slope = np.sum(forces*forces)
+        max_alpha = max_step/max(_fmax(direction),1e-300)
+        if old_slope is not None:
+            alpha = alpha*old_slope/slope
+        accepted,new_energy,new_forces = _line_search(evaluate,pos,energy,forces,direction,alpha,max_alpha,armijo,
+                                                      min_alpha)
+        if accepted is None:
+            #no step along the direction lowers the energy enough: go back to the last positions
+            evaluate(pos)
+            if steepest:
+                return pos,energy,fmax,steps,False,'line search failed along the steepest descent direction'
+            direction = forces.copy()
+            steepest = True
+            alpha,old_slope = np.inf,None
+            continue
+        alpha,old_slope = accepted,slope
+        old_energy = energy
+        old_forces = forces
+        energy,forces = new_energy,new_forces
+        pos = evaluate.Atoms.pos.copy()
+        done,fmax = _converged(forces,energy,old_energy,ftol,etol)
+        if done:
+            return pos,energy,fmax,steps,True,'converged'
+        beta = max(0.0,np.sum(forces*(forces - old_forces))/np.sum(old_forces*old_forces))
+        direction = forces + beta*direction
+        steepest = beta == 0.0
+    return pos,energy,fmax,max_steps,False,'maximum number of steps reached'
+
+def minimise(Atoms,sigma,epsilon,charges,nlist,cell,coul=True,boundary='reflective',ewald=None,table=None,
+             parallel=None,method='fire',ftol=1e-3,etol=1e-8,max_steps=1000,max_step=0.2):
+    '''
+    Moves the atoms to a nearby local minimum of the potential energy. The velocities are
+    not changed; the forces, energies and accelerations are left at the final positions,
+    so velocity Verlet can start from them directly.
+    Args:
+        Atoms (class Atoms): Array of atoms.
+        sigma (ndarray (ntypes,ntypes)): Array of species pair sigma values.
+        epsilon (ndarray (ntypes,ntypes)): Array of species pair epsilon values.
+        charges (ndarray (ntypes,ntypes)): Array of species pair charges.
+        nlist (class NeighbourList): Neighbour list holding the cutoff.
+        cell (ndarray): Simulation cell size.
+        coul (bool): Include the Coulomb interaction.
+        boundary (str): 'reflective' walls or 'periodic' boundary conditions.
+        ewald (class PME): Long-range electrostatics, None for plain cutoff Coulomb.
+        table (class PairTable): Tabulated potential used instead of the Lennard-Jones formula.
+        parallel (class ParallelForces or TiledForces): Pair force evaluator used instead of nlist.
+        method (str): 'fire' or 'cg' (conjugate gradient).
+        ftol (float): Stop when the largest force is below ftol (eV/Angstrom).
+        etol (float): Stop when the energy changes by less than etol (eV) in one step.
+        max_steps (int): Largest number of steps.
+        max_step (float): Largest distance (Angstrom) any atom moves in one step.
+    Returns:
+        Atoms (class Atoms): Atoms at the relaxed positions.
+        info (dict): method, energy, fmax, steps, evaluations, converged and message (why it stopped).
+    '''
+    if method not in METHODS:
+        raise ValueError(f'unknown minimisation method: {method}')
+    evaluate = _Evaluator(Atoms,sigma,epsilon,charges,nlist,cell,coul,boundary,ewald,table,parallel)
+    search = fire if method == 'fire' else conjugate_gradient
+    _,energy,fmax,steps,converged,message = search(evaluate,Atoms.pos.copy(),ftol,etol,max_steps,max_step)
+    Atoms.accel[:] = Atoms.force/Atoms.mass[:,np.newaxis]
+    return Atoms,{'method':method,'energy':float(energy),'fmax':float(fmax),'steps':steps,'evaluations':evaluate.nevals,
+                  'converged':converged,'message':message}
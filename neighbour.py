@@ -0,0 +1,228 @@
+#Neighbour search: linked-cell grid and Verlet neighbour list
+import numpy as np
+from bc import cell_widths, to_fractional, minimum_image
+
+def cell_list(pos,cell,rcell,periodic=False):
+    '''
+    Bins atoms into a linked-cell grid. Each grid cell is at least rcell wide, so all
+    neighbours of an atom within rcell are in its own or an adjacent grid cell.
+    The grid follows the lattice vectors, so triclinic cells are binned in fractional coordinates.
+    Args:
+        pos (ndarray (natoms,3)): Atom positions.
+        cell (ndarray (3,) or (3,3)): Simulation cell size or lattice vectors.
+        rcell (float): Minimum width of a grid cell.
+        periodic (bool): Wrap atoms outside the cell back into it.
+    Returns:
+        ncells (ndarray (3,)): Number of grid cells along each axis.
+        index (ndarray (natoms,3)): Grid cell index of each atom along each axis.
+        order (ndarray (natoms,)): Atom indices sorted by grid cell.
+        start (ndarray (ncell,)): Position in order of the first atom of each grid cell.
+        count (ndarray (ncell,)): Number of atoms in each grid cell.
+    '''
+    ncells = np.maximum((cell_widths(cell)//rcell).astype(int),1)
+    frac = to_fractional(pos,cell)
+    if periodic:
+        frac = frac % 1.0
+    #atoms slightly outside the cell (before the boundary conditions are applied) go in the edge cells
+    index = np.clip(np.floor(frac*ncells).astype(int),0,ncells-1)
+    flat = np.ravel_multi_index(index.T,ncells)
+    order = np.argsort(flat,kind='stable')
+    count = np.bincount(flat,minlength=np.prod(ncells))
+    start = np.cumsum(count) - count
+    return ncells,index,order,start,count
+
+def cell_pairs(pos,cell,rcell,periodic=False):
+    '''
+    Finds all unique pairs (i<j) closer than rcell using a linked-cell grid.
+    Each atom is paired with the atoms in its own and the 26 surrounding grid cells,
+    so the work scales linearly with the number of atoms.
+    Args:
+        pos (ndarray (natoms,3)): Atom positions.
+        cell (ndarray (3,) or (3,3)): Simulation cell size or lattice vectors.
+        rcell (float): Search radius.
+        periodic (bool): Search across the cell faces using the minimum image convention.
+    Returns:
+        i (ndarray): First atom index of each pair.
+        j (ndarray): Second atom index of each pair.
+    '''
+    ncells,index,order,start,count = cell_list(pos,cell,rcell,periodic)
+    atoms = np.arange(len(pos))
+    if periodic:
+        #with fewer than 3 grid cells along an axis, offsets -1 and +1 reach the same
+        #grid cell, so only the distinct ones are used to avoid counting pairs twice
+        offsets = [range(-1,2) if n >= 3 else range(n) for n in ncells]
+    else:
+        offsets = [range(-1,2)]*3
+    pairs_i,pairs_j = [],[]
+    for offset in np.array(np.meshgrid(*offsets,indexing='ij')).reshape(3,-1).T:
+        neighbour = index + offset
+        if periodic:
+            neighbour %= ncells
+        valid = np.all((neighbour >= 0) & (neighbour < ncells),axis=1)
+        i = atoms[valid]
+        flat = np.ravel_multi_index(neighbour[valid].T,ncells)
+        #expand every atom into one entry per atom of its neighbouring grid cell
+        n = count[flat]
+        first = np.repeat(start[flat],n)
+        within = np.arange(n.sum()) - np.repeat(np.cumsum(n)-n,n)
+        i = np.repeat(i,n)
+        j = order[first+within]
+        keep = i < j
+        pairs_i.append(i[keep])
+        pairs_j.append(j[keep])
+    i = np.concatenate(pairs_i)
+    j = np.concatenate(pairs_j)
+    dr = pos[i]-pos[j]
+    if periodic:
+        dr = minimum_image(dr,cell)
+    r = np.linalg.norm(dr,axis=1)
+    keep = r < rcell
+    return i[keep],j[keep]
+
+def remove_excluded(i,j,natoms,exclusions):
+    '''
+    Drops the excluded pairs (e.g. bonded atoms, see Atoms.exclusions) from a pair list.
+    Args:
+        i (ndarray): First atom index of each pair (i<j).
+        j (ndarray): Second atom index of each pair.
+        natoms (int): Number of atoms.
+        exclusions (ndarray): Sorted keys i*natoms + j of the excluded pairs.
+    Returns:
+        i (ndarray): First atom index of each remaining pair.
+        j (ndarray): Second atom index of each remaining pair.
+    '''
+    if len(exclusions) == 0:
+        return i,j
+    keep = ~np.isin(i*natoms + j,exclusions)
+    return i[keep],j[keep]
+
+class NeighbourList:
+    '''
+    Verlet neighbour list. Stores all pairs within cutoff+skin and only rebuilds
+    (using the linked-cell grid) once some atom has moved more than half the skin
+    since the last build. Excluded pairs (Atoms.exclusions) are left out when the list is
+    built, so they cost nothing on the other steps.
+    With periodic boundaries the pair vectors use the minimum image convention,
+    which requires the cutoff to be at most half the width of the cell.
+    Attributes:
+        cutoff (float): Cutoff distance for the potential.
+        skin (float): Extra distance added to the cutoff when building the list.
+        periodic (bool): Use periodic boundary conditions.
+        dtype (numpy dtype): Precision of the pair vectors and distances returned by pairs().
+            With float32 the positions are rounded to single precision before the pair vectors
+            are formed; the list itself is always built in double precision.
+        i (ndarray): First atom index of each listed pair.
+        j (ndarray): Second atom index of each listed pair.
+        nbuilds (int): Number of times the list has been built.
+        last (tuple): (i,j,r) returned by the last call of pairs(), for reuse by the analysis.
+    '''
+    def __init__(self,cutoff,skin=0.3,periodic=False,dtype=np.float64):
+        self.cutoff = cutoff
+        self.skin = skin
+        self.periodic = periodic
+        self.dtype = np.dtype(dtype)
+        self.i = None
+        self.j = None
+        self.nbuilds = 0
+        self.last = None
+        self._pos = None
+        self._cell = None
+        self._exclusions = None
+
+    def needs_rebuild(self,pos,cell):
+        '''
+        Checks whether the list is out of date.
+        Args:
+            pos (ndarray (natoms,3)): Atom positions.
+            cell (ndarray): Simulation cell size.
+        Returns:
+            rebuild (bool): True if the list has to be rebuilt.
+        '''
+        if self._pos is None or len(pos) != len(self._pos) or not np.array_equal(cell,self._cell):
+            return True
+        moved = self._displacement(pos-self._pos,cell)
+        moved = np.max(np.sum(moved**2,axis=1),initial=0.0)
+        return moved > (0.5*self.skin)**2
+
+    def build(self,pos,cell,exclusions=()):
+        '''
+        Builds the list of pairs within cutoff+skin.
+        Args:
+            pos (ndarray (natoms,3)): Atom positions.
+            cell (ndarray): Simulation cell size.
+            exclusions (ndarray): Sorted keys of the pairs to leave out, see remove_excluded.
+        '''
+        if self.periodic and self.cutoff > 0.5*np.min(cell_widths(cell)):
+            raise ValueError('cutoff must be at most half the cell width with periodic boundaries')
+        i,j = cell_pairs(pos,cell,self.cutoff+self.skin,self.periodic)
+        self.i,self.j = remove_excluded(i,j,len(pos),exclusions)
+        self._exclusions = exclusions
+        self._pos = pos.copy()
+        self._cell = np.array(cell,dtype=float)
+        self.nbuilds += 1
+
+    def pairs(self,Atoms,cell):
+        '''
+        Returns the pairs within the cutoff at the current positions, rebuilding the
+        list first if necessary.
+        Args:
+            Atoms (class Atoms): Array of atoms.
+            cell (ndarray): Simulation cell size.
+        Returns:
+            i (ndarray): First atom index of each pair.
+            j (ndarray): Second atom index of each pair.
+            r (ndarray): Distance between the atoms of each pair.
+            dr (ndarray (npairs,3)): Vector from atom j to atom i.
+        '''
+        exclusions = Atoms.exclusions()
+        #a restored list (no exclusions recorded yet) was built with the checkpointed topology
+        changed = (self._exclusions is not None and exclusions is not self._exclusions
+                   and not np.array_equal(exclusions,self._exclusions))
+        if changed or self.needs_rebuild(Atoms.pos,cell):
+            self.build(Atoms.pos,cell,exclusions)
+        self._exclusions = exclusions
+        pos = Atoms.pos if self.dtype == Atoms.pos.dtype else Atoms.pos.astype(self.dtype)
+        dr = self._displacement(pos[self.i] - pos[self.j],cell)
+        r = np.linalg.norm(dr,axis=1)
+        mask = r <= self.cutoff
+        self.last = (self.i[mask],self.j[mask],r[mask])
+        return self.last + (dr[mask],)
+
+    def state(self):
+        '''
+        Arrays needed to continue with exactly the same list, e.g. after a restart.
+        '''
+        if self._pos is None:
+            return {}
+        return {'i':self.i,'j':self.j,'pos':self._pos,'cell':self._cell,'nbuilds':self.nbuilds,
+                'rlist':self.cutoff+self.skin}
+
+    def restore(self,state):
+        '''
+        Restores a list saved with state(). A list built for a different cutoff or
+        skin is ignored, so it is rebuilt on the next call.
+        '''
+        if state and state['rlist'] == self.cutoff+self.skin:
+            self.i,self.j = state['i'],state['j']
+            self._pos,self._cell = state['pos'],state['cell']
+            self.nbuilds = int(state['nbuilds'])
+            self._exclusions = None
+
+    def _displacement(self,dr,cell):
+        if self.periodic:
+            return minimum_image(dr,cell)
+        return dr
+
+def scatter(index,values,natoms):
+    '''
+    Sums per-pair values onto atoms.
+    Args:
+        index (ndarray): Atom index of each value.
+        values (ndarray (npairs,) or (npairs,3)): Values to sum.
+        natoms (int): Number of atoms.
+    Returns:
+        total (ndarray (natoms,) or (natoms,3)): Sum of the values for each atom.
+    '''
+    if values.ndim == 1:
+        return np.bincount(index,weights=values,minlength=natoms)
+    return np.stack([np.bincount(index,weights=values[:,k],minlength=natoms) for k in range(values.shape[1])],axis=1)
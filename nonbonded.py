@@ -0,0 +1,107 @@
+#Fused Lennard-Jones + Coulomb kernel
+import numpy as np
+from bc import cell_matrix
+from constants import k
+from neighbour import scatter
+
+def switch(r,r_off,width):
+    '''
+    Cubic switching function, 1 below r_off-width and 0 above r_off, with a continuous derivative.
+    Used to split the pair potential for RESPA and to switch off tabulated potentials.
+    Args:
+        r (ndarray): Pair distances.
+        r_off (float): Distance where the switch reaches 0.
+        width (float): Width of the switching region.
+    Returns:
+        S (ndarray): Switch value of each pair.
+        dS (ndarray): Derivative of the switch with respect to r.
+    '''
+    x = np.clip((r - (r_off - width))/width,0.0,1.0)
+    S = 1.0 - x*x*(3.0 - 2.0*x)
+    dS = -6.0*x*(1.0 - x)/width
+    return S,dS
+
+def pair_terms(Atoms,sigma,epsilon,charges,i,j,r,coul=True,ewald=None,table=None):
+    '''
+    Lennard-Jones and Coulomb energy and force of each pair (i<j).
+    Args: as for nonbonded_calc.
+    Returns:
+        energy (ndarray): Energy of each pair.
+        f_over_r (ndarray): Force magnitude of each pair divided by r.
+    '''
+    ti,tj = Atoms.types[i],Atoms.types[j]
+    inv_r2 = 1.0/(r*r)
+    if table is not None:
+        energy,f_over_r = table.evaluate(ti,tj,r)
+    else:
+        s6 = (sigma[ti,tj]**2*inv_r2)**3 #(sigma/r)^6
+        eps4 = 4*epsilon[ti,tj]
+        energy = eps4*s6*(s6 - 1.0) #LJ formula
+        f_over_r = 6*eps4*s6*(2*s6 - 1.0)*inv_r2 #dLJ formula divided by r
+
+    if coul == True and ewald is not None:
+        coul_energy,coul_f_over_r = ewald.real_space(charges[ti,tj],r)
+        energy += coul_energy
+        f_over_r += coul_f_over_r
+    elif coul == True:
+        coul_energy = k*charges[ti,tj]/r
+        energy += coul_energy
+        f_over_r += coul_energy*inv_r2
+    return energy,f_over_r
+
+def accumulate(Atoms,i,j,dr,energy,f_over_r):
+    '''
+    Sums pair energies and forces onto the atoms, adding each pair force to atom i and
+    subtracting it from atom j, and giving each atom half of the pair energy.
+    Returns:
+        forces (ndarray (natoms,3)): Total force on each atom.
+        energies (ndarray (natoms,)): Potential energy of each atom.
+        virial (ndarray (3,3)): Virial tensor, sum over pairs of dr (outer) f.
+    '''
+    f = f_over_r[:,np.newaxis]*dr #force on atom i from atom j
+    #bincount sums in double precision, so single precision pair terms are accumulated in float64
+    forces = scatter(i,f,Atoms.natoms) - scatter(j,f,Atoms.natoms)
+    energies = 0.5*(scatter(i,energy,Atoms.natoms) + scatter(j,energy,Atoms.natoms))
+    virial = (dr.T @ f).astype(np.float64,copy=False) #only used for the pressure, so BLAS precision is enough
+    return forces,energies,virial
+
+def nonbonded_calc(Atoms,sigma,epsilon,charges,i,j,r,dr,coul=True,ewald=None,table=None):
+    '''
+    Calculate the Lennard-Jones and Coulomb forces, energies and virial in one pass over
+    the unique pairs (i<j). Powers of 1/r are shared between the energy and the force,
+    and each pair force is added to atom i and subtracted from atom j (Newton's third law).
+    Each atom is given half of the energy of each of its pairs, so the per-atom
+    energies sum to the total potential energy.
+    Args:
+        Atoms (class Atoms): Array of atoms.
+        sigma (ndarray (ntypes,ntypes)): Array of species pair sigma values.
+        epsilon (ndarray (ntypes,ntypes)): Array of species pair epsilon values.
+        charges (ndarray (ntypes,ntypes)): Array of species pair charges (q1*q2).
+        i (ndarray): First atom index of each pair within the cutoff.
+        j (ndarray): Second atom index of each pair within the cutoff.
+        r (ndarray): Distance between the atoms of each pair.
+        dr (ndarray (npairs,3)): Vector from atom j to atom i.
+        coul (bool): Include the Coulomb interaction.
+        ewald (class PME): If given, only the short-range real-space part of the Coulomb
+            interaction is calculated here (the long-range part comes from ewald.reciprocal).
+        table (class PairTable): Tabulated potential used instead of the Lennard-Jones formula.
+    Returns:
+        forces (ndarray (natoms,3)): Total force on each atom.
+        energies (ndarray (natoms,)): Potential energy of each atom.
+        virial (ndarray (3,3)): Virial tensor, sum over pairs of dr (outer) f.
+    '''
+    energy,f_over_r = pair_terms(Atoms,sigma,epsilon,charges,i,j,r,coul=coul,ewald=ewald,table=table)
+    return accumulate(Atoms,i,j,dr,energy,f_over_r)
+
+def pressure(Atoms,cell):
+    '''
+    Calculate the pressure from the kinetic energy and the virial of the last force evaluation.
+    P = (2*kE + trace(virial))/(3*V)
+    Args:
+        Atoms (class Atoms): Array of atoms.
+        cell (ndarray (3,) or (3,3)): Simulation cell size or lattice vectors.
+    Returns:
+        pressure (float): Pressure in eV/Angstrom^3.
+    '''
+    volume = abs(np.linalg.det(cell_matrix(cell)))
+    return (2*Atoms.get_kinetic() + np.trace(Atoms.virial))/(3*volume)
@@ -0,0 +1,206 @@
+#Parallel pair force evaluation over spatial domains
+#Positions and per-worker force/energy/virial buffers live in shared memory, so the
+#only messages sent each step are a rebuild flag and the cell. The cell is cut into
+#slabs along the first lattice vector; each worker owns the atoms of one slab and
+#computes every pair whose lower-index atom it owns, using a halo of atoms within
+#cutoff+skin of its slab. Each worker writes to its own buffer and the main process
+#sums them, so there are no races.
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from bc import cell_widths, to_fractional, minimum_image
+from neighbour import cell_pairs, remove_excluded
+from nonbonded import nonbonded_calc
+
+def _attach(name,shape):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm,np.ndarray(shape,dtype=np.float64,buffer=shm.buf)
+
+def slab_owner(pos,cell,nworkers,periodic):
+    '''
+    Slab (worker) index of each atom along the first lattice vector.
+    Args:
+        pos (ndarray (natoms,3)): Atom positions.
+        cell (ndarray (3,) or (3,3)): Simulation cell size or lattice vectors.
+        nworkers (int): Number of slabs.
+        periodic (bool): Wrap positions into the cell first.
+    Returns:
+        owner (ndarray (natoms,)): Slab index of each atom.
+        frac (ndarray (natoms,)): Fractional coordinate along the first lattice vector.
+    '''
+    frac = to_fractional(pos,cell)[:,0]
+    if periodic:
+        frac = frac % 1.0
+    return np.clip(np.floor(frac*nworkers).astype(int),0,nworkers-1),frac
+
+def domain_pairs(pos,cell,rlist,rank,nworkers,periodic):
+    '''
+    Pairs (a<b) closer than rlist whose atom a belongs to the slab of this worker.
+    Only the slab and its halo are searched with the linked-cell grid.
+    Args:
+        pos (ndarray (natoms,3)): Atom positions.
+        cell (ndarray (3,) or (3,3)): Simulation cell size or lattice vectors.
+        rlist (float): Search radius (cutoff+skin).
+        rank (int): Slab index of this worker.
+        nworkers (int): Number of slabs.
+        periodic (bool): Use periodic boundary conditions.
+    Returns:
+        a (ndarray): First atom index of each pair.
+        b (ndarray): Second atom index of each pair.
+    '''
+    owner,frac = slab_owner(pos,cell,nworkers,periodic)
+    #distance (in fractional units) from the slab, across the periodic boundary if needed
+    low,high = rank/nworkers,(rank+1)/nworkers
+    halo = rlist/cell_widths(cell)[0]
+    outside = np.maximum(low-frac,frac-high)
+    if periodic:
+        outside = np.minimum(outside,np.minimum(np.abs(frac+1.0-high),np.abs(frac-1.0-low)))
+    candidates = np.flatnonzero((owner == rank) | (outside <= halo))
+    i,j = cell_pairs(pos[candidates],cell,rlist,periodic)
+    a,b = candidates[i],candidates[j]
+    keep = owner[a] == rank
+    return a[keep],b[keep]
+
+def _worker(rank,nworkers,names,Atoms,tables,cutoff,skin,periodic,coul,ewald,table,dtype,conn):
+    natoms = Atoms.natoms
+    shms = []
+    shm,pos = _attach(names['pos'],(natoms,3))
+    shms.append(shm)
+    shm,forces = _attach(names['force'],(nworkers,natoms,3))
+    shms.append(shm)
+    shm,energies = _attach(names['energy'],(nworkers,natoms))
+    shms.append(shm)
+    shm,virials = _attach(names['virial'],(nworkers,3,3))
+    shms.append(shm)
+    Atoms.pos = pos
+    sigma,epsilon,charges = tables
+    exclusions = Atoms.exclusions()
+    a = b = np.zeros(0,dtype=int)
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            rebuild,cell = message
+            if rebuild:
+                a,b = domain_pairs(pos,cell,cutoff+skin,rank,nworkers,periodic)
+                a,b = remove_excluded(a,b,natoms,exclusions)
+            pair_pos = pos.astype(dtype) if dtype != pos.dtype else pos
+            dr = pair_pos[a] - pair_pos[b]
+            if periodic:
+                dr = minimum_image(dr,cell)
+            r = np.linalg.norm(dr,axis=1)
+            mask = r <= cutoff
+            forces[rank],energies[rank],virials[rank] = nonbonded_calc(
+                Atoms,sigma,epsilon,charges,a[mask],b[mask],r[mask],dr[mask],coul=coul,ewald=ewald,table=table)
+            conn.send(int(np.count_nonzero(mask)))
+    finally:
+        for shm in shms:
+            shm.close()
+
+class ParallelForces:
+    '''
+    Pool of worker processes computing the nonbonded pair forces over spatial slabs.
+    The results match the serial nonbonded_calc path up to round-off (only the
+    summation order differs). The long-range PME part is not included.
+    Attributes:
+        nworkers (int): Number of worker processes.
+        cutoff (float): Cutoff distance for the potential.
+        skin (float): Neighbour list skin.
+        periodic (bool): Use periodic boundary conditions.
+        nbuilds (int): Number of neighbour list rebuilds.
+        npairs (int): Number of pairs within the cutoff in the last evaluation.
+        dtype (numpy dtype): Precision of the pair vectors and pair terms, see NeighbourList.
+    '''
+    def __init__(self,Atoms,sigma,epsilon,charges,cutoff,skin=0.3,periodic=False,nworkers=2,coul=True,ewald=None,
+                 table=None,dtype=np.float64):
+        if table is not None:
+            table.check_cutoff(cutoff)
+        self.nworkers = nworkers
+        self.cutoff = cutoff
+        self.skin = skin
+        self.periodic = periodic
+        self.nbuilds = 0
+        self.npairs = 0
+        self.dtype = np.dtype(dtype)
+        natoms = Atoms.natoms
+        self._shms = {}
+        self._arrays = {}
+        for name,shape in (('pos',(natoms,3)),('force',(nworkers,natoms,3)),
+                           ('energy',(nworkers,natoms)),('virial',(nworkers,3,3))):
+            shm = shared_memory.SharedMemory(create=True,size=max(int(np.prod(shape))*8,1))
+            self._shms[name] = shm
+            self._arrays[name] = np.ndarray(shape,dtype=np.float64,buffer=shm.buf)
+        names = {name:shm.name for name,shm in self._shms.items()}
+        self._pos = None
+        self._cell = None
+        self._conns = []
+        self._procs = []
+        for rank in range(nworkers):
+            parent,child = mp.Pipe()
+            proc = mp.Process(target=_worker,args=(rank,nworkers,names,Atoms,(sigma,epsilon,charges),
+                                                   cutoff,skin,periodic,coul,ewald,table,self.dtype,child),daemon=True)
+            proc.start()
+            self._conns.append(parent)
+            self._procs.append(proc)
+
+    def _needs_rebuild(self,pos,cell):
+        if self._pos is None or not np.array_equal(cell,self._cell):
+            return True
+        moved = pos - self._pos
+        if self.periodic:
+            moved = minimum_image(moved,cell)
+        return np.max(np.sum(moved**2,axis=1),initial=0.0) > (0.5*self.skin)**2
+
+    def compute(self,Atoms,cell):
+        '''
+        Calculates the nonbonded forces, energies and virial at the current positions.
+        Args:
+            Atoms (class Atoms): Array of atoms.
+            cell (ndarray (3,) or (3,3)): Simulation cell size or lattice vectors.
+        Returns:
+            forces (ndarray (natoms,3)): Total force on each atom.
+            energies (ndarray (natoms,)): Potential energy of each atom.
+            virial (ndarray (3,3)): Virial tensor.
+        '''
+        cell = np.asarray(cell,dtype=float)
+        self._arrays['pos'][:] = Atoms.pos
+        rebuild = self._needs_rebuild(Atoms.pos,cell)
+        if rebuild:
+            if self.periodic and self.cutoff > 0.5*np.min(cell_widths(cell)):
+                raise ValueError('cutoff must be at most half the cell width with periodic boundaries')
+            self._pos = Atoms.pos.copy()
+            self._cell = cell.copy()
+            self.nbuilds += 1
+        for conn in self._conns:
+            conn.send((rebuild,cell))
+        self.npairs = sum(conn.recv() for conn in self._conns)
+        return (self._arrays['force'].sum(axis=0),self._arrays['energy'].sum(axis=0),
+                self._arrays['virial'].sum(axis=0))
+
+    def close(self):
+        '''
+        Stops the workers and releases the shared memory.
+        '''
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError,OSError):
+                pass
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        self._conns = []
+        self._procs = []
+        self._arrays = {}
+        for shm in self._shms.values():
+            shm.close()
+            shm.unlink()
+        self._shms = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
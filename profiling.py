@@ -0,0 +1,135 @@
+#Opt-in instrumentation for the MD loop: named phase timers, counters and allocation tracking
+import json
+import time
+import tracemalloc
+
+class _Timer:
+    '''
+    Accumulates the wall time (and optionally the peak allocation) of one named phase.
+    '''
+    __slots__ = ('seconds','calls','peak_bytes','_memory','_start','_base')
+
+    def __init__(self,memory):
+        self.seconds = 0.0
+        self.calls = 0
+        self.peak_bytes = 0
+        self._memory = memory
+
+    def __enter__(self):
+        if self._memory:
+            tracemalloc.reset_peak()
+            self._base = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self,*args):
+        self.seconds += time.perf_counter() - self._start
+        self.calls += 1
+        if self._memory:
+            self.peak_bytes = max(self.peak_bytes,tracemalloc.get_traced_memory()[1] - self._base)
+
+class Profiler:
+    '''
+    Collects per-phase timings and counters during a run.
+    Phase timers should not be nested when memory tracking is on, since each timer
+    resets the tracemalloc peak when it starts.
+    Attributes:
+        memory (bool): Track the peak allocation of each phase with tracemalloc.
+        timers (dict): Timer of each phase.
+        counters (dict): Value of each counter.
+    '''
+    def __init__(self,memory=False):
+        self.memory = memory
+        self.timers = {}
+        self.counters = {}
+        self._start = None
+        self.total = 0.0
+
+    def start(self):
+        if self.memory:
+            tracemalloc.start()
+        self._start = time.perf_counter()
+
+    def stop(self):
+        self.total += time.perf_counter() - self._start
+        if self.memory:
+            self.counters['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def timer(self,name):
+        '''
+        Context manager timing one phase: with profiler.timer('nonbonded'): ...
+        '''
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = _Timer(self.memory)
+        return timer
+
+    def count(self,name,n=1):
+        self.counters[name] = self.counters.get(name,0) + n
+
+    def set(self,name,value):
+        self.counters[name] = value
+
+    def to_dict(self):
+        '''
+        Machine-readable summary of the run.
+        '''
+        phases = {name:{'seconds':timer.seconds,'calls':timer.calls,
+                        'fraction':timer.seconds/self.total if self.total else 0.0}
+                  for name,timer in self.timers.items()}
+        if self.memory:
+            for name,timer in self.timers.items():
+                phases[name]['peak_bytes'] = timer.peak_bytes
+        return {'total_seconds':self.total,'phases':phases,'counters':dict(self.counters)}
+
+    def summary(self):
+        '''
+        Human-readable table of the phase timings and counters.
+        '''
+        lines = [f'{"phase":<16}{"calls":>10}{"total / s":>12}{"per call / ms":>15}{"% of run":>10}'
+                 + (f'{"peak MB":>10}' if self.memory else '')]
+        accounted = 0.0
+        for name,timer in sorted(self.timers.items(),key=lambda item: -item[1].seconds):
+            accounted += timer.seconds
+            line = (f'{name:<16}{timer.calls:>10}{timer.seconds:>12.3f}'
+                    f'{1e3*timer.seconds/max(timer.calls,1):>15.3f}{100*timer.seconds/max(self.total,1e-12):>10.1f}')
+            if self.memory:
+                line += f'{timer.peak_bytes/2**20:>10.2f}'
+            lines.append(line)
+        other = max(self.total - accounted,0.0)
+        lines.append(f'{"other":<16}{"":>10}{other:>12.3f}{"":>15}{100*other/max(self.total,1e-12):>10.1f}')
+        lines.append(f'{"total":<16}{"":>10}{self.total:>12.3f}')
+        for name,value in self.counters.items():
+            lines.append(f'{name:<24}{value}')
+        return '\n'.join(lines)
+
+    def save(self,filename):
+        with open(filename,'w') as file:
+            json.dump(self.to_dict(),file,indent=1)
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        pass
+
+class NullProfiler:
+    '''
+    Profiler that does nothing, used when profiling is off.
+    '''
+    _timer = _NullTimer()
+
+    def timer(self,name):
+        return self._timer
+
+    def count(self,name,n=1):
+        pass
+
+    def set(self,name,value):
+        pass
+
+NULL_PROFILER = NullProfiler()
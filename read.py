@@ -0,0 +1,167 @@
+#Structure readers
+#Each reader returns a new Atoms object built in one go with Atoms.from_arrays, together
+#with the simulation cell, so a run can be started (or restarted) from the file.
+import numpy as np
+from atoms import Atoms
+
+def _parse_comment(line):
+    '''
+    Parses the key=value pairs of an extended xyz comment line, e.g.
+    time = 0.5 Lattice="10 0 0 0 10 0 0 0 10" Properties=species:S:1:pos:R:3
+    '''
+    info = {}
+    line = line.replace(' = ','=')
+    while line.strip():
+        line = line.strip()
+        key,sep,rest = line.partition('=')
+        if not sep:
+            break
+        if rest.startswith('"'):
+            value,_,line = rest[1:].partition('"')
+        else:
+            value,_,line = rest.partition(' ')
+        info[key.strip()] = value
+    return info
+
+def _columns(info,ncols):
+    '''
+    Column of the symbols, positions and velocities from the Properties key, or the
+    layout written by write.format_xyz (symbol x y z [vx vy vz]).
+    '''
+    if 'Properties' not in info:
+        return 0,slice(1,4),slice(4,7) if ncols >= 7 else None
+    fields = info['Properties'].split(':')
+    columns = {}
+    col = 0
+    for name,_,count in zip(fields[::3],fields[1::3],fields[2::3]):
+        columns[name] = slice(col,col+int(count))
+        col += int(count)
+    symbols = columns.get('species',slice(0,1)).start
+    vel = columns.get('vel',columns.get('velo',columns.get('velocities')))
+    return symbols,columns['pos'],vel
+
+def read_xyz(filename,index=-1):
+    '''
+    Reads one frame of an (extended) xyz file, such as those written by write.output_xyz
+    or Output. The atoms are grouped by symbol, so species() can be called with the symbols
+    as groups to set the masses, charges and potential parameters.
+    Args:
+        filename (str): The xyz file.
+        index (int): Frame to read, negative values count from the end (-1 is the last frame).
+    Returns:
+        Atoms (class Atoms): The atoms of the frame.
+        cell (ndarray (3,) or (3,3)): Cell from the Lattice key (orthorhombic cells as a vector), None if absent.
+        t (float): Time from the time key, None if absent.
+    '''
+    with open(filename) as file:
+        lines = file.read().splitlines()
+    starts = []
+    line = 0
+    while line < len(lines) and lines[line].strip():
+        starts.append(line)
+        line += int(lines[line]) + 2
+    if not starts:
+        raise ValueError(f'no frames in {filename}')
+    start = starts[index]
+    natoms = int(lines[start])
+    info = _parse_comment(lines[start+1])
+    rows = lines[start+2:start+2+natoms]
+    ncols = len(rows[0].split()) if rows else 4
+    symbol_col,pos_cols,vel_cols = _columns(info,ncols)
+    symbols = np.loadtxt(rows,dtype=str,usecols=symbol_col,ndmin=1)
+    pos = np.loadtxt(rows,usecols=range(pos_cols.start,pos_cols.stop),ndmin=2)
+    vel = np.loadtxt(rows,usecols=range(vel_cols.start,vel_cols.stop),ndmin=2) if vel_cols is not None else None
+    atoms = Atoms.from_arrays(pos,vel,groups=symbols,symbols=symbols)
+    cell = None
+    if 'Lattice' in info:
+        cell = np.array(info['Lattice'].split(),dtype=float).reshape(3,3)
+        if np.count_nonzero(cell - np.diag(np.diag(cell))) == 0:
+            cell = np.diag(cell).copy()
+    t = float(info['time']) if 'time' in info else None
+    return atoms,cell,t
+
+#columns of the type, the charge (None if absent) and the first coordinate of each supported atom style
+ATOM_STYLES = {'atomic':(1,None,2),'charge':(1,2,3),'bond':(2,None,3),'angle':(2,None,3),'molecular':(2,None,3),
+               'full':(2,3,4)}
+
+def read_lammps_data(filename):
+    '''
+    Reads a LAMMPS data file with atom style atomic (id type x y z), charge (id type q x y z),
+    bond, angle or molecular (id mol type x y z) or full (id mol type q x y z), and optional
+    Masses and Velocities sections. The style is taken from the comment on the Atoms line
+    (e.g. 'Atoms # full'), as LAMMPS writes it; without one it is guessed from the number of
+    columns, which cannot tell molecular from charge.
+    The atom types become the groups, so species() is called with the type numbers.
+    Args:
+        filename (str): The data file.
+    Returns:
+        Atoms (class Atoms): The atoms, in order of their ids.
+        cell (ndarray (3,) or (3,3)): Cell size, or lattice vectors if there are tilt factors.
+    '''
+    with open(filename) as file:
+        raw = file.read().splitlines()
+    lines = [line.split('#')[0].strip() for line in raw]
+    style = None
+    bounds = np.zeros((3,2))
+    tilt = np.zeros(3)
+    sections = {}
+    line = 1 #the first line is a comment
+    while line < len(lines):
+        text = lines[line]
+        words = text.split()
+        if not words:
+            line += 1
+        elif text.endswith('xlo xhi') or text.endswith('ylo yhi') or text.endswith('zlo zhi'):
+            bounds['xyz'.index(words[2][0])] = float(words[0]),float(words[1])
+            line += 1
+        elif text.endswith('xy xz yz'):
+            tilt[:] = [float(w) for w in words[:3]]
+            line += 1
+        elif words[0][0].isalpha():
+            #a section: skip the blank line after its title and read until the next blank line
+            name = words[0]
+            if name == 'Atoms' and '#' in raw[line]:
+                hint = raw[line].split('#',1)[1].split()
+                style = hint[0] if hint else None
+            line += 1
+            while line < len(lines) and not lines[line]:
+                line += 1
+            end = line
+            while end < len(lines) and lines[end]:
+                end += 1
+            sections[name] = lines[line:end]
+            line = end
+        else:
+            line += 1
+    if style is None:
+        #image flags may follow the coordinates on some rows, so the style is found from the shortest row
+        ncols = min(len(row.split()) for row in sections['Atoms'])
+        style = {5:'atomic',8:'atomic',6:'charge',9:'charge',7:'full',10:'full'}.get(ncols)
+        if style is None:
+            raise ValueError(f'unsupported atom style with {ncols} columns')
+    if style not in ATOM_STYLES:
+        raise ValueError(f'unsupported atom style: {style}')
+    type_col,charge_col,pos_col = ATOM_STYLES[style]
+    atoms_rows = np.loadtxt(sections['Atoms'],usecols=range(pos_col+3),ndmin=2)
+    ids,types,pos = atoms_rows[:,0],atoms_rows[:,type_col],atoms_rows[:,pos_col:pos_col+3]
+    q = atoms_rows[:,charge_col] if charge_col is not None else None
+    order = np.argsort(ids)
+    types = types[order].astype(int)
+    vel = None
+    if 'Velocities' in sections:
+        rows = np.loadtxt(sections['Velocities'],ndmin=2)
+        vel = rows[np.argsort(rows[:,0]),1:4]
+    mass = None
+    if 'Masses' in sections:
+        rows = np.loadtxt(sections['Masses'],ndmin=2)
+        lookup = np.full(int(max(rows[:,0].max(),types.max()))+1,np.nan)
+        lookup[rows[:,0].astype(int)] = rows[:,1]
+        mass = lookup[types]
+    lengths = bounds[:,1] - bounds[:,0]
+    atoms = Atoms.from_arrays(pos[order] - bounds[:,0],vel,groups=types,mass=mass,
+                              charges=q[order] if q is not None else None)
+    if np.any(tilt):
+        cell = np.array([[lengths[0],0,0],[tilt[0],lengths[1],0],[tilt[1],tilt[2],lengths[2]]])
+    else:
+        cell = lengths
+    return atoms,cell
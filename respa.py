@@ -0,0 +1,172 @@
+#Reversible multiple time step (r-RESPA) integrator
+#The pair potential is split with a smooth switch S(r) into a fast part S*U, which holds the
+#stiff short-range repulsion, the close Coulomb pairs and the bonded terms, and a slow part (1-S)*U plus the PME
+#reciprocal-space term. The slow forces are applied as half kicks at the start and end of each
+#outer step, and the fast forces drive velocity Verlet inner steps in between
+#(Tuckerman, Berne and Martyna, J. Chem. Phys. 97, 1990 (1992)).
+import numpy as np
+from bc import bc, pbc
+from bonded import bonded_calc, exclusion_correction, has_topology
+from neighbour import NeighbourList
+from nonbonded import pair_terms, accumulate, switch
+from profiling import NULL_PROFILER
+from vel_rescaling import thermostat, kE_calc
+
+class RESPA:
+    '''
+    r-RESPA integrator. Each call advances the system by one outer step dt, made of
+    nsteps inner steps of dt/nsteps with the fast forces. The slow forces (the switched
+    pair tail and the PME reciprocal part) are evaluated once per outer step.
+    Attributes:
+        nsteps (int): Number of inner steps per outer step.
+        inner_cutoff (float): Distance beyond which the pair interaction is entirely slow.
+        switch_width (float): Width of the switching region below inner_cutoff.
+        inner (class NeighbourList): Neighbour list for the fast forces.
+        outer (class NeighbourList): Neighbour list for the slow forces, up to the full cutoff.
+        nfast (int): Number of fast force evaluations.
+        nslow (int): Number of slow force evaluations.
+    '''
+    def __init__(self,cutoff,nsteps=4,inner_cutoff=None,switch_width=1.0,skin=0.3,periodic=False,dtype=np.float64):
+        if inner_cutoff is None:
+            inner_cutoff = cutoff
+        if not 0 < inner_cutoff <= cutoff:
+            raise ValueError('inner_cutoff must be between 0 and the cutoff')
+        self.nsteps = nsteps
+        self.inner_cutoff = inner_cutoff
+        self.switch_width = min(switch_width,inner_cutoff)
+        self.inner = NeighbourList(inner_cutoff,skin,periodic=periodic,dtype=dtype)
+        self.outer = NeighbourList(cutoff,skin,periodic=periodic,dtype=dtype)
+        self.nfast = 0
+        self.nslow = 0
+        self._fast = None
+        self._slow = None
+
+    def fast_forces(self,Atoms,sigma,epsilon,charges,cell,coul=True,ewald=None,profiler=NULL_PROFILER,table=None):
+        '''
+        Forces, energies and virial of the switched short-range part S*U and of the bonded terms.
+        '''
+        with profiler.timer('neighbour'):
+            i,j,r,dr = self.inner.pairs(Atoms,cell)
+        with profiler.timer('nonbonded'):
+            energy,f_over_r = pair_terms(Atoms,sigma,epsilon,charges,i,j,r,coul=coul,ewald=ewald,table=table)
+            S,dS = switch(r,self.inner_cutoff,self.switch_width)
+            fast = accumulate(Atoms,i,j,dr,S*energy,S*f_over_r - dS*energy/r)
+        profiler.count('pair_interactions',len(i))
+        if has_topology(Atoms):
+            with profiler.timer('bonded'):
+                bonded = bonded_calc(Atoms,cell,periodic=self.inner.periodic)
+                fast = tuple(a + b for a,b in zip(fast,bonded))
+        self.nfast += 1
+        return fast
+
+    def slow_forces(self,Atoms,sigma,epsilon,charges,cell,coul=True,ewald=None,profiler=NULL_PROFILER,table=None):
+        '''
+        Forces, energies and virial of the remaining part (1-S)*U and of the PME reciprocal term.
+        '''
+        with profiler.timer('neighbour'):
+            i,j,r,dr = self.outer.pairs(Atoms,cell)
+            #pairs well inside the switch have no slow part
+            keep = r > self.inner_cutoff - self.switch_width
+            i,j,r,dr = i[keep],j[keep],r[keep],dr[keep]
+        with profiler.timer('nonbonded'):
+            energy,f_over_r = pair_terms(Atoms,sigma,epsilon,charges,i,j,r,coul=coul,ewald=ewald,table=table)
+            S,dS = switch(r,self.inner_cutoff,self.switch_width)
+            forces,energies,virial = accumulate(Atoms,i,j,dr,(1.0-S)*energy,(1.0-S)*f_over_r + dS*energy/r)
+        profiler.count('pair_interactions',len(i))
+        if coul == True and ewald is not None:
+            with profiler.timer('pme'):
+                reciprocal = ewald.reciprocal(Atoms,cell)
+                forces = forces + reciprocal[0]
+                energies = energies + reciprocal[1]
+                virial = virial + reciprocal[2]
+                if len(Atoms.exclusions()):
+                    correction = exclusion_correction(Atoms,charges,ewald,cell)
+                    forces = forces + correction[0]
+                    energies = energies + correction[1]
+                    virial = virial + correction[2]
+        self.nslow += 1
+        return forces,energies,virial
+
+    def _store(self,Atoms):
+        #the total force, energy and virial, as set by verlet.force_calc
+        Atoms.force[:] = self._fast[0] + self._slow[0]
+        Atoms.pE[:] = self._fast[1] + self._slow[1]
+        Atoms.virial = self._fast[2] + self._slow[2]
+        Atoms.accel[:] = Atoms.force/Atoms.mass[:,np.newaxis]
+
+    def step(self,Atoms,sigma,epsilon,charges,dt,temp_bath,cell,coul=True,boundary='reflective',ewald=None,
+             profiler=NULL_PROFILER,table=None):
+        '''
+        Advances the system by one outer step.
+        Args:
+            Atoms (class Atoms): Array of atoms.
+            sigma (ndarray (ntypes,ntypes)): Array of species pair sigma values.
+            epsilon (ndarray (ntypes,ntypes)): Array of species pair epsilon values.
+            charges (ndarray (ntypes,ntypes)): Array of species pair charges.
+            dt (float): Outer timestep.
+            temp_bath (float): Temperature of the thermostat.
+            cell (ndarray): Simulation cell size.
+            coul (bool): Include the Coulomb interaction.
+            boundary (str): 'reflective' walls or 'periodic' boundary conditions.
+            ewald (class PME): Long-range electrostatics, None for plain cutoff Coulomb.
+            profiler (class Profiler): Collects phase timings and counters.
+            table (class PairTable): Tabulated potential used instead of the Lennard-Jones formula.
+        Returns:
+            Atoms (class Atoms): Atoms with updated positions, velocities, forces and energies.
+        '''
+        args = (Atoms,sigma,epsilon,charges,cell,coul,ewald,profiler,table)
+        if table is not None:
+            table.check_cutoff(self.outer.cutoff)
+        if self._fast is None:
+            self._fast = self.fast_forces(*args)
+            self._slow = self.slow_forces(*args)
+        inv_mass = 1.0/Atoms.mass[:,np.newaxis]
+        h = dt/self.nsteps
+        with profiler.timer('update'):
+            Atoms.vel += 0.5*dt*self._slow[0]*inv_mass
+        for _ in range(self.nsteps):
+            with profiler.timer('update'):
+                Atoms.vel += 0.5*h*self._fast[0]*inv_mass
+                Atoms.pos += h*Atoms.vel
+            with profiler.timer('boundary'):
+                if boundary == 'periodic':
+                    pbc(Atoms,cell)
+                else:
+                    bc(Atoms,cell)
+            self._fast = self.fast_forces(*args)
+            with profiler.timer('update'):
+                Atoms.vel += 0.5*h*self._fast[0]*inv_mass
+        self._slow = self.slow_forces(*args)
+        with profiler.timer('update'):
+            Atoms.vel += 0.5*dt*self._slow[0]*inv_mass
+            self._store(Atoms)
+        with profiler.timer('thermostat'):
+            if temp_bath > 0:
+                Atoms = thermostat(Atoms,temp_bath)
+            else:
+                kE_calc(Atoms)
+        return Atoms
+
+    def state(self):
+        '''
+        Arrays needed to continue exactly where the integrator left off, e.g. after a restart.
+        '''
+        state = {'split':np.array([self.inner_cutoff,self.switch_width])}
+        if self._fast is not None:
+            for name,part in (('fast',self._fast),('slow',self._slow)):
+                state[name+'_force'],state[name+'_energy'],state[name+'_virial'] = part
+        for name,nlist in (('inner',self.inner),('outer',self.outer)):
+            state.update({name+'_'+key:value for key,value in nlist.state().items()})
+        return state
+
+    def restore(self,state):
+        '''
+        Restores an integrator saved with state(). Forces saved with a different split
+        are ignored and recalculated on the next step.
+        '''
+        split = np.array([self.inner_cutoff,self.switch_width])
+        if 'fast_force' in state and np.array_equal(state['split'],split):
+            self._fast = tuple(state['fast_'+key] for key in ('force','energy','virial'))
+            self._slow = tuple(state['slow_'+key] for key in ('force','energy','virial'))
+        for name,nlist in (('inner',self.inner),('outer',self.outer)):
+            nlist.restore({key[len(name)+1:]:value for key,value in state.items() if key.startswith(name+'_')})
@@ -0,0 +1,49 @@
+#Scheduling of strided actions
+#Output, analysis and the thermostat are done every so many steps. With adaptive time steps the
+#steps have different lengths, so the strides count simulated time instead of steps.
+import numpy as np
+
+class Schedule:
+    '''
+    Decides when strided actions are due. Without dt the strides count steps; with dt they
+    count multiples of dt of simulated time from start, and an action is done on the first
+    step that reaches each multiple.
+    Attributes:
+        dt (float): Time per stride unit, None to count steps.
+        start (float): Time the strides are counted from.
+        resume (float): Time of the last step done before the checkpoint a restarted run continues
+            from, None for a new run.
+    '''
+    def __init__(self,dt=None,start=0.0,resume=None):
+        self.dt = dt
+        self.start = start
+        self.resume = resume
+        self._last = {}
+
+    def _index(self,stride,t):
+        #small tolerance so that times that are multiples of the interval up to round-off count as reached
+        return int(np.floor((t - self.start)/(stride*self.dt) + 1e-9))
+
+    def due(self,name,stride,step,t):
+        '''
+        Checks whether the action called name is due.
+        Args:
+            name (str): Name of the action, each has its own record of when it was last done.
+            stride (int): Steps (or multiples of dt) between actions, 0 to disable.
+            step (int): Step number.
+            t (float): Simulated time.
+        Returns:
+            due (bool): True if the action should be done now.
+        '''
+        if not stride:
+            return False
+        if self.dt is None:
+            return step % stride == 0
+        if name not in self._last:
+            #a restarted run has already done the actions up to the checkpoint
+            self._last[name] = self._index(stride,self.resume) if self.resume is not None else -1
+        index = self._index(stride,t)
+        if index > self._last[name]:
+            self._last[name] = index
+            return True
+        return False
@@ -0,0 +1,175 @@
+#Tabulated pair potentials
+#The energy of each pair of groups is stored on a grid uniform in r^2 (so no square root is
+#needed to find a pair's grid point) together with its slope dE/d(r^2). Pairs are evaluated
+#with cubic Hermite interpolation, and the force is the exact derivative of the interpolated
+#energy, so the tabulated potential conserves energy like an analytic one.
+#Any potential can be tabulated, from a function of r or from arrays of values, and the
+#cutoff can be applied as a plain truncation, an energy shift, a force shift or a switch.
+import numpy as np
+from lennard_jones import pairwise_calc
+from nonbonded import switch
+
+MODIFIERS = ('none','shift','shift-force','switch')
+
+class PairTable:
+    '''
+    Tabulated short-range pair potential for every pair of groups. It replaces the
+    Lennard-Jones part of the nonbonded kernel; the Coulomb part is unchanged.
+    Attributes:
+        groups (list): The group labels, in the order of Atoms.groups.
+        cutoff (float): The potential is zero beyond the cutoff.
+        r_min (float): Start of the grid. Closer pairs continue linearly in r^2 with the slope at r_min.
+        npoints (int): Number of grid points.
+        modifier (str): Cutoff treatment: 'none' (truncation), 'shift' (energy goes to zero at the
+            cutoff), 'shift-force' (energy and force go to zero) or 'switch' (smoothly switched off
+            over switch_width below the cutoff).
+        switch_width (float): Width of the switching region.
+        energy (ndarray (ntypes,ntypes,npoints)): Energy at each grid point.
+        slope (ndarray (ntypes,ntypes,npoints)): dE/d(r^2) at each grid point.
+    '''
+    def __init__(self,groups,cutoff,r_min=0.5,npoints=4096,modifier='shift-force',switch_width=1.0):
+        if modifier not in MODIFIERS:
+            raise ValueError(f'unknown cutoff modifier: {modifier}')
+        n = len(groups)
+        self.groups = list(groups)
+        self.cutoff = cutoff
+        self.r_min = r_min
+        self.npoints = npoints
+        self.modifier = modifier
+        self.switch_width = switch_width
+        self.r2 = np.linspace(r_min*r_min,cutoff*cutoff,npoints)
+        self.h = self.r2[1] - self.r2[0]
+        self.energy = np.zeros((n,n,npoints))
+        self.slope = np.zeros((n,n,npoints))
+
+    def check_cutoff(self,cutoff):
+        '''
+        Checks the table against the cutoff of the pair search. Pairs beyond the pair cutoff are
+        never evaluated, so a table that reaches further is truncated before its cutoff modifier
+        takes it to zero, which leaves a jump in the energy.
+        Args:
+            cutoff (float): Cutoff distance of the pair search.
+        '''
+        if self.cutoff > cutoff:
+            raise ValueError(f'the table cutoff ({self.cutoff}) must not exceed the pair cutoff ({cutoff})')
+
+    def set(self,a,b,potential,r=None):
+        '''
+        Tabulates the potential between groups a and b (and b and a).
+        Args:
+            a, b: Group labels.
+            potential: Either a function of r returning the energy, or a tuple (energy, force)
+                where force = -dE/dr, or arrays of these values at the distances r.
+            r (ndarray): Distances of the given arrays, None if potential is a function.
+        '''
+        grid = np.sqrt(self.r2)
+        if r is None:
+            values = potential(grid)
+        else:
+            values = potential
+        if isinstance(values,tuple):
+            energy,force = values
+        else:
+            energy,force = values,None
+        if r is not None:
+            energy = np.interp(grid,r,energy)
+            force = np.interp(grid,r,force) if force is not None else None
+        energy = np.array(energy,dtype=float)
+        if force is None:
+            force = -np.gradient(energy,grid)
+        energy,force = self._modify(grid,energy,np.array(force,dtype=float))
+        ia,ib = self.groups.index(a),self.groups.index(b)
+        for x,y in ((ia,ib),(ib,ia)):
+            self.energy[x,y] = energy
+            self.slope[x,y] = -0.5*force/grid #dE/d(r^2) = -F/(2r)
+        return self
+
+    def _modify(self,r,energy,force):
+        if self.modifier == 'shift':
+            energy = energy - energy[-1]
+        elif self.modifier == 'shift-force':
+            energy = energy - energy[-1] + (r - self.cutoff)*force[-1]
+            force = force - force[-1]
+        elif self.modifier == 'switch':
+            S,dS = switch(r,self.cutoff,self.switch_width)
+            energy,force = S*energy,S*force - dS*energy
+        return energy,force
+
+    def evaluate(self,ti,tj,r):
+        '''
+        Energy and force of each pair.
+        Args:
+            ti (ndarray): Type index of the first atom of each pair.
+            tj (ndarray): Type index of the second atom of each pair.
+            r (ndarray): Distance between the atoms of each pair.
+        Returns:
+            energy (ndarray): Pair energy.
+            f_over_r (ndarray): Pair force magnitude divided by r.
+        '''
+        x = r*r
+        u = (x - self.r2[0])/self.h
+        index = np.clip(u.astype(int),0,self.npoints-2)
+        t = u - index
+        flat = (ti*len(self.groups) + tj)*self.npoints + index
+        E0,E1 = self.energy.ravel()[flat],self.energy.ravel()[flat+1]
+        m0,m1 = self.h*self.slope.ravel()[flat],self.h*self.slope.ravel()[flat+1]
+        t2 = t*t
+        t3 = t2*t
+        energy = (2*t3 - 3*t2 + 1)*E0 + (t3 - 2*t2 + t)*m0 + (3*t2 - 2*t3)*E1 + (t3 - t2)*m1
+        dE_dx = ((6*t2 - 6*t)*(E0 - E1) + (3*t2 - 4*t + 1)*m0 + (3*t2 - 2*t)*m1)/self.h
+        #below r_min continue along the slope at the first grid point, beyond the cutoff the potential is 0
+        below = u < 0
+        energy = np.where(below,E0 + u*m0,energy)
+        dE_dx = np.where(below,m0/self.h,dE_dx)
+        outside = x > self.r2[-1]
+        energy[outside] = 0.0
+        dE_dx[outside] = 0.0
+        return energy,-2.0*dE_dx
+
+def lennard_jones(sigma,epsilon):
+    '''
+    Lennard-Jones potential 4*epsilon*((sigma/r)^12 - (sigma/r)^6) as a function for PairTable.set.
+    '''
+    def potential(r):
+        s6 = (sigma/r)**6
+        return 4*epsilon*s6*(s6 - 1.0),24*epsilon*s6*(2*s6 - 1.0)/r
+    return potential
+
+def buckingham(A,rho,C):
+    '''
+    Buckingham potential A*exp(-r/rho) - C/r^6 as a function for PairTable.set.
+    '''
+    def potential(r):
+        return A*np.exp(-r/rho) - C/r**6,A/rho*np.exp(-r/rho) - 6*C/r**7
+    return potential
+
+def morse(D,a,r0):
+    '''
+    Morse potential D*(1 - exp(-a*(r-r0)))^2 - D as a function for PairTable.set.
+    '''
+    def potential(r):
+        e = np.exp(-a*(r - r0))
+        return D*(1.0 - e)**2 - D,-2*D*a*e*(1.0 - e)
+    return potential
+
+def lennard_jones_table(Atoms,cutoff,r_min=None,npoints=4096,modifier='shift-force',switch_width=1.0):
+    '''
+    Tabulates the Lennard-Jones potential of every pair of groups from the species sigma and epsilon.
+    Args:
+        Atoms (class Atoms): Array of atoms.
+        cutoff (float): Cutoff distance for the potential.
+        r_min (float): Start of the grid, a third of the smallest sigma if None.
+        npoints (int): Number of grid points.
+        modifier (str): Cutoff treatment, see PairTable.
+        switch_width (float): Width of the switching region.
+    Returns:
+        table (class PairTable): The tabulated potential.
+    '''
+    sigma,epsilon = pairwise_calc(Atoms)
+    if r_min is None:
+        r_min = np.nanmin(sigma)/3
+    table = PairTable(Atoms.groups,cutoff,r_min,npoints,modifier,switch_width)
+    for a,ga in enumerate(Atoms.groups):
+        for b,gb in enumerate(Atoms.groups[:a+1]):
+            table.set(ga,gb,lennard_jones(sigma[a,b],epsilon[a,b]))
+    return table
@@ -0,0 +1,43 @@
+import numpy as np
+from analysis import MSD, RDF, VACF
+from atoms import Atoms, species
+from lattice import fcc
+from MD import run
+
+def test_correlation_single_lag():
+    lattice,cell = fcc(2,5.0)
+    for analyser in (MSD(nlags=1),VACF(nlags=1)):
+        for step in range(4):
+            lattice.pos += 0.1
+            analyser.sample(lattice,0.01*step,cell)
+        lag,values = analyser.result()
+        assert len(lag) == 1
+
+def test_msd_uneven_samples():
+    lattice,cell = fcc(2,5.0)
+    start = lattice.pos.copy()
+    msd = MSD(nlags=5,dt=0.01)
+    t = 0.0
+    rng = np.random.default_rng(0)
+    for step in range(100):
+        lattice.pos[:] = start + np.array([1.0,0.0,0.0])*t #unit speed along x
+        msd.sample(lattice,t,cell)
+        t += 0.01 + rng.uniform(-0.002,0.002)
+    lag,values = msd.result()
+    np.testing.assert_allclose(values[2:],lag[2:]**2,rtol=0.05)
+
+def test_rdf_reflective_run_matches_sampled_positions(tmp_path):
+    rng = np.random.default_rng(0)
+    pos = rng.uniform(1.0,9.0,(20,3))
+    vel = rng.normal(0.0,1.0,(20,3))
+    #half of the atoms cross a wall during the step, so the boundary moves them after the forces
+    pos[:10,0] = 0.01
+    vel[:10,0] = -20.0
+    system = Atoms.from_arrays(pos,vel,groups=['Ar']*20)
+    species(Atoms=system,group='Ar',symbol='Ar',mass=39.95,charge=0.0,epsilon=0.0104,sigma=1.0)
+    rdf = RDF(4.0,nbins=40)
+    cell = np.array([10.0,10.0,10.0])
+    run(system,0,0.01,cell,0.01,0,4.0,str(tmp_path),coul=False,console_stride=0,analysers=[rdf])
+    reference = RDF(4.0,nbins=40)
+    reference.sample(system,0.0,cell)
+    np.testing.assert_array_equal(rdf.counts,reference.counts)
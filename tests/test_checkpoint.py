@@ -0,0 +1,34 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from benchmarks.systems import charged_mixture
+from checkpoint import ARRAYS
+from MD import run
+
+DT = 0.002
+STEPS = 20
+
+def simulate(path,end,**kwargs):
+    Atoms,cell = charged_mixture(64)
+    run(Atoms,0,end,cell,DT,300.0,6.0,str(path),boundary='periodic',long_range=True,console_stride=0,**kwargs)
+    return Atoms
+
+@pytest.mark.parametrize('respa_steps',[1,2])
+def test_restart_is_bit_exact(tmp_path,respa_steps):
+    reference = simulate(tmp_path/'reference',STEPS*DT,respa_steps=respa_steps)
+    #stop half way, then continue from the checkpoint written there
+    simulate(tmp_path/'restarted',STEPS//2*DT,checkpoint_stride=STEPS//2,respa_steps=respa_steps)
+    checkpoint = os.path.join(tmp_path,'restarted','outdir','checkpoint.npz')
+    shutil.copy(checkpoint,os.path.join(tmp_path,'halfway.npz'))
+    restarted = simulate(tmp_path/'restarted',STEPS*DT,restart=os.path.join(tmp_path,'halfway.npz'),
+                         respa_steps=respa_steps)
+    for name in ARRAYS:
+        np.testing.assert_array_equal(getattr(restarted,name),getattr(reference,name))
+    np.testing.assert_array_equal(restarted.virial,reference.virial)
+    #the outputs are cut back to the checkpoint and continued, so they match the uninterrupted run
+    for name in ('output.xyz','energy.txt'):
+        with open(tmp_path/'reference'/'outdir'/name) as file:
+            expected = file.read()
+        with open(tmp_path/'restarted'/'outdir'/name) as file:
+            assert file.read() == expected
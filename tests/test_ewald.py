@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from bc import cell_matrix
+from benchmarks.systems import charged_mixture
+from constants import k
+from ewald import PME
+
+def direct_reciprocal(Atoms,cell,alpha):
+    '''
+    Reciprocal-space Ewald forces and energy summed directly over the reciprocal vectors.
+    '''
+    h = cell_matrix(cell)
+    recip = np.linalg.inv(h).T
+    volume = abs(np.linalg.det(h))
+    n = int(np.ceil(alpha*np.max(np.linalg.norm(h,axis=1))*np.sqrt(40.0)/np.pi))
+    grid = np.arange(-n,n+1)
+    m = np.stack(np.meshgrid(grid,grid,grid,indexing='ij'),axis=-1).reshape(-1,3)
+    m = m[np.any(m != 0,axis=1)] @ recip
+    m2 = np.sum(m*m,axis=1)
+    factor = np.exp(-np.pi**2*m2/alpha**2)/m2
+    q = Atoms.charges
+    phase = np.exp(2j*np.pi*(Atoms.pos @ m.T))
+    S = q @ phase
+    energy = k/(2*np.pi*volume)*np.sum(factor*np.abs(S)**2) - k*alpha/np.sqrt(np.pi)*np.sum(q*q)
+    forces = 2*k/volume*q[:,np.newaxis]*(np.imag(phase*np.conj(S)) @ (factor[:,np.newaxis]*m))
+    return forces,energy
+
+@pytest.mark.parametrize('accuracy',[1e-4,1e-5])
+def test_pme_matches_direct_ewald(accuracy):
+    Atoms,cell = charged_mixture(128)
+    pme = PME(8.0,cell,accuracy=accuracy)
+    forces,energies,_ = pme.reciprocal(Atoms,cell)
+    reference,energy = direct_reciprocal(Atoms,cell,pme.alpha)
+    error = np.sqrt(np.mean(np.sum((forces - reference)**2,axis=1))/np.mean(np.sum(reference**2,axis=1)))
+    #the tuned grid meets the target without being far finer than needed
+    assert accuracy/20 < error <= accuracy
+    assert np.sum(energies) == pytest.approx(energy,rel=10*accuracy)
+
+def test_pme_error_falls_with_grid():
+    Atoms,cell = charged_mixture(128)
+    pme = PME(8.0,cell,accuracy=1e-5)
+    reference,_ = direct_reciprocal(Atoms,cell,pme.alpha)
+    errors = []
+    for K in (16,24,32):
+        forces = PME(8.0,cell,alpha=pme.alpha,grid=[K]*3).reciprocal(Atoms,cell)[0]
+        errors.append(np.max(np.abs(forces - reference)))
+    assert errors[0] > errors[1] > errors[2]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from benchmarks.systems import charged_mixture
+from coulomb import pairwise_charges
+from ewald import PME
+from lennard_jones import pairwise_calc
+from neighbour import NeighbourList
+from parallel import ParallelForces
+from tiled import TiledForces
+from verlet import force_calc
+
+CUTOFF = 6.0
+
+def charged_system(bonded):
+    Atoms,cell = charged_mixture(128)
+    if bonded:
+        #the bonded pairs are excluded from the pair forces and corrected in the PME sum
+        Atoms.add_bonds([[0,1],[2,3],[4,5]],1.0,3.0)
+    return Atoms,cell
+
+def evaluate(Atoms,cell,periodic,ewald,parallel=None):
+    sigma,epsilon = pairwise_calc(Atoms)
+    charges = pairwise_charges(Atoms)
+    nlist = NeighbourList(CUTOFF,periodic=periodic)
+    force_calc(Atoms,sigma,epsilon,charges,nlist,cell,ewald=ewald,parallel=parallel)
+    return Atoms.force.copy(),Atoms.pE.copy(),Atoms.virial.copy()
+
+def pair_forces(kind,Atoms,periodic,ewald):
+    sigma,epsilon = pairwise_calc(Atoms)
+    charges = pairwise_charges(Atoms)
+    if kind == 'parallel':
+        return ParallelForces(Atoms,sigma,epsilon,charges,CUTOFF,periodic=periodic,nworkers=3,ewald=ewald)
+    return TiledForces(Atoms,sigma,epsilon,charges,CUTOFF,periodic=periodic,ewald=ewald,memory=2**16)
+
+@pytest.mark.parametrize('kind',['parallel','tiled'])
+@pytest.mark.parametrize('periodic',[True,False])
+@pytest.mark.parametrize('bonded',[False,True])
+def test_pair_forces_match_serial(kind,periodic,bonded):
+    Atoms,cell = charged_system(bonded)
+    ewald = PME(CUTOFF,cell) if periodic else None
+    reference = evaluate(Atoms,cell,periodic,ewald)
+    evaluator = pair_forces(kind,Atoms,periodic,ewald)
+    try:
+        #a second call reuses the workers' pair lists
+        for _ in range(2):
+            result = evaluate(Atoms,cell,periodic,ewald,parallel=evaluator)
+            for values,expected in zip(result,reference):
+                #only the summation order differs from the serial path
+                np.testing.assert_allclose(values,expected,rtol=1e-10,atol=1e-12)
+    finally:
+        evaluator.close()
+    assert evaluator.npairs > 0
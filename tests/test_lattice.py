@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+from lattice import random_packing
+from neighbour import cell_pairs
+
+def test_random_packing_near_rsa_limit():
+    #random sequential addition jams at about 350 atoms of diameter 2.5 in this cell
+    cell = np.array([20.0,20.0,20.0])
+    for seed in (0,2):
+        Atoms,cell = random_packing(330,cell,2.5,seed=seed)
+        assert Atoms.natoms == 330
+        i,j = cell_pairs(Atoms.pos,cell,2.5,periodic=True)
+        assert len(i) == 0
+
+def test_random_packing_impossible():
+    with pytest.raises(ValueError):
+        random_packing(1000,np.array([10.0,10.0,10.0]),2.5,seed=0,max_tries=5)
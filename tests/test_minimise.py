@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from atoms import Atoms, species
+from coulomb import pairwise_charges
+from lattice import fcc
+from lennard_jones import pairwise_calc
+from minimise import minimise
+from neighbour import NeighbourList
+
+def lj_cluster():
+    #13 atoms cut from a jiggled fcc lattice, in the middle of a large box
+    lattice,_ = fcc(2,5.3)
+    pos = lattice.pos[:13] + np.random.default_rng(3).normal(0.0,0.2,(13,3)) + 5.0
+    cluster = Atoms.from_arrays(pos,groups=['Ar']*13)
+    species(Atoms=cluster,group='Ar',symbol='Ar',mass=39.95,charge=0.0,epsilon=0.0104,sigma=3.4)
+    return cluster,np.array([20.0,20.0,20.0])
+
+def relax(method):
+    cluster,cell = lj_cluster()
+    sigma,epsilon = pairwise_calc(cluster)
+    charges = pairwise_charges(cluster)
+    return minimise(cluster,sigma,epsilon,charges,NeighbourList(8.0),cell,coul=False,method=method,
+                    ftol=1e-3,etol=1e-12,max_steps=2000)
+
+@pytest.mark.parametrize('method',['fire','cg'])
+def test_minimiser_converges(method):
+    cluster,info = relax(method)
+    assert info['converged']
+    assert info['fmax'] < 1e-3
+    assert np.max(np.linalg.norm(cluster.force,axis=1)) < 1e-3
+
+def test_cg_needs_fewer_evaluations_than_fire():
+    _,fire = relax('fire')
+    _,cg = relax('cg')
+    assert cg['converged']
+    assert cg['evaluations'] < fire['evaluations']
+    assert cg['energy'] == pytest.approx(fire['energy'],abs=1e-3)
@@ -0,0 +1,53 @@
+import itertools
+import numpy as np
+import pytest
+from atoms import Atoms
+from bc import cell_matrix
+from neighbour import NeighbourList, cell_pairs
+
+CELLS = {
+    'orthorhombic':np.array([14.0,12.0,16.0]),
+    'triclinic':np.array([[14.0,0.0,0.0],[3.0,12.0,0.0],[-2.5,4.0,13.0]]),
+}
+
+def brute_force_pairs(pos,cell,rcut,periodic):
+    '''
+    All pairs (i<j) closer than rcut, checking every periodic image of every pair.
+    '''
+    i,j = np.triu_indices(len(pos),k=1)
+    dr = pos[i] - pos[j]
+    if periodic:
+        shifts = np.array(list(itertools.product(range(-1,2),repeat=3))) @ cell_matrix(cell)
+        r = np.min(np.linalg.norm(dr[:,None,:] + shifts[None,:,:],axis=2),axis=1)
+    else:
+        r = np.linalg.norm(dr,axis=1)
+    keep = r < rcut
+    return set(zip(i[keep],j[keep]))
+
+def random_atoms(cell,natoms,seed=0):
+    frac = np.random.default_rng(seed).uniform(0.0,1.0,(natoms,3))
+    return frac @ cell_matrix(cell)
+
+@pytest.mark.parametrize('shape',CELLS)
+@pytest.mark.parametrize('periodic',[True,False])
+@pytest.mark.parametrize('rcut',[3.5,5.7]) #5.7 leaves only 2 grid cells along each axis
+def test_cell_pairs_match_brute_force(shape,periodic,rcut):
+    cell = CELLS[shape]
+    pos = random_atoms(cell,300)
+    i,j = cell_pairs(pos,cell,rcut,periodic)
+    found = list(zip(i,j))
+    assert len(found) == len(set(found)) #no pair is listed twice
+    assert set(found) == brute_force_pairs(pos,cell,rcut,periodic)
+
+@pytest.mark.parametrize('shape',CELLS)
+def test_verlet_list_stays_complete_within_skin(shape):
+    cell = CELLS[shape]
+    rng = np.random.default_rng(1)
+    system = Atoms.from_arrays(random_atoms(cell,300),groups=['Ar']*300)
+    nlist = NeighbourList(4.0,skin=0.6,periodic=True)
+    for _ in range(5):
+        i,j,r,_ = nlist.pairs(system,cell)
+        assert set(zip(i,j)) == brute_force_pairs(system.pos,cell,4.0+1e-12,True)
+        #every atom moves less than half the skin in total, so the list is never rebuilt
+        system.pos += rng.uniform(-0.05,0.05,system.pos.shape)
+    assert nlist.nbuilds == 1
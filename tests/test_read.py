@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from read import read_lammps_data
+
+DATA = '''LAMMPS data file
+
+2 atoms
+2 atom types
+
+0.0 10.0 xlo xhi
+0.0 10.0 ylo yhi
+0.0 10.0 zlo zhi
+
+Masses
+
+1 12.0
+2 1.0
+
+Atoms{}
+
+{}
+'''
+
+def write(tmp_path,hint,rows):
+    filename = tmp_path/'data.lmp'
+    filename.write_text(DATA.format(hint,rows))
+    return str(filename)
+
+def test_style_hint_molecular(tmp_path):
+    #6 columns would be guessed as charge without the hint
+    atoms,cell = read_lammps_data(write(tmp_path,' # molecular','1 7 2 1.0 2.0 3.0\n2 7 1 4.0 5.0 6.0'))
+    assert atoms.groups == [2,1]
+    assert np.all(np.isnan(atoms.charges))
+    np.testing.assert_allclose(atoms.pos,[[1.0,2.0,3.0],[4.0,5.0,6.0]])
+    np.testing.assert_allclose(atoms.mass,[1.0,12.0])
+
+def test_style_from_columns(tmp_path):
+    atoms,cell = read_lammps_data(write(tmp_path,'','1 2 0.5 1.0 2.0 3.0\n2 1 -0.5 4.0 5.0 6.0'))
+    np.testing.assert_allclose(atoms.charges,[0.5,-0.5])
+
+def test_unsupported_style(tmp_path):
+    with pytest.raises(ValueError):
+        read_lammps_data(write(tmp_path,' # ellipsoid','1 2 1 1.0 1.0 2.0 3.0\n2 1 1 1.0 4.0 5.0 6.0'))
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from lattice import fcc
+from MD import run
+from lennard_jones import pairwise_calc
+from coulomb import pairwise_charges
+from atoms import species
+from respa import RESPA
+from tabulated import lennard_jones_table
+from tiled import TiledForces
+
+def lj_crystal():
+    Atoms,cell = fcc(3,5.26,group='Ar')
+    species(Atoms=Atoms,group='Ar',symbol='Ar',mass=39.95,charge=0.0,epsilon=0.0104,sigma=3.4)
+    return Atoms,cell
+
+def test_table_cutoff_beyond_pair_cutoff():
+    Atoms,cell = lj_crystal()
+    sigma,epsilon = pairwise_calc(Atoms)
+    charges = pairwise_charges(Atoms)
+    table = lennard_jones_table(Atoms,7.0)
+    with pytest.raises(ValueError):
+        TiledForces(Atoms,sigma,epsilon,charges,6.0,periodic=True,table=table)
+    with pytest.raises(ValueError):
+        RESPA(6.0,2,periodic=True).step(Atoms,sigma,epsilon,charges,0.002,0,cell,boundary='periodic',table=table)
+    #a table that ends at or inside the pair cutoff is fine
+    TiledForces(Atoms,sigma,epsilon,charges,7.0,periodic=True,table=table)
+    TiledForces(Atoms,sigma,epsilon,charges,7.5,periodic=True,table=table)
+
+def test_run_rejects_table_beyond_cutoff(tmp_path):
+    Atoms,cell = lj_crystal()
+    table = lennard_jones_table(Atoms,7.0)
+    with pytest.raises(ValueError):
+        run(Atoms,0,0.01,cell,0.002,0,6.0,str(tmp_path),coul=False,boundary='periodic',table=table)
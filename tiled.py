@@ -0,0 +1,118 @@
+#Memory-bounded all-pairs evaluation
+#When the cutoff is comparable to the cell, almost every pair interacts and a neighbour list
+#only adds overhead, while a list of all N^2/2 pairs does not fit in memory for large N.
+#Here the pairs are generated in row blocks: a block of rows i is paired with every j > i,
+#the pairs within the cutoff are passed through the usual pair kernel, and the forces and
+#energies are summed block by block. The temporaries of one block take at most the given
+#memory budget, so peak memory is O(natoms*tile) instead of O(natoms^2).
+import numpy as np
+from bc import cell_widths, minimum_image
+from nonbonded import pair_terms, accumulate
+
+PAIR_BYTES = 256 #approximate bytes of temporaries per candidate pair in a block, incl. the kernel
+
+def tile_size(natoms,memory):
+    '''
+    Number of rows per block so that one block stays within the memory budget.
+    Args:
+        natoms (int): Number of atoms.
+        memory (float): Memory budget in bytes.
+    Returns:
+        tile (int): Rows per block, at least 1.
+    '''
+    return int(max(1,min(natoms,memory//(PAIR_BYTES*max(natoms,1)))))
+
+def tiled_pairs(pos,cell,cutoff,periodic=False,tile=1024):
+    '''
+    Tiled version of lennard_jones.distance_calc: yields the unique pairs (i<j) within the
+    cutoff one row block at a time, in the same order as distance_calc.
+    Args:
+        pos (ndarray (natoms,3)): Atom positions.
+        cell (ndarray (3,) or (3,3)): Simulation cell size or lattice vectors.
+        cutoff (float): Only pairs closer than the cutoff are returned.
+        periodic (bool): Use the minimum image convention.
+        tile (int): Number of rows (atoms i) per block.
+    Yields:
+        i (ndarray): First atom index of each pair.
+        j (ndarray): Second atom index of each pair.
+        r (ndarray): Distance between the atoms of each pair.
+        dr (ndarray (npairs,3)): Vector from atom j to atom i.
+    '''
+    natoms = len(pos)
+    #coordinate-major layout, so the block arithmetic runs along the long axis instead of the axis of length 3
+    coords = np.ascontiguousarray(pos.T)
+    cell = np.asarray(cell,dtype=pos.dtype) if cell is not None else None
+    for start in range(0,natoms-1,tile):
+        stop = min(start+tile,natoms-1)
+        #rows start..stop-1 against the columns start+1..natoms-1, keeping column >= row
+        dr = coords[:,start:stop,np.newaxis] - coords[:,np.newaxis,start+1:]
+        if periodic and cell.ndim == 1:
+            lengths = cell[:,np.newaxis,np.newaxis]
+            dr -= lengths*np.round(dr/lengths)
+        elif periodic:
+            dr = np.moveaxis(minimum_image(np.moveaxis(dr,0,-1),cell),-1,0)
+        r2 = dr[0]*dr[0] + dr[1]*dr[1] + dr[2]*dr[2]
+        keep = r2 <= cutoff*cutoff
+        keep &= np.arange(natoms-start-1) >= np.arange(stop-start)[:,np.newaxis]
+        a,c = np.nonzero(keep)
+        yield start+a,start+1+c,np.sqrt(r2[a,c]),dr[:,a,c].T
+
+class TiledForces:
+    '''
+    All-pairs nonbonded forces evaluated in memory-bounded row blocks, for cutoffs comparable
+    to the cell. It has the same compute() interface as ParallelForces and is passed to
+    verlet.force_calc in its place.
+    Attributes:
+        cutoff (float): Cutoff distance for the potential.
+        periodic (bool): Use periodic boundary conditions.
+        tile (int): Rows per block, from the memory budget.
+        dtype (numpy dtype): Precision of the pair vectors and pair terms, see NeighbourList.
+        nbuilds (int): Always 0, there is no list to build.
+        npairs (int): Number of pairs within the cutoff in the last evaluation.
+    '''
+    def __init__(self,Atoms,sigma,epsilon,charges,cutoff,periodic=False,coul=True,ewald=None,table=None,
+                 memory=2**26,dtype=np.float64):
+        if table is not None:
+            table.check_cutoff(cutoff)
+        self.cutoff = cutoff
+        self.periodic = periodic
+        self.tile = tile_size(Atoms.natoms,memory)
+        self.dtype = np.dtype(dtype)
+        self.nbuilds = 0
+        self.npairs = 0
+        self._tables = (sigma,epsilon,charges)
+        self._options = {'coul':coul,'ewald':ewald,'table':table}
+
+    def compute(self,Atoms,cell):
+        '''
+        Calculates the nonbonded forces, energies and virial at the current positions.
+        Args:
+            Atoms (class Atoms): Array of atoms.
+            cell (ndarray (3,) or (3,3)): Simulation cell size or lattice vectors.
+        Returns:
+            forces (ndarray (natoms,3)): Total force on each atom.
+            energies (ndarray (natoms,)): Potential energy of each atom.
+            virial (ndarray (3,3)): Virial tensor.
+        '''
+        if self.periodic and self.cutoff > 0.5*np.min(cell_widths(cell)):
+            raise ValueError('cutoff must be at most half the cell width with periodic boundaries')
+        pos = Atoms.pos if self.dtype == Atoms.pos.dtype else Atoms.pos.astype(self.dtype)
+        exclusions = Atoms.exclusions()
+        forces = np.zeros((Atoms.natoms,3))
+        energies = np.zeros(Atoms.natoms)
+        virial = np.zeros((3,3))
+        self.npairs = 0
+        for i,j,r,dr in tiled_pairs(pos,cell,self.cutoff,self.periodic,self.tile):
+            if len(exclusions):
+                keep = ~np.isin(i*Atoms.natoms + j,exclusions)
+                i,j,r,dr = i[keep],j[keep],r[keep],dr[keep]
+            energy,f_over_r = pair_terms(Atoms,*self._tables,i,j,r,**self._options)
+            block = accumulate(Atoms,i,j,dr,energy,f_over_r)
+            forces += block[0]
+            energies += block[1]
+            virial += block[2]
+            self.npairs += len(i)
+        return forces,energies,virial
+
+    def close(self):
+        pass
@@ -0,0 +1,196 @@
+#Binary trajectory format
+#File layout (little endian):
+#  header: magic, version, natoms, float size (4 or 8), velocity flag, header size,
+#          followed by the atom symbols (8 bytes each) and padding to 64 bytes
+#  frames: fixed-size records of time (float64), cell (3x3 float64), positions and
+#          optionally velocities (natoms x 3, float32 or float64)
+#Every frame has the same size, so frame i starts at header_size + i*frame_size and
+#the whole file can be mapped with numpy.memmap without reading it.
+import os
+import sys
+import numpy as np
+from bc import cell_matrix
+
+MAGIC = b'PYMDTRAJ'
+VERSION = 1
+HEADER = np.dtype([('magic','S8'),('version','<u4'),('natoms','<u4'),('itemsize','<u4'),
+                   ('velocities','<u4'),('header_size','<u8')])
+
+def frame_dtype(natoms,itemsize,velocities):
+    '''
+    Record layout of a single frame.
+    Args:
+        natoms (int): Number of atoms.
+        itemsize (int): 4 for float32 or 8 for float64 positions/velocities.
+        velocities (bool): Whether velocities are stored.
+    Returns:
+        dtype (numpy dtype): Structured dtype of one frame.
+    '''
+    fp = '<f4' if itemsize == 4 else '<f8'
+    fields = [('time','<f8'),('cell','<f8',(3,3)),('pos',fp,(natoms,3))]
+    if velocities:
+        fields.append(('vel',fp,(natoms,3)))
+    return np.dtype(fields)
+
+def _read_header(file):
+    header = np.frombuffer(file.read(HEADER.itemsize),dtype=HEADER)[0]
+    if header['magic'] != MAGIC:
+        raise ValueError('not a binary trajectory file')
+    if header['version'] != VERSION:
+        raise ValueError(f'unsupported trajectory version {header["version"]}')
+    natoms = int(header['natoms'])
+    symbols = np.frombuffer(file.read(8*natoms),dtype='S8').astype(str)
+    return header,symbols
+
+class TrajectoryWriter:
+    '''
+    Appends frames to a binary trajectory file through a buffered handle.
+    When appending, nframes keeps only the first nframes frames of the existing file.
+    Attributes:
+        filename (str): Path of the trajectory file.
+        natoms (int): Number of atoms per frame.
+        dtype (numpy dtype): Record layout of one frame.
+        nframes (int): Number of frames in the file.
+    '''
+    def __init__(self,filename,Atoms,precision='float32',velocities=True,append=False,buffer_size=1<<20,nframes=None):
+        itemsize = np.dtype(precision).itemsize
+        self.filename = filename
+        self.natoms = Atoms.natoms
+        if append and os.path.exists(filename) and os.path.getsize(filename) > 0:
+            with open(filename,'rb') as file:
+                header,_ = _read_header(file)
+            if header['natoms'] != Atoms.natoms:
+                raise ValueError('cannot append frames with a different number of atoms')
+            header_size = int(header['header_size'])
+            self.dtype = frame_dtype(self.natoms,int(header['itemsize']),bool(header['velocities']))
+            #drop a partially written last frame, e.g. after a crash, and any frames past nframes
+            self.nframes = (os.path.getsize(filename) - header_size)//self.dtype.itemsize
+            if nframes is not None:
+                self.nframes = min(self.nframes,nframes)
+            os.truncate(filename,header_size + self.nframes*self.dtype.itemsize)
+            self._file = open(filename,'ab',buffering=buffer_size)
+        else:
+            self.dtype = frame_dtype(self.natoms,itemsize,velocities)
+            self.nframes = 0
+            symbols = np.array([str(s) for s in Atoms.symbols],dtype='S8')
+            header_size = -(-(HEADER.itemsize + symbols.nbytes)//64)*64
+            header = np.zeros(1,dtype=HEADER)
+            header[0] = (MAGIC,VERSION,self.natoms,itemsize,int(velocities),header_size)
+            self._file = open(filename,'wb',buffering=buffer_size)
+            self._file.write(header.tobytes())
+            self._file.write(symbols.tobytes())
+            self._file.write(bytes(header_size - HEADER.itemsize - symbols.nbytes))
+        self._frame = np.zeros(1,dtype=self.dtype)
+
+    def write(self,Atoms,t,cell):
+        '''
+        Appends one frame.
+        Args:
+            Atoms (class Atoms): Array of atoms.
+            t (float): The current time.
+            cell (ndarray): The cell dimensions or (3,3) lattice vectors.
+        '''
+        frame = self._frame
+        frame['time'] = t
+        frame['cell'] = cell_matrix(cell)
+        frame['pos'] = Atoms.pos
+        if 'vel' in self.dtype.names:
+            frame['vel'] = Atoms.vel
+        self._file.write(frame.tobytes())
+        self.nframes += 1
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+class Trajectory:
+    '''
+    Read-only, memory-mapped view of a binary trajectory file. Frames and per-atom
+    time series are numpy views into the file, nothing is loaded until it is used.
+    Attributes:
+        natoms (int): Number of atoms per frame.
+        symbols (ndarray (natoms,)): Atom symbols.
+        frames (numpy memmap): Structured array with fields time, cell, pos (and vel).
+    '''
+    def __init__(self,filename):
+        with open(filename,'rb') as file:
+            header,self.symbols = _read_header(file)
+        self.natoms = int(header['natoms'])
+        self.header_size = int(header['header_size'])
+        dtype = frame_dtype(self.natoms,int(header['itemsize']),bool(header['velocities']))
+        nframes = (os.path.getsize(filename) - self.header_size)//dtype.itemsize
+        self.frames = np.memmap(filename,dtype=dtype,mode='r',offset=self.header_size,shape=(nframes,))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self,index):
+        return self.frames[index]
+
+    def offset(self,index):
+        '''
+        Byte offset of a frame in the file.
+        '''
+        return self.header_size + index*self.frames.dtype.itemsize
+
+    @property
+    def times(self):
+        return self.frames['time']
+
+    def positions(self,index):
+        '''
+        Positions (natoms,3) of one frame.
+        '''
+        return self.frames['pos'][index]
+
+    def velocities(self,index):
+        '''
+        Velocities (natoms,3) of one frame.
+        '''
+        return self.frames['vel'][index]
+
+    def atom_positions(self,atom):
+        '''
+        Time series (nframes,3) of the position of one atom.
+        '''
+        return self.frames['pos'][:,atom]
+
+    def atom_velocities(self,atom):
+        '''
+        Time series (nframes,3) of the velocity of one atom.
+        '''
+        return self.frames['vel'][:,atom]
+
+def to_extxyz(filename,xyz_filename,stride=1):
+    '''
+    Converts a binary trajectory to the extended xyz format written by write.output_xyz,
+    so it can be read by ASE, OVITO, etc.
+    Args:
+        filename (str): Binary trajectory file.
+        xyz_filename (str): Output xyz file.
+        stride (int): Write every stride-th frame.
+    '''
+    from write import _row_template
+    traj = Trajectory(filename)
+    velocities = 'vel' in traj.frames.dtype.names
+    #values are written at the precision they were stored with, e.g. 12.191912 for float32
+    template = _row_template(traj.symbols,'{} {} {} {} {} {}' if velocities else '{} {} {}').replace('%r','%s')
+    with open(xyz_filename,'w',buffering=1<<20) as file:
+        for frame in traj.frames[::stride]:
+            lattice = ' '.join(str(x) for x in frame['cell'].ravel())
+            data = np.hstack([frame['pos'],frame['vel']]) if velocities else frame['pos']
+            file.write(f'{traj.natoms}\ntime = {frame["time"]} Lattice="{lattice}"\n')
+            file.write(template % tuple(data.ravel().astype(str)))
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python trajectory.py input.traj output.xyz')
+    to_extxyz(sys.argv[1],sys.argv[2])
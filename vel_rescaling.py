@@ -9,11 +9,8 @@ def kE_calc(Atoms):
     Returns:
     - Atoms (class Atoms): An object representing the atoms.
     '''
-    atom_kE = 0.5*Atoms.mass*Atoms.vel**2
-    for i in range(Atoms.natoms):
-        Atoms[i].kE = atom_kE[i]
-    Atoms.update_arr()
-    return np.sum(atom_kE)
+    Atoms.kE[:] = np.sum(0.5*Atoms.mass[:,np.newaxis]*Atoms.vel**2,axis=1)
+    return np.sum(Atoms.kE)
 
 def thermostat(Atoms,temp_bath):
     '''
@@ -27,9 +24,7 @@ def thermostat(Atoms,temp_bath):
     kE = kE_calc(Atoms)
     temp_sys = (2*kE)/(3*kb*Atoms.natoms) #system temperature using stat. mech
     scale = np.sqrt(temp_bath/temp_sys)
-    for i in range(Atoms.natoms):
-        Atoms[i].vel *= scale
-    Atoms.update_arr()
+    Atoms.vel *= scale
     kE = kE_calc(Atoms)
     return Atoms
 
@@ -1,8 +1,10 @@
 #Velocity Verlet integrator
-from bc import bc
-from lennard_jones import force, potential
+import numpy as np
+from bc import bc, pbc
+from bonded import bonded_calc, exclusion_correction, has_topology
+from nonbonded import nonbonded_calc
+from profiling import NULL_PROFILER
 from vel_rescaling import thermostat, kE_calc
-from coulomb import coulomb_force, coulomb_potential
 
 def pos_update(Atoms,dt):
     '''
@@ -13,9 +15,7 @@ def pos_update(Atoms,dt):
     Returns:
         Atoms (class Atoms): Atoms with updated positions
     '''
-    for i in range(Atoms.natoms):
-        Atoms[i].pos += Atoms[i].vel*dt + 0.5*Atoms[i].accel*dt*dt
-    Atoms.update_arr()
+    Atoms.pos += Atoms.vel*dt + 0.5*Atoms.accel*dt*dt
 
 def vel_update(Atoms,acc_old,dt):
     '''
@@ -27,9 +27,7 @@ def vel_update(Atoms,acc_old,dt):
     Returns:
         Atoms (class Atoms): Atoms with updated velocities.
     '''
-    for i in range(Atoms.natoms):
-        Atoms[i].vel += 0.5*(Atoms[i].accel + acc_old[i])*dt
-    Atoms.update_arr()
+    Atoms.vel += 0.5*(Atoms.accel + acc_old)*dt
 
 def accel_update(Atoms):
     '''
@@ -40,45 +38,100 @@ def accel_update(Atoms):
         acc_old (ndarray): Array of previous accelerations.
         Atoms (class Atoms): Atoms with updated accelerations.
     '''
-    acc_old = Atoms.accel
-    for i in range(Atoms.natoms):
-        Atoms[i].accel = Atoms[i].force/Atoms[i].mass
-    Atoms.update_arr()
+    acc_old = Atoms.accel.copy() #accel is updated in place, so keep a copy of the old values
+    Atoms.accel[:] = Atoms.force/Atoms.mass[:,np.newaxis]
     return acc_old, Atoms
 
-def integrator(Atoms,sigma,epsilon,r,r_unit,dt,temp_bath,cell,charges,cutoff,coul):
+def force_calc(Atoms,sigma,epsilon,charges,nlist,cell,coul=True,ewald=None,parallel=None,profiler=NULL_PROFILER,
+               table=None):
+    '''
+    Calculate the forces, potential energies and virial at the current positions, from the
+    pair interactions, the long-range electrostatics and the bonded terms.
+    Args:
+        Atoms (class Atoms): Array of atoms.
+        sigma (ndarray (ntypes,ntypes)): Array of species pair sigma values.
+        epsilon (ndarray (ntypes,ntypes)): Array of species pair epsilon values.
+        charges (ndarray (ntypes,ntypes)): Array of species pair charges.
+        nlist (class NeighbourList): Neighbour list holding the cutoff.
+        cell (ndarray): Simulation cell size.
+        coul (bool): Include the Coulomb interaction.
+        ewald (class PME): Long-range electrostatics, None for plain cutoff Coulomb.
+        parallel (class ParallelForces or TiledForces): Pair force evaluator used instead of nlist, None to use nlist.
+        profiler (class Profiler): Collects phase timings and counters.
+        table (class PairTable): Tabulated potential used instead of the Lennard-Jones formula.
+    Returns:
+        Atoms (class Atoms): Atoms with updated forces, potential energies and virial.
+    '''
+    if parallel is not None:
+        with profiler.timer('nonbonded'):
+            Atoms.force[:],Atoms.pE[:],Atoms.virial = parallel.compute(Atoms,cell)
+        profiler.count('pair_interactions',parallel.npairs)
+    else:
+        with profiler.timer('neighbour'):
+            i,j,r,dr = nlist.pairs(Atoms,cell)
+        with profiler.timer('nonbonded'):
+            Atoms.force[:],Atoms.pE[:],Atoms.virial = nonbonded_calc(Atoms,sigma,epsilon,charges,i,j,r,dr,coul=coul,
+                                                                       ewald=ewald,table=table)
+        profiler.count('pair_interactions',len(i))
+    if coul == True and ewald is not None:
+        with profiler.timer('pme'):
+            forces,energies,virial = ewald.reciprocal(Atoms,cell)
+            Atoms.force += forces
+            Atoms.pE += energies
+            Atoms.virial += virial
+            if len(Atoms.exclusions()):
+                forces,energies,virial = exclusion_correction(Atoms,charges,ewald,cell)
+                Atoms.force += forces
+                Atoms.pE += energies
+                Atoms.virial += virial
+    if has_topology(Atoms):
+        with profiler.timer('bonded'):
+            forces,energies,virial = bonded_calc(Atoms,cell,periodic=(parallel or nlist).periodic)
+            Atoms.force += forces
+            Atoms.pE += energies
+            Atoms.virial += virial
+    return Atoms
+
+def integrator(Atoms,sigma,epsilon,nlist,dt,temp_bath,cell,charges,coul,boundary='reflective',ewald=None,parallel=None,
+               profiler=NULL_PROFILER,table=None):
     '''
     Velocity Verlet integrator.
     Args:
         Atoms (class Atoms): Array of atoms.
-        sigma (ndarray): Array of pairwise sigma values.
-        epsilon (ndarray): Array of pairwise epsilon values.
-        r (ndarray (natoms,natoms)): Array of pairwise distances between atoms.
-        r_unit (ndarray (natoms,natoms,3)): Array of pairwise unit vectors between atoms.
+        sigma (ndarray (ntypes,ntypes)): Array of species pair sigma values.
+        epsilon (ndarray (ntypes,ntypes)): Array of species pair epsilon values.
+        nlist (class NeighbourList): Neighbour list holding the cutoff.
         dt (float): Timestep.
         temp_bath (float): Temperature of the thermostat.
         cell (ndarray): Simulation cell size.
-        charges (ndarray): Array of pairwise charges.
-        cutoff (float): Cutoff distance for the potential.
+        charges (ndarray (ntypes,ntypes)): Array of species pair charges.
+        boundary (str): 'reflective' walls or 'periodic' boundary conditions.
+        ewald (class PME): Long-range electrostatics, None for plain cutoff Coulomb.
+        parallel (class ParallelForces or TiledForces): Pair force evaluator used instead of nlist, None to use nlist.
+        profiler (class Profiler): Collects phase timings and counters.
+        table (class PairTable): Tabulated potential used instead of the Lennard-Jones formula.
     Returns:
         Atoms (class Atoms): Atoms with updated positions, velocities, and accelerations.
     '''
-    pos_update(Atoms,dt)
+    with profiler.timer('update'):
+        pos_update(Atoms,dt)
 
-    Atoms = force(Atoms,sigma,epsilon,r,r_unit,cutoff)
-    Atoms = potential(Atoms,sigma,epsilon,r,cutoff)
-
-    if coul == True:
-        Atoms = coulomb_force(Atoms,charges,r,r_unit,cutoff)
-        Atoms = coulomb_potential(Atoms,charges,r,cutoff)
-
-    acc_old, Atoms = accel_update(Atoms)
-    vel_update(Atoms,acc_old,dt)
-    if temp_bath > 0:
-        Atoms = thermostat(Atoms,temp_bath)
-    else:
-        kE_calc(Atoms)
-    Atoms = bc(Atoms,cell)
+    #forces are evaluated at the updated positions
+    Atoms = force_calc(Atoms,sigma,epsilon,charges,nlist,cell,coul=coul,ewald=ewald,parallel=parallel,profiler=profiler,
+                       table=table)
 
+    with profiler.timer('update'):
+        acc_old, Atoms = accel_update(Atoms)
+        vel_update(Atoms,acc_old,dt)
+    with profiler.timer('thermostat'):
+        if temp_bath > 0:
+            Atoms = thermostat(Atoms,temp_bath)
+        else:
+            kE_calc(Atoms)
+    with profiler.timer('boundary'):
+        if boundary == 'periodic':
+            Atoms = pbc(Atoms,cell)
+        else:
+            Atoms = bc(Atoms,cell)
 
     return Atoms
@@ -1,76 +1,231 @@
 import os
-def output_xyz(path,atom_list,t,cell):
+import numpy as np
+from bc import cell_matrix
+from schedule import Schedule
+from trajectory import TrajectoryWriter
+
+def _row_template(symbols,fields):
     '''
-    Writes the current state of the system to an xyz file using the extended xyz format
-    (see https://wiki.fysik.dtu.dk/ase/ase/io/formatoptions.html#extxyz)
+    Builds a %-format template for a whole frame, with the atom symbols filled in.
+    One template % tuple(values) call then formats every atom at once.
+    '''
+    fields = fields.replace('%','%%').replace('{}','%r')
+    return ''.join(f'{str(symbol).replace("%","%%")} {fields}\n' for symbol in symbols)
+
+def format_xyz(atom_list,t,cell,template=None):
+    '''
+    Formats the current state of the system as one extended xyz frame.
     Parameters:
-    - path (str): The path to the file.
     - atom_list (class Atoms): An object representing the atoms.
     - t (float): The current time.
-    - cell (numpy ndarray): The cell dimensions.
+    - cell (numpy ndarray): The cell dimensions or (3,3) lattice vectors.
+    - template (str): Row template from _row_template, built here if not given.
+    Returns:
+    - frame (str): The formatted frame.
+    '''
+    if template is None:
+        template = _row_template(atom_list.symbols,'{} {} {} {} {} {}')
+    lattice = ' '.join(str(x) for x in cell_matrix(cell).ravel())
+    header = f'{atom_list.natoms}\ntime = {t} Lattice="{lattice}"\n'
+    return header + template % tuple(np.hstack([atom_list.pos,atom_list.vel]).ravel().tolist())
+
+def format_energy(atom_list,t):
+    '''
+    Formats the energy of the system as one line of the energy file.
     '''
+    potential_energy = atom_list.get_potential()
+    kinetic_energy = atom_list.get_kinetic()
+    total = potential_energy + kinetic_energy
+    return f'{t},{potential_energy},{kinetic_energy},{total}\n'
+
+def format_debug(atom_list,t,template=None):
+    '''
+    Formats the current state of the system as one frame of the verbose debug file.
+    '''
+    if template is None:
+        template = _row_template(atom_list.symbols,'{} {} {}, force = [{} {} {}], velocity = [{} {} {}], accel = [{} {} {}]')
+    values = np.hstack([atom_list.pos,atom_list.force,atom_list.vel,atom_list.accel]).ravel().tolist()
+    return f'{atom_list.natoms}\ntime = {t}\n' + template % tuple(values)
+
+ENERGY_HEADER = 'Time / ps,Potential Energy / eV,Kinetic Energy / eV,Total Energy / eV\n'
+
+def _open(path,name,t):
     outdir = os.path.join(path, 'outdir')
     os.makedirs(outdir, exist_ok=True)
-    output_file = os.path.join(outdir, 'output.xyz')
-
+    output_file = os.path.join(outdir, name)
+    #a run starting at t = 0 replaces the old file, later starts append to it
     if t == 0.0:
-        if os.path.exists(output_file):
-            os.remove(output_file)
-        with open(output_file, 'x') as file:
-            pass
+        return open(output_file,'w'),True
+    return open(output_file,'a'),False
 
-    with open(output_file,'a') as file:
-        file.write(f'{atom_list.natoms}\n')
-        file.write(f'time = {t} Lattice="{cell[0]} 0 0 0 {cell[1]} 0 0 0 {cell[2]}"\n')
-        for atom in atom_list:
-            file.write(f'{atom.symbol} {atom.pos[0]} {atom.pos[1]} {atom.pos[2]} {atom.vel[0]} {atom.vel[1]} {atom.vel[2]}\n')
+def output_xyz(path,atom_list,t,cell):
+    '''
+    Writes the current state of the system to an xyz file using the extended xyz format
+    (see https://wiki.fysik.dtu.dk/ase/ase/io/formatoptions.html#extxyz)
+    Opens and closes the file on every call, use Output for a whole run.
+    Parameters:
+    - path (str): The path to the file.
+    - atom_list (class Atoms): An object representing the atoms.
+    - t (float): The current time.
+    - cell (numpy ndarray): The cell dimensions or (3,3) lattice vectors.
+    '''
+    file,_ = _open(path,'output.xyz',t)
+    with file:
+        file.write(format_xyz(atom_list,t,cell))
 
 def output_energy(path,atom_list,t):
     '''
     Writes the energy of the system to a file.
+    Opens and closes the file on every call, use Output for a whole run.
     Parameters:
     - atom_list (class Atoms): An object representing the atoms.
     - t (float): The current time.
     '''
-    outdir = os.path.join(path, 'outdir')
-    os.makedirs(outdir, exist_ok=True)
-    output_file = os.path.join(outdir, 'energy.txt')
-
-
-    if t == 0.0:
-        if os.path.exists(output_file):
-            os.remove(output_file)
-        with open(output_file, 'x') as file:
-            file.write('Time / ps,Potential Energy / eV,Kinetic Energy / eV,Total Energy / eV\n')
-            pass
-
-    with open(output_file,'a') as file:
-        potential_energy = atom_list.get_potential()
-        kinetic_energy = atom_list.get_kinetic()
-        total = atom_list.get_total()
-        file.write(f'{t},{potential_energy},{kinetic_energy},{total}\n')
+    file,new = _open(path,'energy.txt',t)
+    with file:
+        if new:
+            file.write(ENERGY_HEADER)
+        file.write(format_energy(atom_list,t))
 
 
 def output_debug(path,atom_list,t):
     '''
     Writes the current state of the system to a verbose file.
+    Opens and closes the file on every call, use Output for a whole run.
     Parameters:
     - atom_list (class Atoms): An object representing the atoms.
     - t (float): The current time.
     '''
-    outdir = os.path.join(path, 'outdir')
-    os.makedirs(outdir, exist_ok=True)
-    output_file = os.path.join(outdir, 'debug.txt')
+    file,_ = _open(path,'debug.txt',t)
+    with file:
+        file.write(format_debug(atom_list,t))
+
+class Output:
+    '''
+    Output manager for a whole run. The trajectory, energy and debug files are opened
+    once with large write buffers, and each output has its own stride (in steps, 0 turns
+    it off; with a time-based schedule the strides count multiples of dt of simulated time).
+    Frames are formatted with a per-system row template instead of per-atom f-strings.
+    Attributes:
+    - path (str): Output directory, files are written to path/outdir.
+    - traj_stride (int): Steps between trajectory frames (output.xyz, or output.traj in binary format).
+    - traj_format (str): 'xyz' for extended xyz text, 'binary' for the memory-mappable
+      format of trajectory.py.
+    - energy_stride (int): Steps between energy lines (energy.txt).
+    - debug_stride (int): Steps between debug frames (debug.txt).
+    - console_stride (int): Steps between console energy reports.
+    - schedule (class Schedule): Decides when each output is due, counts steps by default.
+    - bytes_written (int): Number of bytes (characters for text files) written so far.
+    '''
+    def __init__(self,path,append=False,traj_stride=1,energy_stride=1,debug_stride=1,console_stride=1,buffer_size=1<<20,
+                 traj_format='xyz',traj_precision='float32',schedule=None):
+        if traj_format not in ('xyz','binary'):
+            raise ValueError(f'unknown trajectory format: {traj_format}')
+        self.path = path
+        self.traj_stride = traj_stride
+        self.traj_format = traj_format
+        self.traj_precision = traj_precision
+        self.energy_stride = energy_stride
+        self.debug_stride = debug_stride
+        self.console_stride = console_stride
+        self.schedule = schedule if schedule is not None else Schedule()
+        outdir = os.path.join(path,'outdir')
+        os.makedirs(outdir,exist_ok=True)
+        mode = 'a' if append else 'w'
+        self._append = append
+        self._buffer_size = buffer_size
+        self._binary = None
+        self._files = {}
+        text_traj = traj_stride if traj_format == 'xyz' else 0
+        for name,stride in (('output.xyz',text_traj),('energy.txt',energy_stride),('debug.txt',debug_stride)):
+            if stride:
+                self._files[name] = open(os.path.join(outdir,name),mode,buffering=buffer_size)
+        if energy_stride and not append:
+            self._files['energy.txt'].write(ENERGY_HEADER)
+        self._symbols = None
+        self._nframes = None
+        self.bytes_written = 0
 
+    def _templates(self,Atoms):
+        #the row templates only change when the symbols do
+        if self._symbols is None or not np.array_equal(self._symbols,Atoms.symbols):
+            self._symbols = Atoms.symbols.copy()
+            self._xyz = _row_template(Atoms.symbols,'{} {} {} {} {} {}')
+            self._debug = _row_template(Atoms.symbols,'{} {} {}, force = [{} {} {}], velocity = [{} {} {}], accel = [{} {} {}]')
 
-    if t == 0.0:
-        if os.path.exists(output_file):
-            os.remove(output_file)
-        with open(output_file, 'x') as file:
-            pass
-
-    with open(output_file,'a') as file:
-        file.write(f'{atom_list.natoms}\n')
-        file.write(f'time = {t}\n')
-        for atom in atom_list:
-            file.write(f'{atom.symbol} {atom.pos[0]} {atom.pos[1]} {atom.pos[2]}, force = {atom.force}, velocity = {atom.vel}, accel = {atom.accel}\n')
\ No newline at end of file
+    def write(self,Atoms,step,t,cell):
+        '''
+        Writes every output that is due at this step (see Schedule).
+        Parameters:
+        - Atoms (class Atoms): An object representing the atoms.
+        - step (int): Step number.
+        - t (float): The current time.
+        - cell (numpy ndarray): The cell dimensions or (3,3) lattice vectors.
+        '''
+        due = self.schedule.due
+        if due('traj',self.traj_stride,step,t):
+            if self.traj_format == 'binary':
+                if self._binary is None:
+                    #the binary header needs the atoms, so the file is opened on the first frame
+                    self._binary = TrajectoryWriter(os.path.join(self.path,'outdir','output.traj'),Atoms,
+                                                    precision=self.traj_precision,append=self._append,
+                                                    buffer_size=self._buffer_size,nframes=self._nframes)
+                self._binary.write(Atoms,t,cell)
+                self.bytes_written += self._binary.dtype.itemsize
+            else:
+                self._templates(Atoms)
+                self.bytes_written += self._files['output.xyz'].write(format_xyz(Atoms,t,cell,self._xyz))
+        if due('energy',self.energy_stride,step,t):
+            self.bytes_written += self._files['energy.txt'].write(format_energy(Atoms,t))
+        if due('debug',self.debug_stride,step,t):
+            self._templates(Atoms)
+            self.bytes_written += self._files['debug.txt'].write(format_debug(Atoms,t,self._debug))
+        if due('console',self.console_stride,step,t):
+            print(f'Time: {t} ps, Potential Energy: {Atoms.get_potential()}, Kinetic Energy: {Atoms.get_kinetic()}, Total Energy: {Atoms.get_total()}')
+
+    def flush(self):
+        for file in self._files.values():
+            file.flush()
+        if self._binary is not None:
+            self._binary.flush()
+
+    def sizes(self):
+        '''
+        Flushes the outputs and returns how much has been written to each file, so a
+        restart can cut off whatever was written after a checkpoint.
+        Returns:
+        - sizes (dict): Size in bytes of each text file, and the number of binary trajectory frames.
+        '''
+        self.flush()
+        sizes = {name:os.path.getsize(file.name) for name,file in self._files.items()}
+        if self._binary is not None:
+            sizes['output.traj'] = self._binary.nframes
+        elif self._nframes is not None:
+            sizes['output.traj'] = self._nframes
+        return sizes
+
+    def truncate(self,sizes):
+        '''
+        Cuts the files back to the sizes returned by sizes().
+        '''
+        self.flush()
+        for name,file in self._files.items():
+            if name in sizes:
+                file.truncate(int(sizes[name]))
+        if 'output.traj' in sizes:
+            #applied when the binary trajectory is opened on the first frame
+            self._nframes = int(sizes['output.traj'])
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files = {}
+        if self._binary is not None:
+            self._binary.close()
+            self._binary = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()